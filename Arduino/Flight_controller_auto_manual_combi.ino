@@ -44,6 +44,13 @@ boolean switch_manual = false; // true if the right lever has been in the lower
 //Declaring global variables
 ///////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 int currentChannel = 0; // by Emanuel, not part of the original code
+byte frame[7]; // setpoint frame being received (see the protocol description at readSerial()), not part of the original code
+byte frameIndex = 0; // number of bytes of the frame received so far, 0 if no frame is being received
+byte lastSequence = 0; // sequence number of the last valid frame
+boolean sequenceReceived = false; // true after the first valid frame, lastSequence is set
+unsigned int lostFrames = 0; // frames missing between the valid frames since the last status record (sequence numbers skipped)
+unsigned int repeatedFrames = 0; // valid frames since the last status record that didn't follow the last one (repeated or older sequence number)
+unsigned int frameErrors = 0; // frames with wrong checksum since the last status record
 int loop_counter = 0;
 byte last_channel_1, last_channel_2, last_channel_3, last_channel_4;
 byte eeprom_data[36];
@@ -366,7 +373,13 @@ void loop(){
     Serial.write((esc_3-1000) / 4); 
     Serial.write((esc_4-1000) / 4);
     Serial.write(battery_voltage / 6);
-    Serial.write(micros() - loop_timer / 16);
+    Serial.write((micros() - loop_timer) / 16);
+    Serial.write(min(lostFrames, 255));
+    Serial.write(min(repeatedFrames, 255));
+    Serial.write(min(frameErrors, 255));
+    lostFrames = 0;
+    repeatedFrames = 0;
+    frameErrors = 0;
     loop_counter = 0;
   }
   loop_counter++;
@@ -473,6 +486,10 @@ ISR(PCINT0_vect){
  * 
  * Protocol:
  * During operation, the RasPi sends the channel identifier (0xFC: 1, 0xFD: 2, 0xFE: 3, 0xFF: 4) and then, as next byte, the value for that channel as a number between 0 and 200, where 0 corresponds to a 1000us PWM-pulse, and 200 to a 2000us pulse. This happens repeatedly (next byte is a channel identifier again and so on).
+ * 
+ * Alternatively, the RasPi sends all four channels in one setpoint frame of 7 bytes:
+ * 0xF8, sequence number (0..199), channel 1, channel 2, channel 3, channel 4 (values 0..200 like above), checksum
+ * The checksum is the sum of the 5 bytes after 0xF8 modulo 200. All bytes after 0xF8 are <= 200, so a frame can't be mistaken for the command bytes below. The four channels are only applied (all together) if the checksum is correct. The sequence numbers of the valid frames show how many frames were lost in between (skipped numbers) or repeated, these counts and the number of frames with a wrong checksum are sent with the status records.
  * todo: Make slightly more efficient if necessary (don't read the receiver channels 3 and 4 when in automatic mode and don't store the channel values separately for serial and receiver)?
  * 
  * When the Arduino is done with setup and waits for receiver signals and the RasPi to be ready, it sends "Ready!" on the serial. Then, the RasPi should set the initial channel values and send 0xF9 when done and ready too, see below. After that and when receiver signals are there, the Arduino sends "Starting" and enters the main loop.
@@ -497,7 +514,36 @@ ISR(PCINT0_vect){
 void readSerial() {
     while(Serial.available() > 0) {
         int number = Serial.read();
-        if(number >= 0xFC && number <= 0xFF) {
+        if(frameIndex > 0 && number <= 200) {
+            frame[frameIndex] = number;
+            frameIndex++;
+            if(frameIndex == 7) {
+                frameIndex = 0;
+                int checksum = 0;
+                for(int i = 1; i < 6; i++) checksum += frame[i];
+                if(checksum % 200 == frame[6]) {
+                    if(sequenceReceived) {
+                        byte skipped = (frame[1] + 199 - lastSequence) % 200; // 0 if the frame follows the last one
+                        if(skipped < 100) lostFrames += skipped;
+                        else repeatedFrames++;
+                    }
+                    sequenceReceived = true;
+                    lastSequence = frame[1];
+                    serial_input_channel_1 = 1000 + 5 * frame[2];
+                    serial_input_channel_2 = 1000 + 5 * frame[3];
+                    serial_input_channel_3 = 1000 + 5 * frame[4];
+                    serial_input_channel_4 = 1000 + 5 * frame[5];
+                }else{
+                    frameErrors++;
+                }
+            }
+            continue;
+        }
+        frameIndex = 0;
+        if(number == 0xF8) {
+            frameIndex = 1;
+            currentChannel = 0;
+        }else if(number >= 0xFC && number <= 0xFF) {
             currentChannel = number - 0xFB;
         }else if(number <= 200 && number >= 0 && currentChannel > 0) {
             int value = 1000 + 5 * number;
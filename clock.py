@@ -0,0 +1,54 @@
+"""
+Time source of the flight software. All modules that need the current time or have to wait use now() and sleep() of
+this module instead of the time module, so that the whole software can be run on a virtual clock (e.g. by the
+simulator, which then runs faster than real time). Defaults to the monotonic system clock.
+"""
+import time
+
+_now = time.monotonic
+_sleep = time.sleep
+
+
+def now():
+    """
+    :return: The current time in seconds. Only differences between two values are meaningful.
+    :rtype: float
+    """
+    return _now()
+
+
+def sleep(seconds):
+    """
+    Blocks the caller for the given time (on the current time source).
+    :param seconds: Time to wait in seconds
+    :return: None
+    """
+    _sleep(seconds)
+
+
+def is_system_clock():
+    """
+    :return: If the time source is the monotonic system clock (not replaced by set_source())
+    :rtype: bool
+    """
+    return _now is time.monotonic
+
+
+def set_source(now_function, sleep_function):
+    """
+    Replaces the time source, e.g. by a virtual clock. Must be called before the other modules are initialized.
+    :param now_function: Function without arguments returning the current time in seconds
+    :param sleep_function: Function taking a time in seconds, returning after that time has passed
+    :return: None
+    """
+    global _now, _sleep
+    _now = now_function
+    _sleep = sleep_function
+
+
+def reset():
+    """
+    Switches back to the monotonic system clock.
+    :return: None
+    """
+    set_source(time.monotonic, time.sleep)
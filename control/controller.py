@@ -1,47 +1,67 @@
+import math
+
 import numpy as np
 
+import clock
 import copter
 from control import flight_commands
+from control import flight_recorder
+from control.pid import PID
 
 _last_time = 0
-_last_heading = 0
-#_last_gps = (0, 0)
-_last_horiz_speed = (0, 0)
-_last_climb_rate = 0
-
-_err_sum_height, _err_sum_heading, _err_sum_horiz = 0,0,0
-_err_sum_climb_rate = 0
 
 _height_scale_factor = 10  # to scale the values to [0, 100]
 _proportional_factor_height = 1
-_integral_factor_height = 0.08
+_integral_factor_height = 4.0  # per second, 0.08 per step at 50Hz before
 _differential_factor_height = 0.8      # 1 before, reacts very strongly
 
 _heading_scale_factor = 0.1/(np.pi/2)  # to scale the values to [0, 100]
 _proportional_factor_heading = 1
-_integral_factor_heading = 0.1
+_integral_factor_heading = 5.0
 _differential_factor_heading = 0.1
 
 _horiz_scale_factor = 100/5
 _proportional_factor_horiz = 1
-_integral_factor_horiz = 0.1
+_integral_factor_horiz = 5.0
 _differential_factor_horiz = 0.1
+_horiz_limit = 50  # maximal magnitude of the tilt commands (roll, pitch) around 50
 
 _climb_rate_scale_factor = 10  # to scale the values to [0, 100] # todo: initial values
 _proportional_factor_climb_rate = 1
-_integral_factor_climb_rate = 0.1
+_integral_factor_climb_rate = 5.0
 _differential_factor_climb_rate = 0.1
 
+_height_pid, _climb_rate_pid, _heading_pid, _north_pid, _east_pid = None, None, None, None, None
+"""
+One PID per axis, created with the gains above by init(). The horizontal ones control the velocity north and east,
+their outputs are negative scaled (too fast northwards gives a positive output, i.e. tilting backwards if heading north)
+around 0 and limited together to _horiz_limit.
+"""
+
+
 def init():
     """
-    Initializes important values (position information, assuming there is no motion in the beginning) in order to
-    calculate how they change later. Must be called after the copter module has been initialized.
+    Creates the PIDs with the current gains and initializes important values (position information, assuming there is
+    no motion in the beginning) in order to calculate how they change later. Must be called after the copter module
+    has been initialized.
     :return: None
     """
-    global _last_time, _last_heading #, _last_gps
+    global _last_time, _height_pid, _climb_rate_pid, _heading_pid, _north_pid, _east_pid
+    _height_pid = PID(_proportional_factor_height, _integral_factor_height, _differential_factor_height,
+                      _height_scale_factor)
+    _climb_rate_pid = PID(_proportional_factor_climb_rate, _integral_factor_climb_rate,
+                          _differential_factor_climb_rate, _climb_rate_scale_factor)
+    _heading_pid = PID(_proportional_factor_heading, _integral_factor_heading, _differential_factor_heading,
+                       _heading_scale_factor, period=2*np.pi)
+    _north_pid, _east_pid = [PID(_proportional_factor_horiz, _integral_factor_horiz, _differential_factor_horiz,
+                                 -_horiz_scale_factor, offset=0, minimum=None, maximum=None) for axis in range(2)]
+    # So that a flight (or its replay) doesn't depend on previous ones in the same process
     _last_time = copter.get_time()
-    _last_heading = copter.get_heading() # At the moment this init function is just for the heading, the rest should be 0 anyways
-    #_last_gps = copter.get_coordinates_relative()
+    _climb_rate_pid.reset(0)
+    _heading_pid.reset(copter.get_heading())
+    _north_pid.reset(0)
+    _east_pid.reset(0)
+
 
 def control(target_height, target_climb_rate, target_heading, target_course, target_speed):
     """
@@ -50,97 +70,72 @@ def control(target_height, target_climb_rate, target_heading, target_course, tar
     Either target_height or target_climb_rate should not be None.
 
     """
-    global _last_time, _last_heading, _last_horiz_speed #, _last_gps
-    global _last_climb_rate
-    global _err_sum_height, _err_sum_heading, _err_sum_horiz
-    global _err_sum_climb_rate
-    current_time = copter.get_time()
+    global _last_time
+    start_time = clock.now()
+    state = copter.get_state()  # one consistent snapshot of all values for this iteration
+    current_time = state.time
     time_diff = current_time - _last_time
     if time_diff > 0:
-        current_height = copter.get_height()
-        current_climb_rate = copter.get_climb_rate()
         if target_height is not None:
-            height_error = target_height - current_height
-            result_throttle_pd = height_error * _proportional_factor_height\
-                                 - current_climb_rate * _differential_factor_height
-            result_throttle = result_throttle_pd + _err_sum_height
-            result_throttle = 50 + result_throttle * _height_scale_factor
-            if result_throttle >= 100:
-                result_throttle = 100
-                _err_sum_height = (50 / _height_scale_factor) - result_throttle_pd
-            elif result_throttle <= 0:
-                result_throttle = 0
-                _err_sum_height = (-50 / _height_scale_factor) - result_throttle_pd
-            print("Target height mode:")
-            print("P: " + str(height_error * _proportional_factor_height * _height_scale_factor)+ "\tD: " + str(-current_climb_rate*_differential_factor_height * _height_scale_factor)+ "\tI: " + str(_err_sum_height * _height_scale_factor))
-            _err_sum_height += height_error * _integral_factor_height
+            result_throttle = _height_pid.update(target_height, state.height, time_diff, rate=state.climb_rate)
+            throttle_pid = _height_pid
         elif target_climb_rate is not None:
-            vert_acc = (current_climb_rate - _last_climb_rate) / time_diff
-            climb_rate_error = target_climb_rate - current_climb_rate
-            result_throttle_pd = climb_rate_error * _proportional_factor_climb_rate\
-                                 - vert_acc * _differential_factor_climb_rate
-            result_throttle = result_throttle_pd + _err_sum_climb_rate
-            result_throttle = 50 + result_throttle * _climb_rate_scale_factor
-            if result_throttle >= 100:
-                result_throttle = 100
-                _err_sum_climb_rate = (50 / _climb_rate_scale_factor) - result_throttle_pd
-            elif result_throttle <= 0:
-                result_throttle = 0
-                _err_sum_climb_rate = (-50 / _climb_rate_scale_factor) - result_throttle_pd
-            print("Target climb rate mode:")
-            print("P: " + str(climb_rate_error * _proportional_factor_climb_rate * _climb_rate_scale_factor)+ "\tD: " + str(-vert_acc*_differential_factor_climb_rate * _climb_rate_scale_factor)+ "\tI: " + str(_err_sum_climb_rate * _climb_rate_scale_factor))
-            _err_sum_climb_rate += climb_rate_error * _integral_factor_height
-
-
-        current_heading = copter.get_heading()
-        heading_rate = (current_heading - _last_heading)
-        if np.absolute(heading_rate) > np.pi:
-            heading_rate -= np.sign(heading_rate) * 2 * np.pi
-        heading_rate /= time_diff
-        heading_error = target_heading - current_heading
-        if np.absolute(heading_error) > np.pi:
-            heading_error -= np.sign(heading_error) * 2 * np.pi
-        result_heading_pd = heading_error * _proportional_factor_heading\
-                            - heading_rate * _differential_factor_heading
-        result_heading = result_heading_pd + _err_sum_heading
-        result_heading = 50 + result_heading * _heading_scale_factor
-        if result_heading >= 100:
-            result_heading = 100
-            _err_sum_heading = (50 / _height_scale_factor) - result_heading_pd
-        elif result_heading <= 0:
-            result_heading = 0
-            _err_sum_heading = (-50 / _height_scale_factor) - result_heading_pd
-        _err_sum_heading += heading_error * _integral_factor_heading
-
-        target_horiz_speed = np.multiply( (np.cos(target_course), np.sin(target_course)) , target_speed)
-        current_horiz_speed = np.multiply((np.cos(copter.get_track()), np.sin(copter.get_track())), copter.get_speed())
-        horiz_speed_diff = np.subtract(current_horiz_speed, _last_horiz_speed)
-        horiz_acc = np.divide(horiz_speed_diff, time_diff)
-        horiz_speed_error = np.subtract(current_horiz_speed, target_horiz_speed)
-        result_horiz_speed = horiz_speed_error * _proportional_factor_horiz\
-                            - horiz_acc * _differential_factor_horiz\
-                            + _err_sum_horiz
-        result_horiz_speed = np.multiply(result_horiz_speed, _horiz_scale_factor)
-        horiz_speed_mag = np.sqrt(np.sum(np.square(result_horiz_speed)))
-        if horiz_speed_mag >= 50:
-            result_horiz_speed = np.multiply(result_horiz_speed, 50 / horiz_speed_mag)
+            result_throttle = _climb_rate_pid.update(target_climb_rate, state.climb_rate, time_diff)
+            throttle_pid = _climb_rate_pid
+        if target_height is not None or target_climb_rate is None:
+            _climb_rate_pid.observe(state.climb_rate)
+
+        current_heading = state.heading
+        result_heading = _heading_pid.update(target_heading, current_heading, time_diff)
+
+        # The velocity north and east, from the track (angle from north) and the speed
+        cos_track, sin_track = math.cos(state.track), math.sin(state.track)
+        result_north = _north_pid.update(math.cos(target_course) * target_speed, cos_track * state.speed, time_diff,
+                                         integrate=False)
+        result_east = _east_pid.update(math.sin(target_course) * target_speed, sin_track * state.speed, time_diff,
+                                       integrate=False)
+        horiz_magnitude = math.hypot(result_north, result_east)
+        if horiz_magnitude >= _horiz_limit:
+            result_north *= _horiz_limit / horiz_magnitude
+            result_east *= _horiz_limit / horiz_magnitude
         else:
-            _err_sum_horiz = np.add(_err_sum_horiz, np.multiply(result_horiz_speed, _integral_factor_horiz))
-
-        result_pitch = result_horiz_speed[0] * np.cos(current_heading) + result_horiz_speed[1] * np.sin(current_heading)
-        result_roll = result_horiz_speed[0] * np.sin(current_heading) + result_horiz_speed[1] * np.cos(current_heading)
-        result_pitch += 50
-        result_roll += 50
-
-        print('roll: ' + str(result_roll)+ ' pitch: ' + str(result_pitch)+' throttle: ' + str(result_throttle) + ' yaw: ' + str(result_heading))
-        flight_commands.throttle(result_throttle)
-#        result_heading = 50
-        flight_commands.yaw(result_heading)
-        flight_commands.pitch(result_pitch)
-        flight_commands.roll(result_roll)
-
-        _last_horiz_speed = current_horiz_speed
-        _last_heading = current_heading
-        _last_climb_rate = current_climb_rate
-        #_last_gps = copter.get_coordinates_relative()
+            _north_pid.integrate()
+            _east_pid.integrate()
+
+        # Into the frame of the copter: forward (pitch) and right (roll)
+        cos_heading, sin_heading = math.cos(current_heading), math.sin(current_heading)
+        result_pitch = 50 + result_north * cos_heading + result_east * sin_heading
+        result_roll = 50 - result_north * sin_heading + result_east * cos_heading
+
+        flight_commands.send_setpoints(result_roll, result_pitch, result_throttle, result_heading)
+
+        flight_recorder.record(current_time, time_diff, clock.now() - start_time, state.height, state.climb_rate,
+                               current_heading, state.speed, state.track, state.latitude, state.longitude,
+                               state.east, state.north, target_height, target_climb_rate, target_heading, target_course,
+                               target_speed, throttle_pid.p_term, throttle_pid.i_term, throttle_pid.d_term,
+                               _heading_pid.p_term, _heading_pid.i_term, _heading_pid.d_term,
+                               result_roll, result_pitch, result_throttle, result_heading)
+
         _last_time = current_time
+
+
+if __name__ == "__main__":
+    # Microbenchmark of a control step (from the repository root: python -m control.controller)
+    import time
+    from simulation.replay import CapturingSerial
+
+    flight_commands.init(CapturingSerial())
+    copter.set_values(0, 1.0, 0.1, 0.5, 1.0, 0.3, (0.8, 1.0), (3.0, 4.0))
+    init()
+    runs = 20000
+    start = time.perf_counter()
+    for i in range(1, runs + 1):
+        copter.set_values(i * 0.02, 1.0, 0.1, 0.5, 1.0, 0.3, (0.8, 1.0), (3.0, 4.0))
+    set_values_duration = time.perf_counter() - start
+    start = time.perf_counter()
+    for i in range(runs + 1, 2 * runs + 1):
+        copter.set_values(i * 0.02, 1.0, 0.1, 0.5, 1.0, 0.3, (0.8, 1.0), (3.0, 4.0))
+        control(2.0, None, 0.7, 0.2, 1.5)
+    duration = (time.perf_counter() - start - set_values_duration) / runs
+    print("control(): %.1f us, %.0f calls per second (including send_setpoints() and the flight recorder)" % (
+        duration * 1e6, 1 / duration))
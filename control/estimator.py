@@ -0,0 +1,229 @@
+"""
+Kalman filters estimating the state of the copter from the sensor readings: VerticalFilter (height, climb rate and
+bias of the barometer) and HorizontalFilter (position and velocity east and north). The measurements are processed at
+the time they were taken, each sensor with its own rate. All matrices are preallocated, every measurement is processed
+as scalar update, so no matrix has to be inverted.
+
+Microbenchmark (from the repository root):
+    python -m control.estimator
+"""
+import numpy as np
+
+
+class _KalmanFilter(object):
+    """
+    Linear Kalman filter with a transition matrix and process noise depending on the time step (set by
+    _set_transition()) and scalar measurements.
+    """
+
+    def __init__(self, size, initial_variances):
+        self.x = np.zeros(size)
+        """
+        State estimate
+        """
+        self.P = np.diag(np.asarray(initial_variances, dtype=float))
+        """
+        Covariance of the state estimate
+        """
+        self.time = None
+        """
+        Time of the state estimate in seconds, None before the first measurement
+        """
+        self._initial_variances = self.P.copy()
+        self._F = np.eye(size)
+        self._Q = np.zeros((size, size))
+        self._x = np.zeros(size)
+        self._FP = np.zeros((size, size))
+        self._PH = np.zeros(size)
+        self._K = np.zeros(size)
+
+    def _set_transition(self, dt):
+        raise NotImplementedError()
+
+    def reset(self, x=None):
+        """
+        Sets the state (zero if None) with the initial covariance, the next measurement sets the time.
+        :return: None
+        """
+        self.x[:] = 0 if x is None else x
+        self.P[:] = self._initial_variances
+        self.time = None
+
+    def predict(self, time):
+        """
+        Propagates the estimate to the given time. Times before the time of the estimate are ignored (the estimate is
+        not propagated backwards).
+        :param time: Time in seconds
+        :return: None
+        """
+        if self.time is None:
+            self.time = time
+            return
+        dt = time - self.time
+        if dt <= 0:
+            return
+        self._set_transition(dt)
+        np.dot(self._F, self.x, out=self._x)
+        self.x[:] = self._x
+        np.dot(self._F, self.P, out=self._FP)
+        np.dot(self._FP, self._F.T, out=self.P)
+        self.P += self._Q
+        self.time = time
+
+    def _predicted_state(self, time):
+        # State propagated to the given time without changing the estimate
+        if time is None or self.time is None or time <= self.time:
+            return self.x
+        self._set_transition(time - self.time)
+        return self._F.dot(self.x)
+
+    def _update(self, H, z, variance):
+        # Scalar measurement z = H x + noise
+        np.dot(self.P, H, out=self._PH)
+        innovation_variance = H.dot(self._PH) + variance
+        np.divide(self._PH, innovation_variance, out=self._K)
+        self.x += self._K * (z - H.dot(self.x))
+        self.P -= np.outer(self._K, self._PH)
+
+
+class VerticalFilter(_KalmanFilter):
+    """
+    State: height, climb rate, bias of the barometer (m, m/s, m). The barometer measures height + bias, the bias is
+    observable by measurements of the true height (e.g. on the ground).
+    """
+
+    def __init__(self, acceleration_noise=2.0, bias_drift=0.01, baro_noise=0.3):
+        """
+        :param acceleration_noise: Standard deviation of the (not measured) vertical acceleration in m/s^2
+        :param bias_drift: Standard deviation of the change of the barometer bias in m per square root of a second
+        :param baro_noise: Standard deviation of a barometer reading in m
+        """
+        super().__init__(3, (1.0, 1.0, 0.01))
+        self._acceleration_variance = acceleration_noise ** 2
+        self._bias_variance = bias_drift ** 2
+        self._baro_variance = baro_noise ** 2
+        self._H_baro = np.array([1.0, 0.0, 1.0])
+        self._H_height = np.array([1.0, 0.0, 0.0])
+
+    def _set_transition(self, dt):
+        self._F[0, 1] = dt
+        q = self._acceleration_variance
+        self._Q[0, 0] = q * dt ** 3 / 3
+        self._Q[0, 1] = self._Q[1, 0] = q * dt ** 2 / 2
+        self._Q[1, 1] = q * dt
+        self._Q[2, 2] = self._bias_variance * dt
+
+    def update_baro(self, time, altitude):
+        """
+        :param time: Time the reading was taken in seconds
+        :param altitude: Altitude measured by the barometer relative to the ground in m
+        :return: None
+        """
+        if self.time is None:
+            self.x[0] = altitude - self.x[2]
+        self.predict(time)
+        self._update(self._H_baro, altitude, self._baro_variance)
+
+    def update_height(self, time, height, variance=0.01):
+        """
+        :param time: Time of the measurement in seconds
+        :param height: True height (e.g. 0 on the ground) in m
+        :param variance: Variance of the measurement in m^2
+        :return: None
+        """
+        self.predict(time)
+        self._update(self._H_height, height, variance)
+
+    def get_values(self, time=None):
+        """
+        :param time: Time in seconds to extrapolate the estimate to, None for the time of the estimate (of the last
+        measurement)
+        :return: Tuple (height, climb rate, bias of the barometer) (m, m/s, m)
+        """
+        x = self._predicted_state(time)
+        return x[0], x[1], x[2]
+
+
+class HorizontalFilter(_KalmanFilter):
+    """
+    State: position east, north, velocity east, north (m, m, m/s, m/s) with constant velocity between the measurements.
+    """
+
+    def __init__(self, acceleration_noise=1.0, position_noise=2.5, velocity_noise=0.3):
+        """
+        :param acceleration_noise: Standard deviation of the (not measured) horizontal acceleration in m/s^2
+        :param position_noise: Standard deviation of a gps position in m
+        :param velocity_noise: Standard deviation of a gps velocity in m/s
+        """
+        super().__init__(4, (100.0, 100.0, 1.0, 1.0))
+        self._acceleration_variance = acceleration_noise ** 2
+        self._position_variance = position_noise ** 2
+        self._velocity_variance = velocity_noise ** 2
+        self._H = np.eye(4)
+
+    def _set_transition(self, dt):
+        self._F[0, 2] = self._F[1, 3] = dt
+        q = self._acceleration_variance
+        for position, velocity in ((0, 2), (1, 3)):
+            self._Q[position, position] = q * dt ** 3 / 3
+            self._Q[position, velocity] = self._Q[velocity, position] = q * dt ** 2 / 2
+            self._Q[velocity, velocity] = q * dt
+
+    def update_position(self, time, east, north):
+        """
+        :param time: Time of the fix in seconds
+        :param east: Position east of the starting point in m
+        :param north: Position north of the starting point in m
+        :return: None
+        """
+        if self.time is None:
+            self.x[0], self.x[1] = east, north
+        self.predict(time)
+        self._update(self._H[0], east, self._position_variance)
+        self._update(self._H[1], north, self._position_variance)
+
+    def update_velocity(self, time, speed, track):
+        """
+        :param time: Time of the fix in seconds
+        :param speed: Speed over ground in m/s
+        :param track: True track (traveling angle from north) in radian
+        :return: None
+        """
+        self.predict(time)
+        self._update(self._H[2], speed * np.sin(track), self._velocity_variance)
+        self._update(self._H[3], speed * np.cos(track), self._velocity_variance)
+
+    def get_values(self, time=None):
+        """
+        :param time: Time in seconds to extrapolate the estimate to, None for the time of the estimate (of the last
+        measurement)
+        :return: Tuple (east, north, speed over ground, true track) (m, m, m/s, radian within [0, 2pi))
+        """
+        east, north, velocity_east, velocity_north = self._predicted_state(time)
+        return east, north, np.hypot(velocity_east, velocity_north), np.arctan2(velocity_east, velocity_north) % (2*np.pi)
+
+
+if __name__ == "__main__":
+    import time
+
+    runs = 20000
+    vertical, horizontal = VerticalFilter(), HorizontalFilter()
+    start_time = time.perf_counter()
+    for i in range(runs):
+        vertical.update_baro(i * 0.02, 1.0)
+    vertical_duration = (time.perf_counter() - start_time) / runs
+    start_time = time.perf_counter()
+    for i in range(runs):
+        horizontal.update_position(i * 0.2, 1.0, 2.0)
+        horizontal.update_velocity(i * 0.2, 1.0, 0.5)
+    horizontal_duration = (time.perf_counter() - start_time) / runs
+    start_time = time.perf_counter()
+    for i in range(runs):
+        vertical.predict(runs * 0.02 + i * 0.02)
+        horizontal.predict(runs * 0.2 + i * 0.02)
+    predict_duration = (time.perf_counter() - start_time) / runs
+    print("VerticalFilter.update_baro(): %.1f us" % (vertical_duration * 1e6))
+    print("HorizontalFilter.update_position() + update_velocity(): %.1f us" % (horizontal_duration * 1e6))
+    print("Prediction of both filters: %.1f us" % (predict_duration * 1e6))
+    print("All of them once per control period: %.2f %% of 20 ms" % (
+        (vertical_duration + horizontal_duration + predict_duration) / 0.02 * 100))
@@ -0,0 +1,138 @@
+"""
+asyncio counterpart of scheduler.Scheduler, used by main.main_run_async(): every rate group is a periodic task and
+every input stream (serial ports, the heartbeat socket) a reader task of one event loop, so there is one thread instead
+of a thread per device. The tasks keep the timing statistics of scheduler.Task. Like the threads they replace, the
+tasks go on if a call raises an exception: it is printed and counted (Task.errors), and passed to on_error.
+
+The event loop runs on the clock module: with the system clock it waits in select() like any event loop, on a virtual
+clock (e.g. the simulator's) it advances that clock instead, so a flight with main_run_async() can be simulated too.
+"""
+import asyncio
+import inspect
+import selectors
+
+import clock
+
+
+class _ClockSelector(selectors.DefaultSelector):
+    # Lets the event loop wait on the clock module: on a virtual clock, the time the loop would wait for is passed on
+    # to clock.sleep() instead of blocking in select()
+    def select(self, timeout=None):
+        if clock.is_system_clock():
+            return super().select(timeout)
+        events = super().select(0)
+        if not events and timeout is not None and timeout > 0:
+            clock.sleep(timeout)
+        return events
+
+
+class ClockEventLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop whose time is clock.now(), see the module description.
+    """
+
+    def __init__(self):
+        super().__init__(_ClockSelector())
+
+    def time(self):
+        return clock.now()
+
+
+def new_event_loop():
+    """
+    :return: A new event loop on the clock module, to be closed after use
+    :rtype: ClockEventLoop
+    """
+    return ClockEventLoop()
+
+
+def _failed(task, ex, on_error):
+    task.errors += 1
+    print("Exception in task " + task.name)
+    print(ex)
+    if on_error is not None:
+        on_error(ex)
+
+
+async def run_periodic(task, keep_running, executor=None, on_error=None):
+    """
+    Calls the function of the task on its fixed time grid until keep_running returns False, like Scheduler.run() does
+    for all tasks together.
+    :param task: scheduler.Task. Its function may return an awaitable (e.g. be a coroutine function that waits for a
+    read in an executor), which is awaited before the next call.
+    :param keep_running: Function without arguments returning a boolean, checked before every call
+    :param executor: concurrent.futures.Executor to call the function in (for functions that block, e.g. reading an
+    I2C sensor), None to call it in the event loop
+    :param on_error: Function called with the exception if a call raises one, None to only print it
+    :return: None
+    """
+    loop = asyncio.get_running_loop()
+    task.next_time = clock.now()
+    while keep_running():
+        delay = task.next_time - clock.now()
+        if delay > 0:
+            await asyncio.sleep(delay)
+            if not keep_running():
+                break
+        start = clock.now()
+        task.max_latency = max(task.max_latency, start - task.next_time)
+        try:
+            if executor is None:
+                result = task.function()
+                if inspect.isawaitable(result):
+                    await result
+            else:
+                await loop.run_in_executor(executor, task.function)
+        except Exception as ex:
+            _failed(task, ex, on_error)
+        task.record(start, clock.now())
+
+
+async def run_reader(task, port, keep_running, on_error=None):
+    """
+    Calls the function of the task as soon as the port has data to read, at the latest one period (of the task) after
+    the previous call, until keep_running returns False. The function must read without waiting, e.g. only what
+    in_waiting says. Ports without a file descriptor (like the simulated devices) are polled once per period.
+    :param task: scheduler.Task
+    :param port: Object with fileno() (e.g. serial.Serial or a socket) or without
+    :param keep_running: Function without arguments returning a boolean, checked before every call
+    :param on_error: Function called with the exception if a call raises one, None to only print it
+    :return: None
+    """
+    loop = asyncio.get_running_loop()
+    data_ready = asyncio.Event()
+    try:
+        file_descriptor = port.fileno()
+    except (AttributeError, OSError, ValueError):  # io.UnsupportedOperation is an OSError and a ValueError
+        file_descriptor = None
+    if file_descriptor is not None:
+        loop.add_reader(file_descriptor, data_ready.set)
+    try:
+        while keep_running():
+            try:
+                await asyncio.wait_for(data_ready.wait(), task.period)
+            except asyncio.TimeoutError:
+                pass
+            if not keep_running():
+                break
+            data_ready.clear()
+            start = clock.now()
+            task.next_time = start  # readers are not on a time grid, only overruns of the period are counted
+            try:
+                task.function()
+            except Exception as ex:
+                _failed(task, ex, on_error)
+            task.record(start, clock.now())
+    finally:
+        if file_descriptor is not None:
+            loop.remove_reader(file_descriptor)
+
+
+def report(tasks):
+    """
+    Prints the timing statistics of the tasks.
+    :param tasks: List of scheduler.Task
+    :return: None
+    """
+    for task in tasks:
+        print("Event loop: " + task.report())
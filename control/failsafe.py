@@ -1,70 +1,265 @@
-import os
-import time
+"""
+Monitors the connection to the ground station with UDP heartbeats: a thread sends a numbered heartbeat to _ip every
+_interval seconds and receives the echoes of the ground station, keeping statistics of round trip time, jitter and loss.
+The connection is considered lost if no echo arrived for _loss_threshold seconds. Instead of the thread, poll() can
+be called whenever the socket has data and at least every _interval seconds (see main.main_run_async()).
+
+The ground station has to echo the heartbeats, e.g. with (from the repository root, on the ground station):
+    python -m control.failsafe --echo
+"""
+import socket
+import struct
 import threading
+import time
+
+import numpy as np
 
 _ip = "192.168.159.5"
 _ip = "10.42.0.1"
 #_ip = "10.42.0.2"
+_port = 14560
+_interval = 0.1  # s between two heartbeats
+_loss_threshold = 0.5  # s without echo after which the connection is considered lost
 
+_heartbeat = struct.Struct('<4sId')  # magic, sequence number, send time
+_magic = b'HBT1'
+_window = 64  # Number of the latest heartbeats the loss is calculated for
+
+_socket = None
+_sequence = 0
+_send_times = np.full(_window, np.nan)
+"""
+Send times of the latest heartbeats by sequence number % _window, NaN once the echo was received
+"""
+_next_send_time = 0  # only used by poll()
+_sent, _received = 0, 0
 _last_connected_time = 0
-_check_connection_thread, _time_lock, _run_flag_lock = None, None, None
+_rtt, _mean_rtt, _jitter = None, None, 0
+"""
+Round trip time of the last echo, its exponential average and the jitter (mean deviation of consecutive round trip
+times like in RFC 3550) in seconds
+"""
+_check_connection_thread, _time_lock, _run_flag_lock = None, threading.Lock(), threading.Lock()
 _loop_run_flag = False
 
-def init():
+
+def init(ip=None, port=None, interval=None, loss_threshold=None, start_thread=True):
     """
-    Starts an infinite loop pinging _ip every 0.3 seconds in a new thread. The time of the last successful is saved.
+    Opens the socket and starts an infinite loop sending the heartbeats and receiving their echoes in a new thread, or
+    poll() is called instead. The parameters that are not given keep their defaults (_ip, _port, _interval,
+    _loss_threshold).
+    :param ip: Address of the ground station
+    :param port: UDP port the ground station echoes on
+    :param interval: Time between two heartbeats in seconds
+    :param loss_threshold: Time in seconds without echo after which the connection is considered lost
+    :param start_thread: Start the thread, otherwise poll() has to be called
     :return: None
     """
-    global _last_connected_time, _time_lock, _check_connection_thread, _loop_run_flag, _run_flag_lock
-    if _loop_run_flag:
-        print("gps.init() called more than once.")
+    global _ip, _port, _interval, _loss_threshold, _socket, _sequence, _sent, _received, _last_connected_time
+    global _rtt, _mean_rtt, _jitter, _check_connection_thread, _loop_run_flag, _next_send_time
+    if _socket is not None:
+        print("failsafe.init() called more than once.")
         return
-    _last_connected_time = time.time()
-    _time_lock = threading.Lock()
-    _run_flag_lock = threading.Lock()
-    _check_connection_thread = threading.Thread(target=_check_connection_loop)
-    _loop_run_flag = True
-    _check_connection_thread.start()
+    _ip = ip if ip is not None else _ip
+    _port = port if port is not None else _port
+    _interval = interval if interval is not None else _interval
+    _loss_threshold = loss_threshold if loss_threshold is not None else _loss_threshold
+
+    _socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    _socket.settimeout(_interval if start_thread else 0)
+    _sequence, _sent, _received = 0, 0, 0
+    _send_times[:] = np.nan
+    _last_connected_time = 0
+    _rtt, _mean_rtt, _jitter = None, None, 0
+    _next_send_time = time.monotonic()
+    if start_thread:
+        _check_connection_thread = threading.Thread(target=_check_connection_loop)
+        _loop_run_flag = True
+        _check_connection_thread.start()
+
 
 def _check_connection_loop():
-    global _last_connected_time
+    next_send_time = time.monotonic()
     _run_flag_lock.acquire()
     while _loop_run_flag:
         _run_flag_lock.release()
-        if os.system("ping -c 1 -w 1 > /dev/null " + _ip) == 0:  # try once, give up after a second (numbers < 1 second don't work)
-            current_time = time.time()
-            _time_lock.acquire()
-            _last_connected_time = current_time
-            _time_lock.release()
-            time.sleep(0.3) # Don't ping too often (uses network and processing power)
+        try:
+            now = time.monotonic()
+            if now >= next_send_time:
+                _send_heartbeat(now)
+                next_send_time += _interval
+                if next_send_time < now:  # e.g. after the network was down, don't send the missed ones at once
+                    next_send_time = now + _interval
+            _socket.settimeout(max(next_send_time - time.monotonic(), 0.001))
+            try:
+                data = _socket.recv(64)
+            except socket.timeout:
+                data = None
+            if data is not None:
+                _receive_echo(data, time.monotonic())
+        except OSError as ex:  # e.g. network unreachable, the heartbeat counts as lost
+            print("Exception in the failsafe loop")
+            print(ex)
+            time.sleep(_interval)  # no busy loop while the network is down
         _run_flag_lock.acquire()
+    _run_flag_lock.release()
+
+
+def poll():
+    """
+    Sends a heartbeat if one is due and receives the echoes that have arrived, never waits. To be called whenever the
+    socket (see get_socket()) has data and at least every _interval seconds, if init() didn't start the thread.
+    :return: None
+    """
+    global _next_send_time
+    try:
+        now = time.monotonic()
+        if now >= _next_send_time:
+            _send_heartbeat(now)
+            _next_send_time += _interval
+            if _next_send_time < now:
+                _next_send_time = now + _interval
+        while True:
+            try:
+                data = _socket.recv(64)
+            except BlockingIOError:
+                return
+            _receive_echo(data, time.monotonic())
+    except OSError as ex:  # e.g. network unreachable, the heartbeat counts as lost
+        print("Exception in the failsafe poll")
+        print(ex)
+
+
+def get_socket():
+    """
+    :return: The socket opened in init(), e.g. to wait for echoes before calling poll()
+    """
+    return _socket
+
+
+def get_interval():
+    """
+    :return: Time between two heartbeats in seconds
+    :rtype: float
+    """
+    return _interval
+
+
+def _send_heartbeat(now):
+    global _sequence, _sent
+    _time_lock.acquire()
+    _send_times[_sequence % _window] = now
+    sequence = _sequence
+    _sequence += 1
+    _sent += 1
+    _time_lock.release()
+    _socket.sendto(_heartbeat.pack(_magic, sequence, now), (_ip, _port))
+
+
+def _receive_echo(data, now):
+    global _received, _last_connected_time, _rtt, _mean_rtt, _jitter
+    if len(data) != _heartbeat.size:
+        return
+    magic, sequence, send_time = _heartbeat.unpack(data)
+    _time_lock.acquire()
+    # Only echoes of the latest _window heartbeats that were not received yet count (no duplicates, no foreign ones)
+    if magic == _magic and _sequence - _window <= sequence < _sequence and \
+            _send_times[sequence % _window] == send_time:
+        _send_times[sequence % _window] = np.nan
+        _received += 1
+        rtt = now - send_time
+        if _rtt is not None:
+            _jitter += (abs(rtt - _rtt) - _jitter) / 16
+            _mean_rtt += (rtt - _mean_rtt) / 16
+        else:
+            _mean_rtt = rtt
+        _rtt = rtt
+        _last_connected_time = max(_last_connected_time, send_time)
+    _time_lock.release()
 
 
 def get_connection_up():
     """
-    Returns if the connection worked within the last 2 seconds. To be called by the main thread.
-    :return: Boolean, if the connection worked within the last 2 seconds
+    Returns if an echo of a heartbeat sent within the last _loss_threshold seconds was received. To be called by the
+    main thread.
+    :return: Boolean, if the connection worked within the last _loss_threshold seconds
     """
     _time_lock.acquire()
     last_time = _last_connected_time
     _time_lock.release()
-    return (time.time() - last_time) < 1.5
+    return (time.monotonic() - last_time) < _loss_threshold
+
 
-def check_connection_now():
+def check_connection_now(timeout=1.0):
     """
-    Pings the ip address _ip once with a timeout of 1 second. (Blocking up to 1 second)
+    Waits until an echo is received, at most timeout seconds (usually only a few milliseconds after init()).
+    :param timeout: Maximal time to wait in seconds
     :return: True if there is a connection, False otherwise
     """
-    if os.system("ping -c 1 -w 1 > /dev/null " + _ip) == 0:
-        return True
-    return False
+    end_time = time.monotonic() + timeout
+    while not get_connection_up():
+        if time.monotonic() >= end_time:
+            return False
+        if not _loop_run_flag:
+            poll()
+        time.sleep(0.005)
+    return True
+
+
+def get_statistics():
+    """
+    :return: Tuple (round trip time of the last echo, averaged round trip time, jitter, loss ratio of the latest
+    heartbeats) (s, s, s, -), the times are None if no echo was received yet
+    """
+    _time_lock.acquire()
+    # Heartbeats count as lost if the echo is missing after _loss_threshold, younger ones are still pending
+    sent_times = _send_times.copy()
+    rtt, mean_rtt, jitter = _rtt, _mean_rtt, _jitter
+    number = min(_sequence, _window)
+    _time_lock.release()
+    now = time.monotonic()
+    overdue = np.count_nonzero(sent_times < now - _loss_threshold)  # NaN (received) compares False
+    pending = np.count_nonzero(sent_times >= now - _loss_threshold)
+    loss = float(overdue / (number - pending)) if number - pending > 0 else 0.0
+    return rtt, mean_rtt, jitter, loss
+
 
 def finish():
     """
-    Ends the loop and the thread started in init()
+    Ends the loop and the thread started in init() (if it was started), closes the socket and prints the statistics
     :return: None
     """
-    global  _loop_run_flag
-    _run_flag_lock.acquire()
-    _loop_run_flag = False
-    _run_flag_lock.release()
+    global _loop_run_flag, _socket
+    if _socket is None:
+        print("failsafe.finish() called but the failsafe loop doesn't run.")
+        return
+    if _loop_run_flag:
+        _run_flag_lock.acquire()
+        _loop_run_flag = False
+        _run_flag_lock.release()
+        _check_connection_thread.join()
+    _socket.close()
+    _socket = None
+    rtt, mean_rtt, jitter, loss = get_statistics()
+    print("Failsafe: %d heartbeats sent, %d echoed, mean rtt %s ms, jitter %.2f ms, recent loss %.0f %%" % (
+        _sent, _received, "%.2f" % (mean_rtt * 1000) if mean_rtt is not None else "-", jitter * 1000, loss * 100))
+
+
+def run_echo(port=_port):
+    """
+    Echoes all heartbeats received on the given port to their sender, runs forever. Stand-in for the ground station.
+    :param port: UDP port to listen on
+    :return: None
+    """
+    echo_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    echo_socket.bind(("", port))
+    while True:
+        data, address = echo_socket.recvfrom(64)
+        echo_socket.sendto(data, address)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--echo":
+        run_echo(int(sys.argv[2]) if len(sys.argv) > 2 else _port)
@@ -4,22 +4,32 @@
 import serial
 from time import sleep
 
-def init():
+_sequence = 0
+"""
+Sequence number of the next setpoint frame (0..199), lets the Arduino detect lost frames
+"""
+
+def init(serial_port=None):
     """
     starts serial connection, 4 possible ports until now :)
+    :param serial_port: Already opened port (object with the interface of serial.Serial) to use instead of the
+    Arduino's port, e.g. the simulator's.
     :return: None
     """
     global s
-    try:
-        s = serial.Serial('/dev/ttyACM0', 57600, timeout=1)
-    except OSError as e:
+    if serial_port is not None:
+        s = serial_port
+    else:
         try:
-            s = serial.Serial('/dev/ttyACM1', 57600, timeout=1)
+            s = serial.Serial('/dev/ttyACM0', 57600, timeout=1)
         except OSError as e:
             try:
-                s = serial.Serial('/dev/ttyACM2', 57600, timeout=1)
+                s = serial.Serial('/dev/ttyACM1', 57600, timeout=1)
             except OSError as e:
-                s = serial.Serial('/dev/ttyACM3', 57600, timeout=1)
+                try:
+                    s = serial.Serial('/dev/ttyACM2', 57600, timeout=1)
+                except OSError as e:
+                    s = serial.Serial('/dev/ttyACM3', 57600, timeout=1)
 
     for i in range(50):
         a = s.readline() #.decode('utf-8')
@@ -46,24 +56,12 @@ def init():
 
     neutral() # send neutral again # necessary?
 
-def print_status():
-    loop_time_exceeded = False
-    escs = "No values"
-    battery = "No value"
-    loop_time = "No value"
-    while s.in_waiting > 0:
-        line = s.readline()
-        if line == b'Arduino: status\r\n':
-            escs = [int.from_bytes(s.read(1), "big", signed=False)*0.4 for i in range(4)]
-            battery = int.from_bytes(s.read(1), "big", signed=False)*0.06
-            loop_time = int.from_bytes(s.read(1), "big", signed=False)*16
-        elif line == b'Arduino: loop time exceeds 4050us\r\n':
-            loop_time_exceeded = True
-    if loop_time_exceeded:
-        print('Arduino: Loop time exceeded! ')
-    print('Arduino status ESCs (%): ' + str(escs))
-    print('Arduino status battery (V): ' + str(battery))    
-    print('Arduino status loop time (us): ' + str(loop_time))
+def get_port():
+    """
+    :return: The serial connection to the Arduino opened in init(), e.g. for reading the status with the telemetry
+    module
+    """
+    return s
 
 
 def start():
@@ -89,14 +87,30 @@ def neutral():
     :params: None
     :return: None
     """
-    s.write(b"\xFC")
-    s.write((100).to_bytes(1, "big"))
-    s.write(b"\xFD")
-    s.write((100).to_bytes(1, "big"))
-    s.write(b"\xFE")
-    s.write((0).to_bytes(1, "big"))
-    s.write(b"\xFF")
-    s.write((100).to_bytes(1, "big"))
+    send_setpoints(50, 50, 0, 50)
+
+
+def _to_channel_value(percent):
+    # 0% = 1000us -> 0, 100% = 2000us -> 200, limited to the values the Arduino accepts
+    return min(max(int(percent * 2), 0), 200)
+
+
+def send_setpoints(roll, pitch, throttle, yaw):
+    """
+    Sends all four channels in one frame (a single write), so the Arduino applies them together. Frame (7 bytes):
+    0xF8, sequence number, roll, pitch, throttle, yaw, checksum (sum of the 5 bytes before modulo 200). All bytes after
+    0xF8 are <= 200 and can't be mistaken for command bytes, see readSerial() in the Arduino code.
+    :param roll: Percent, 50 % equal to neutral position with 1500 µs
+    :param pitch: Percent, 50 % equal to neutral position with 1500 µs
+    :param throttle: Percent, 0 % equal to 1000 µs
+    :param yaw: Percent, 50 % equal to neutral position with 1500 µs
+    :return: None
+    """
+    global _sequence
+    payload = [_sequence, _to_channel_value(roll), _to_channel_value(pitch), _to_channel_value(throttle),
+               _to_channel_value(yaw)]
+    s.write(bytes([0xF8] + payload + [sum(payload) % 200]))
+    _sequence = (_sequence + 1) % 200
 
 
 def roll(percent):
@@ -0,0 +1,265 @@
+"""
+Flight data recorder: one fixed-schema binary record per control iteration (sensor values, setpoints, PID terms,
+channel outputs and loop timing) is written to a preallocated ring buffer, which costs a few microseconds instead of
+formatting and printing strings. A separate thread copies the new records to a memory-mapped log file. When a file is
+full, the next one is started and only the latest max_files files of the flight are kept.
+
+A log file is a plain array of RECORD_DTYPE records, read it with read_log(). The values are stored with full
+precision, so that a flight can be replayed exactly (see simulation.replay).
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+RECORD_DTYPE = np.dtype([
+    ("sequence", "<u4"),  # Number of the record since init(), starting at 1 (0 marks unwritten records)
+    ("time", "<f8"),  # copter.get_time() in s
+    ("period", "<f8"),  # Time since the previous control iteration in s
+    ("duration", "<f8"),  # Duration of the control calculation in s
+    ("height", "<f8"),  # m
+    ("climb_rate", "<f8"),  # m/s
+    ("heading", "<f8"),  # rad
+    ("speed", "<f8"),  # m/s
+    ("track", "<f8"),  # rad
+    ("latitude", "<f8"),  # rad
+    ("longitude", "<f8"),  # rad
+    ("east", "<f8"),  # m from the starting point
+    ("north", "<f8"),  # m from the starting point
+    ("target_height", "<f8"),  # m, NaN if the climb rate is controlled
+    ("target_climb_rate", "<f8"),  # m/s, NaN if the height is controlled
+    ("target_heading", "<f8"),  # rad
+    ("target_course", "<f8"),  # rad
+    ("target_speed", "<f8"),  # m/s
+    ("throttle_p", "<f8"),  # Terms of the height or climb rate controller in percent of the throttle channel
+    ("throttle_i", "<f8"),
+    ("throttle_d", "<f8"),
+    ("yaw_p", "<f8"),  # Terms of the heading controller in percent of the yaw channel
+    ("yaw_i", "<f8"),
+    ("yaw_d", "<f8"),
+    ("roll", "<f8"),  # Channel outputs sent to the Arduino in percent
+    ("pitch", "<f8"),
+    ("throttle", "<f8"),
+    ("yaw", "<f8"),
+])
+
+_buffer_size = 1024  # 20s at 50Hz, the records must be flushed within that time
+_flush_interval = 0.2  # s
+
+_buffer = np.zeros(_buffer_size, dtype=RECORD_DTYPE)
+_count = 0
+"""
+Number of records since init(), the next one is stored in _buffer[_count % _buffer_size]
+"""
+_flushed = 0
+"""
+Number of records written to the log files (or skipped as lost)
+"""
+_lost = 0  # Records overwritten in the ring buffer before they were flushed
+
+_directory = None
+_file_records = 65536
+_max_files = 10
+_file_name_prefix = None
+_file_number = 0
+_file = None
+_file_path = None
+_file_count = 0  # Number of records in the current file
+
+_recorder_loop_running = False
+_value_lock, _flag_lock = threading.Lock(), threading.Lock()
+_recorder_thread = None
+
+
+def init(directory=None, file_records=65536, max_files=10):
+    """
+    Clears the ring buffer and sets where the records are written to by flush() (and the thread started by start()).
+    :param directory: Directory of the log files (created if necessary), None to only keep the records in the ring
+    buffer
+    :param file_records: Number of records per log file (65536 records, about 22 minutes at 50Hz, are 14MB)
+    :param max_files: Number of log files of this flight to keep, its older ones are deleted (the files of other
+    flights are kept)
+    :return: None
+    """
+    global _count, _flushed, _lost, _directory, _file_records, _max_files, _file_name_prefix, _file_number
+    if _recorder_loop_running:
+        print("flight_recorder.init() called while the recorder loop runs.")
+        return
+    _close_file()
+    _count, _flushed, _lost = 0, 0, 0
+    _directory = directory
+    _file_records = file_records
+    _max_files = max_files
+    _file_name_prefix = "flight_" + time.strftime("%Y%m%d_%H%M%S") + "_"
+    _file_number = 0
+    if _directory is not None:
+        os.makedirs(_directory, exist_ok=True)
+
+
+def start():
+    """
+    Starts an infinite loop calling flush() every _flush_interval seconds in a new thread.
+    :return: None
+    """
+    global _recorder_loop_running, _recorder_thread
+    if _recorder_loop_running:
+        print("flight_recorder.start() called more than once.")
+        return
+    _recorder_loop_running = True
+    _recorder_thread = threading.Thread(target=_recorder_loop)
+    _recorder_thread.start()
+
+
+def finish():
+    """
+    Ends the loop and the thread started in start(), writes the remaining records and closes the log file.
+    :return: None
+    """
+    global _recorder_loop_running
+    if _recorder_loop_running:
+        _flag_lock.acquire()
+        _recorder_loop_running = False
+        _flag_lock.release()
+        _recorder_thread.join()
+    flush()
+    _close_file()
+    if _lost > 0:
+        print("flight_recorder: " + str(_lost) + " records were lost.")
+
+
+def _recorder_loop():
+    _flag_lock.acquire()
+    while _recorder_loop_running:
+        _flag_lock.release()
+        time.sleep(_flush_interval)  # real time, this thread doesn't wait on the clock module
+        try:
+            flush()
+        except Exception as ex:
+            print("Exception writing the flight log")
+            print(ex)
+        _flag_lock.acquire()
+    _flag_lock.release()
+
+
+def record(current_time, period, duration, height, climb_rate, heading, speed, track, latitude, longitude, east, north,
+           target_height, target_climb_rate, target_heading, target_course, target_speed, throttle_p, throttle_i, throttle_d, yaw_p,
+           yaw_i, yaw_d, roll, pitch, throttle, yaw):
+    """
+    Stores a record in the ring buffer, never waits for the log file. The arguments are the fields of RECORD_DTYPE
+    (current_time is the field time), None is stored as NaN.
+    :return: None
+    """
+    global _count
+    if target_height is None:
+        target_height = np.nan
+    if target_climb_rate is None:
+        target_climb_rate = np.nan
+    _value_lock.acquire()
+    _count += 1
+    _buffer[(_count - 1) % _buffer_size] = (
+        _count, current_time, period, duration, height, climb_rate, heading, speed, track, latitude, longitude, east,
+        north, target_height, target_climb_rate, target_heading, target_course, target_speed, throttle_p, throttle_i, throttle_d, yaw_p,
+        yaw_i, yaw_d, roll, pitch, throttle, yaw)
+    _value_lock.release()
+
+
+def flush():
+    """
+    Writes the records that are not written yet to the log file (if init() got a directory). Called by the thread
+    started in start(), or directly if that is not running.
+    :return: None
+    """
+    global _flushed, _lost, _file_count
+    _value_lock.acquire()
+    if _count - _flushed > _buffer_size:
+        _lost += _count - _flushed - _buffer_size
+        _flushed = _count - _buffer_size
+    indices = np.arange(_flushed, _count) % _buffer_size
+    records = _buffer[indices]
+    _flushed = _count
+    _value_lock.release()
+
+    if _directory is None:
+        return
+    while len(records) > 0:
+        if _file is None or _file_count >= _file_records:
+            _open_next_file()
+        number = min(len(records), _file_records - _file_count)
+        _file[_file_count:_file_count + number] = records[:number]
+        _file_count += number
+        records = records[number:]
+
+
+def _open_next_file():
+    global _file, _file_path, _file_count, _file_number
+    _close_file()
+    _file_path = os.path.join(_directory, "%s%03d.bin" % (_file_name_prefix, _file_number))
+    _file_number += 1
+    _file = np.memmap(_file_path, dtype=RECORD_DTYPE, mode="w+", shape=(_file_records,))
+    _file_count = 0
+
+    flight_files = [path for path in get_log_files(_directory)
+                    if os.path.basename(path).startswith(_file_name_prefix)]
+    for path in flight_files[:-_max_files]:
+        os.remove(path)
+
+
+def _close_file():
+    global _file, _file_path
+    if _file is None:
+        return
+    _file.flush()
+    _file = None  # the only reference, so the file is unmapped
+    if _file_count < _file_records:
+        os.truncate(_file_path, _file_count * RECORD_DTYPE.itemsize)  # Remove the unused preallocated records
+    _file_path = None
+
+
+def get_records(number=_buffer_size):
+    """
+    Returns the latest records from the ring buffer.
+    :param number: Maximal number of records to return (at most the size of the ring buffer)
+    :return: Array of RECORD_DTYPE, oldest first
+    :rtype: np.ndarray
+    """
+    _value_lock.acquire()
+    number = min(number, _count, _buffer_size)
+    indices = np.arange(_count - number, _count) % _buffer_size
+    records = _buffer[indices]
+    _value_lock.release()
+    return records
+
+
+def get_log_files(directory):
+    """
+    :param directory: Directory of the log files
+    :return: Paths of the log files in the directory, oldest first
+    :rtype: list
+    """
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.startswith("flight_") and name.endswith(".bin")]
+
+
+def read_log(path):
+    """
+    Reads a log file written by the flight recorder. Records that were preallocated but not written (if the recorder
+    wasn't finished properly) are left out.
+    :param path: Path of the log file
+    :return: Array of RECORD_DTYPE
+    :rtype: np.ndarray
+    """
+    records = np.fromfile(path, dtype=RECORD_DTYPE)
+    return records[records["sequence"] > 0]
+
+
+if __name__ == "__main__":
+    # Measures the time record() takes
+    runs = 100000
+    start_time = time.perf_counter()
+    for i in range(runs):
+        record(i * 0.02, 0.02, 0.001, 1.0, 0.1, 0.5, 1.0, 0.5, 0.8, 1.0, 2.0, 3.0, 1.0, None, 0.5, 0.5, 1.0, 1.0, 0.5, 0.2,
+               1.0, 0.5, 0.2, 50, 50, 50, 50)
+        if i % 512 == 0:
+            flush()
+    print("record() takes %.2f us" % ((time.perf_counter() - start_time) / runs * 1e6))
@@ -0,0 +1,115 @@
+"""
+PID controller for one axis, used by controller.control() for height, climb rate, heading and the horizontal velocity.
+Pure scalar math: a step allocates no NumPy arrays, so it takes only a few microseconds.
+"""
+
+
+class PID(object):
+    """
+    output = offset + scale * (proportional * error + integral - differential * rate of the measurement)
+
+    The derivative is taken of the measurement instead of the error, so a step of the target doesn't kick the output.
+    The integral is of the error over time (integral gain per second), so the behaviour doesn't depend on the control
+    rate. Anti-windup: while the output is at a limit, the integral is set so that the output is exactly at the limit.
+    """
+
+    def __init__(self, proportional, integral, differential, scale=1.0, offset=50.0, minimum=0.0, maximum=100.0,
+                 period=None, max_dt=0.5):
+        """
+        :param proportional: Gain of the error
+        :param integral: Gain of the integrated error per second
+        :param differential: Gain of the rate of change of the measurement
+        :param scale: Factor from the units of the error to the units of the output (e.g. a channel value in percent)
+        :param offset: Output without error (e.g. 50 for the center of a channel)
+        :param minimum: Lower limit of the output, None for no limit
+        :param maximum: Upper limit of the output, None for no limit
+        :param period: Period of the measurement for angles (e.g. 2pi), errors and changes are wrapped to
+        [-period/2, period/2]. None for no wrapping.
+        :param max_dt: Maximal time step in seconds that is integrated (e.g. after a pause of the control loop)
+        """
+        self.proportional, self.integral_gain, self.differential = proportional, integral, differential
+        self.scale, self.offset = scale, offset
+        self.minimum, self.maximum = minimum, maximum
+        self.period = period
+        self.max_dt = max_dt
+        self.integral = 0.0
+        """
+        Integrated error times the integral gain, in the units of the error
+        """
+        self.p_term, self.i_term, self.d_term = 0.0, 0.0, 0.0
+        """
+        Contributions to the last output (without offset), in the units of the output
+        """
+        self.output = offset
+        self._last_measurement = None
+        self._error = 0.0
+        self._dt = 0.0
+
+    def reset(self, measurement=None):
+        """
+        Clears the integral and the terms.
+        :param measurement: The current measurement the rate of the next one is calculated from, None if unknown (the
+        rate of the next measurement is then 0)
+        :return: None
+        """
+        self.integral = 0.0
+        self.p_term, self.i_term, self.d_term = 0.0, 0.0, 0.0
+        self.output = self.offset
+        self._last_measurement = measurement
+
+    def observe(self, measurement):
+        """
+        Stores the measurement of a step in which the axis is not controlled (e.g. the climb rate while the height is
+        controlled), so that the rate is right when it is controlled again.
+        :return: None
+        """
+        self._last_measurement = measurement
+
+    def _wrap(self, difference):
+        if self.period is None:
+            return difference
+        return (difference + self.period / 2) % self.period - self.period / 2
+
+    def update(self, target, measurement, dt, rate=None, integrate=True):
+        """
+        Calculates the output of one control step.
+        :param target: The value the measurement should reach
+        :param measurement: The current measurement
+        :param dt: Time in seconds since the previous step, must be > 0
+        :param rate: Rate of change of the measurement if it is measured (e.g. the climb rate for the height), None to
+        calculate it from the previous measurement
+        :param integrate: Integrate the error if the output is within the limits. If False, integrate() can be called
+        later, e.g. after checking a limit of several axes together.
+        :return: The output, limited to [minimum, maximum]
+        :rtype: float
+        """
+        error = self._wrap(target - measurement)
+        if rate is None:
+            rate = 0.0 if self._last_measurement is None else self._wrap(measurement - self._last_measurement) / dt
+        self._last_measurement = measurement
+        self._error, self._dt = error, dt
+        scale = self.scale
+        self.p_term = scale * self.proportional * error
+        self.i_term = scale * self.integral
+        self.d_term = -scale * self.differential * rate
+        output = self.offset + self.p_term + self.i_term + self.d_term
+        if self.maximum is not None and output >= self.maximum:
+            output = self.maximum
+            self.integral = (self.maximum - self.offset - self.p_term - self.d_term) / scale
+            self.i_term = scale * self.integral
+        elif self.minimum is not None and output <= self.minimum:
+            output = self.minimum
+            self.integral = (self.minimum - self.offset - self.p_term - self.d_term) / scale
+            self.i_term = scale * self.integral
+        elif integrate:
+            self.integrate()
+        self.output = output
+        return output
+
+    def integrate(self):
+        """
+        Integrates the error of the last update() (if it was called with integrate=False).
+        :return: None
+        """
+        self.integral += self.integral_gain * self._error * min(self._dt, self.max_dt)
+
@@ -0,0 +1,134 @@
+import clock
+
+
+class Task(object):
+    """
+    A function that is called periodically by the Scheduler, together with its timing statistics.
+    """
+
+    def __init__(self, name, function, rate):
+        """
+        :param name: Name used in reports
+        :param function: Function without arguments to call
+        :param rate: Calls per second
+        """
+        if rate <= 0:
+            raise ValueError("The rate of task " + name + " must be > 0")
+        self.name = name
+        self.function = function
+        self.period = 1 / rate
+        self.next_time = 0
+        """
+        Time (of the clock module) at which the function should be called the next time
+        """
+        self.runs = 0
+        self.overruns = 0
+        """
+        Number of calls that finished after the time of the next call (the following periods were skipped)
+        """
+        self.total_duration = 0
+        self.max_duration = 0
+        self.max_latency = 0
+        """
+        Maximal time in seconds a call started after its scheduled time
+        """
+        self.errors = 0
+        """
+        Number of calls that raised an exception (only counted by the tasks of control.event_loop, which go on)
+        """
+
+    def record(self, start, end):
+        """
+        Updates the statistics after a call and sets the time of the next call. If the call finished after that time,
+        it is counted as overrun and the missed periods are skipped instead of calling the function repeatedly to catch
+        up.
+        :param start: Time (of the clock module) the call started
+        :param end: Time the call ended
+        :return: None
+        """
+        duration = end - start
+        self.runs += 1
+        self.total_duration += duration
+        self.max_duration = max(self.max_duration, duration)
+
+        self.next_time += self.period
+        if end > self.next_time:
+            self.overruns += 1
+            print("Scheduler: task " + self.name + " overran its period (" + str(self.overruns) + " overruns)")
+            missed_periods = int((end - self.next_time) / self.period) + 1
+            self.next_time += missed_periods * self.period
+
+    def report(self):
+        """
+        :return: One line with the timing statistics of this task
+        :rtype: str
+        """
+        mean_duration = self.total_duration / self.runs if self.runs > 0 else 0
+        return "%s: %d runs at %.1f Hz, %d overruns, %d errors, duration mean %.2f ms max %.2f ms, " \
+               "max latency %.2f ms" % (self.name, self.runs, 1 / self.period, self.overruns, self.errors,
+                                        mean_duration * 1000, self.max_duration * 1000, self.max_latency * 1000)
+
+
+class Scheduler(object):
+    """
+    Calls tasks with individual rates (rate groups) in one thread. The times of the calls are kept on a fixed grid of
+    the (monotonic) clock module, so they don't drift when a call takes longer. If several tasks are due, the task
+    added first is called first, so tasks should be added by priority. Overruns are counted and reported.
+    """
+
+    def __init__(self):
+        self._tasks = []
+
+    def add_task(self, name, function, rate):
+        """
+        Adds a task to be called rate times per second. Must not be called while run() is running.
+        :param name: Name used in reports
+        :param function: Function without arguments to call
+        :param rate: Calls per second
+        :return: The created Task
+        """
+        task = Task(name, function, rate)
+        self._tasks.append(task)
+        return task
+
+    def get_tasks(self):
+        """
+        :return: The tasks in the order they were added
+        """
+        return self._tasks
+
+    def run(self, keep_running):
+        """
+        Calls the tasks on time until keep_running returns False. keep_running is checked before every call.
+        :param keep_running: Function without arguments returning a boolean
+        :return: None
+        """
+        start_time = clock.now()
+        for task in self._tasks:
+            task.next_time = start_time
+
+        while keep_running():
+            now = clock.now()
+            task = None
+            for candidate in self._tasks:  # the first due task in the order of priority
+                if candidate.next_time <= now:
+                    task = candidate
+                    break
+            if task is None:
+                task = min(self._tasks, key=lambda t: t.next_time)
+                clock.sleep(task.next_time - now)
+                now = clock.now()
+                if not keep_running():
+                    break
+
+            task.max_latency = max(task.max_latency, now - task.next_time)
+            task.function()
+            task.record(now, clock.now())
+
+    def report(self):
+        """
+        Prints the timing statistics of all tasks.
+        :return: None
+        """
+        for task in self._tasks:
+            print("Scheduler: " + task.report())
@@ -0,0 +1,265 @@
+"""
+Reading of the status the Arduino sends over the serial connection, in a separate thread. The Arduino sends a status
+record (line "Arduino: status" followed by 9 bytes: 4 ESC outputs, battery voltage, loop time, and the setpoint frames
+of flight_commands lost, repeated and with a wrong checksum since the previous record) every 25 loops (100ms) and the
+line "Arduino: loop time exceeds 4050us" whenever its loop took too long. The records are stored with the time they were
+received in a fixed size ring buffer, the overruns and frames are counted, so the control loop never has to parse them.
+"""
+import threading
+
+import numpy as np
+
+import clock
+
+_buffer_size = 64
+_status_line = b'Arduino: status\r\n'
+_overrun_line = b'Arduino: loop time exceeds 4050us\r\n'
+_status_length = 9  # Number of bytes following _status_line
+
+_port = None
+_records = np.zeros((_buffer_size, 7))
+"""
+Ring buffer of the status records, one row per record: time (of the clock module) in seconds, ESC outputs 1 to 4 in
+percent, battery voltage in V, loop time in us
+"""
+_count = 0
+"""
+Number of status records stored since init(), the next one is stored in row _count % _buffer_size
+"""
+_overruns = 0
+_overrun_time = None
+"""
+Number of loop time overruns reported by the Arduino since init() and the time of the last one (None if there was none)
+"""
+_unread_overruns = 0  # Overruns not printed by print_status() yet
+_lost_frames, _repeated_frames, _frame_errors = 0, 0, 0
+"""
+Numbers of setpoint frames the Arduino reported as lost (skipped sequence numbers), repeated (or older sequence number)
+and with a wrong checksum since init()
+"""
+_received = bytearray()  # Bytes read by poll() that don't complete a line or record yet
+
+_reader_loop_running = False
+_value_lock, _flag_lock = threading.Lock(), threading.Lock()
+_reader_thread = None
+
+
+def init(port):
+    """
+    Sets the serial connection to read from and clears the stored records. Records are then read by calling poll()
+    or continuously after calling start().
+    :param port: The serial connection to the Arduino (object with the interface of serial.Serial with a timeout set),
+    after the handshake of flight_commands.init()
+    :return: None
+    """
+    global _port, _count, _overruns, _overrun_time, _unread_overruns, _lost_frames, _repeated_frames, _frame_errors
+    if _reader_loop_running:
+        print("telemetry.init() called while the reader loop runs.")
+        return
+    _port = port
+    _received.clear()
+    _count = 0
+    _overruns, _overrun_time, _unread_overruns = 0, None, 0
+    _lost_frames, _repeated_frames, _frame_errors = 0, 0, 0
+
+
+def start():
+    """
+    Starts an infinite loop reading the records in a new thread.
+    :return: None
+    """
+    global _reader_loop_running, _reader_thread
+    if _reader_loop_running:
+        print("telemetry.start() called more than once.")
+        return
+    _reader_loop_running = True
+    _reader_thread = threading.Thread(target=_reader_loop)
+    _reader_thread.start()
+
+
+def finish():
+    """
+    Ends the loop and the thread started in start(). Can take as long as the timeout of the serial connection.
+    :return: None
+    """
+    global _reader_loop_running
+    if not _reader_loop_running:
+        print("telemetry.finish() called but the reader loop doesn't run.")
+        return
+    _flag_lock.acquire()
+    _reader_loop_running = False
+    _flag_lock.release()
+    _reader_thread.join()
+
+
+def is_running():
+    """
+    :return: If the loop started by start() is running
+    :rtype: bool
+    """
+    return _reader_loop_running
+
+
+def _reader_loop():
+    _flag_lock.acquire()
+    while _reader_loop_running:
+        _flag_lock.release()
+        try:
+            _read_line()  # waits at most for the timeout of the serial connection
+        except Exception as ex:
+            print("Exception reading the status of the Arduino")
+            print(ex)
+        _flag_lock.acquire()
+    _flag_lock.release()
+
+
+def poll():
+    """
+    Reads all records that have been received, never waits (an incomplete line or record is kept until the rest is
+    received). Alternative to the thread started in start(), to be called regularly or whenever the port has data.
+    Like the thread, it prints the exceptions of reading and interpreting the data instead of raising them.
+    :return: None
+    """
+    try:
+        waiting = _port.in_waiting
+        if waiting > 0:
+            _received.extend(_port.read(waiting))
+        while True:
+            if _received.startswith(_status_line):
+                end = len(_status_line) + _status_length
+                if len(_received) < end:
+                    return
+                data = _received[len(_status_line):end]
+                del _received[:end]
+                _store_status(data)
+            else:
+                end = _received.find(b'\n') + 1
+                if end == 0:
+                    return
+                line = _received[:end]
+                del _received[:end]
+                if line == _overrun_line:
+                    _store_overrun()
+    except Exception as ex:
+        print("Exception reading the status of the Arduino")
+        print(ex)
+
+
+def _read_line():
+    line = _port.readline()
+    if line == _status_line:
+        data = _port.read(_status_length)
+        if len(data) < _status_length:
+            return
+        _store_status(data)
+    elif line == _overrun_line:
+        _store_overrun()
+
+
+def _store_status(data):
+    global _count, _lost_frames, _repeated_frames, _frame_errors
+    record = (clock.now(), data[0] * 0.4, data[1] * 0.4, data[2] * 0.4, data[3] * 0.4, data[4] * 0.06, data[5] * 16)
+    _value_lock.acquire()
+    _records[_count % _buffer_size] = record
+    _count += 1
+    _lost_frames += data[6]
+    _repeated_frames += data[7]
+    _frame_errors += data[8]
+    _value_lock.release()
+
+
+def _store_overrun():
+    global _overruns, _overrun_time, _unread_overruns
+    _value_lock.acquire()
+    _overruns += 1
+    _unread_overruns += 1
+    _overrun_time = clock.now()
+    _value_lock.release()
+
+
+def get_escs():
+    """
+    :return: Tuple (time of the latest status record, ESC outputs 1 to 4 in percent), (None, None) if there is none
+    """
+    _value_lock.acquire()
+    if _count == 0:
+        _value_lock.release()
+        return None, None
+    record = _records[(_count - 1) % _buffer_size].copy()
+    _value_lock.release()
+    return record[0], tuple(record[1:5])
+
+
+def get_battery():
+    """
+    :return: Tuple (time of the latest status record, battery voltage in V), (None, None) if there is none
+    """
+    _value_lock.acquire()
+    if _count == 0:
+        _value_lock.release()
+        return None, None
+    record = _records[(_count - 1) % _buffer_size].copy()
+    _value_lock.release()
+    return record[0], record[5]
+
+
+def get_loop_time_stats():
+    """
+    Returns statistics of the loop time of the Arduino over the status records in the ring buffer and the overruns.
+    :return: Tuple (mean loop time, maximal loop time, number of overruns since init(), time of the last overrun)
+    (us, us, -, s), the loop times are None if there is no status record, the time is None if there was no overrun
+    """
+    samples = get_records()
+    _value_lock.acquire()
+    overruns, overrun_time = _overruns, _overrun_time
+    _value_lock.release()
+    if len(samples) == 0:
+        return None, None, overruns, overrun_time
+    return samples[:, 6].mean(), samples[:, 6].max(), overruns, overrun_time
+
+
+def get_frame_stats():
+    """
+    :return: Tuple (setpoint frames lost, repeated, with a wrong checksum) since init(), as reported by the Arduino
+    """
+    _value_lock.acquire()
+    stats = _lost_frames, _repeated_frames, _frame_errors
+    _value_lock.release()
+    return stats
+
+
+def get_records(number=_buffer_size):
+    """
+    Returns the latest status records.
+    :param number: Maximal number of records to return (at most the size of the ring buffer)
+    :return: Array with one row (time, ESC 1, ESC 2, ESC 3, ESC 4, battery, loop time) (s, %, %, %, %, V, us) per
+    record, oldest first
+    :rtype: np.ndarray
+    """
+    _value_lock.acquire()
+    number = min(number, _count, _buffer_size)
+    indices = np.arange(_count - number, _count) % _buffer_size
+    records = _records[indices]
+    _value_lock.release()
+    return records
+
+
+def print_status():
+    """
+    Prints the latest status of the Arduino and if its loop time was exceeded since the last call.
+    :return: None
+    """
+    global _unread_overruns
+    _value_lock.acquire()
+    overran = _unread_overruns > 0
+    _unread_overruns = 0
+    _value_lock.release()
+    if overran:
+        print('Arduino: Loop time exceeded! ')
+    escs = get_escs()[1]
+    battery = get_battery()[1]
+    loop_time = get_loop_time_stats()[0]
+    print('Arduino status ESCs (%): ' + (str(list(escs)) if escs is not None else "No values"))
+    print('Arduino status battery (V): ' + (str(battery) if battery is not None else "No value"))
+    print('Arduino status loop time (us): ' + (str(loop_time) if loop_time is not None else "No value"))
+    print('Arduino status frames lost/repeated/wrong checksum: %d/%d/%d' % get_frame_stats())
@@ -1,53 +1,116 @@
 import sensors.gps as gps
+import sensors.barometer as barometer
+import sensors.compass_stream as compass_stream
+from sensors.sensor_processes import SensorProcesses
 import sensors.Adafruit_BMP.BMP085 as BMP085
 #import sensors.py-qmc5883l as py-qmc5883l
 from sensors.pyqmc5883l import py_qmc5883l
 from control import flight_commands
+from control import telemetry
+from control import estimator
+import vehicle_state
 #from picamera import PiCamera
 #from PIL import Image
- 
-import RPi.GPIO as GPIO
+
+import clock
 import numpy as np
-import time
 
 _start_lat, _start_lon, _start_time, _ground = 0, 0, 0, 0
-_lat, _lon = 0, 0
-_coordinates_relative = 0, 0
-_distance = 0
-_heading = 0
-_speed = 0
-_track = 0
-_height = 0
-_last_height = 0
-_climb_rate = 0
-_time = 0  # todo check unit correction factors in control
-_last_time = 0
+_state_buffer = vehicle_state.StateBuffer()
+"""
+The current values of the sensors, each refresh function publishes a new snapshot (see get_state()).
+"""
+_time_attributes = {"height": "height_time", "heading": "heading_time", "gps": "gps_time"}
+"""
+Attributes of VehicleState with the times the current values of the sensors were acquired.
+"""
+_max_ages = {"height": 0.3, "heading": 0.3, "gps": 2.5}
+"""
+Maximal age in seconds of the values of the sensors to be valid, older values are stale.
+"""
+_compass_time_budget = 0.01  # Maximal time in seconds to wait for the compass when reading it directly
+_gps_device = None
+"""
+Object providing get_values() and finish() like the gps module, or None if the gps is not used.
+"""
+_sensor_threads = True
+"""
+If the sensors are read continuously in their own threads, otherwise they are read by the refresh functions.
+"""
+_sensor_processes = None
+"""
+sensors.sensor_processes.SensorProcesses reading the sensors in their own processes, None if they are read in this one.
+"""
+_compass_drdy_pin = 7  # Board pin (GPIO 4) the DRDY pin of the compass is connected to
+_compass_declination = 5.6  # degree, Gaziantep Turkey (Erlangen: 3.5)
+_compass_stall_time = 0.02
+"""
+Age in seconds of the latest sample of the streaming compass (4 periods at 200Hz) after which refresh_compass() reads it
+itself: if a read in the DRDY callback fails, the pin stays high and no further rising edge comes.
+"""
+_ground_readings = 50  # Readings of the pressure sensor averaged for the altitude of the ground
+_meters_per_degree = 111300
+
+_vertical_filter = estimator.VerticalFilter()
+_horizontal_filter = estimator.HorizontalFilter()
+_last_baro_time = -np.inf
+_last_fix_time = None
 """
-The time of the last sensor reading (via refresh_sensors() or init()) in seconds.
-now: float in seconds
+Times (like get_time()) of the last barometer reading and gps fix given to the filters
 """
 
 
-def init():
+def init(serial_port=None, compass_device=None, bmp_device=None, gps_device=None, sensor_threads=True,
+         sensor_processes=False, use_gps=False):
     """
-    Initialize sensors and store starting point.
+    Initialize sensors and store starting point. The hardware is used for all devices that are not given (the
+    simulator passes its own devices instead).
+    :param serial_port: Passed on to flight_commands.init()
+    :param compass_device: Object with the interface of py_qmc5883l.QMC5883L used instead of the compass
+    :param bmp_device: Object with the interface of BMP085.BMP085 used instead of the pressure sensor
+    :param gps_device: Object with get_values() and finish() like the gps module, used as the gps
+    :param sensor_threads: Read the sensors continuously in their own threads. Must be False if the devices wait on a
+    virtual clock, as that is advanced by one thread only.
+    :param sensor_processes: Read pressure sensor, compass and gps (if used, see use_gps) continuously in their own
+    processes instead (see sensors.sensor_processes), only on the hardware (compass_device and bmp_device must be None)
+    :param use_gps: If no gps_device is given: read the gps module at its default port, in its own thread with
+    sensor_threads, in its own process with sensor_processes, otherwise gps.poll() has to be called (like the reader
+    task of main.main_run_async() does). The same rule holds for all of them: without gps_device and use_gps, the gps
+    is not used.
     :return: None
     """
-    global compass, bmp, camera
+    global compass, bmp, camera, _gps_device, _sensor_threads, _sensor_processes
 
     print("Starting initialization of the connection to the Arduino.")
     # enable serial connectinon to raspberry
-    flight_commands.init()
+    flight_commands.init(serial_port)
+    telemetry.init(flight_commands.get_port())
+
+    if sensor_processes:
+        if compass_device is not None or bmp_device is not None:
+            raise ValueError("The sensor processes only read the hardware, no devices can be given")
+        print("Starting the sensor processes.")
+        _sensor_processes = SensorProcesses(compass_declination=_compass_declination,
+                                            use_gps=use_gps and gps_device is None)
+        _sensor_processes.start()
+        if gps_device is None:
+            gps_device = _sensor_processes.gps
+    else:
+        _sensor_processes = None
 
-    print("Starting the initialization of the gps")
-#    gps.init()
+    if gps_device is None and use_gps:
+        print("Starting the initialization of the gps")
+        gps.init(start_thread=sensor_threads)
+        gps_device = gps
 
     # compass setup
     # compass i2c port 1: 3 SDA, 5 SDC
     # change /etc/profile
-    compass = py_qmc5883l.QMC5883L()
-    # compass.declination = 3.5  # Erlangen (degree=3, min=28)
-    compass.declination = 5.6 # compass.setDeclination(degree = 5, min = 36) # Gaziantep Turkey
+    # With sensor threads the compass streams at 200Hz, signalling new data on its DRDY pin
+    if _sensor_processes is None:
+        compass = compass_device if compass_device is not None else \
+            py_qmc5883l.QMC5883L(output_data_rate=py_qmc5883l.ODR_200HZ, interrupt=sensor_threads)
+        compass.declination = _compass_declination
 
     # GPS setup
     # gps over UART: /dev/ttyAMA0 pin 8 TX, 10 RX
@@ -57,7 +120,8 @@ def init():
     # pressure sensor setup
     # pressure i2c port 1: pin 3 SDA, pin 5 SCL
     # change: /etc/modules, then blacklist
-    bmp = BMP085.BMP085()#0x77, BMP085_ULTRAHIGHRES) # ULTRAHIRES Mode #todo: change adress
+    if _sensor_processes is None:
+        bmp = bmp_device if bmp_device is not None else BMP085.BMP085()#0x77, BMP085_ULTRAHIGHRES) # ULTRAHIRES Mode #todo: change adress
 
     # camera setup
     #camera = PiCamera()
@@ -70,25 +134,42 @@ def init():
     #    GPIO.setup(18, GPIO.OUT) # Connected to AIN1
     #    GPIO.setup(13, GPIO.OUT) # Connected to STBY
 
-    global _start_lat, _start_lon, _speed, _track, _start_time, _last_time, _time, _ground, _last_height
+    global _start_lat, _start_lon, _start_time, _ground, _last_baro_time, _last_fix_time
 
     print("Starting reading first sensor values.")
 
+    _gps_device = gps_device
     _start_lat = 0
+    _state_buffer.reset()
+    if _gps_device is not None:
+        _start_lat, _start_lon, speed, track = _gps_device.get_values()  # store starting position
+        _state_buffer.update(latitude=_start_lat, longitude=_start_lon, speed=speed, track=track)
  #   wait_start_time = time.time()
  #   while _start_lat == 0:
  #       _start_lat, _start_lon, _speed, _track = gps.get_values()  # store starting position
  #       if time.time() - wait_start_time > 10:
  #           raise TimeoutError("No GPS signal for 10 seconds")
 
-    _ground = 0
-    for i in range(50):
-        _ground += bmp.read_altitude()
-    _ground /= 50
-    _last_height = _ground
-
-    _start_time = time.time()  # time in seconds since the epoch as a floating point number
-    _time = 0
+    _sensor_threads = sensor_threads
+    if _sensor_processes is not None:
+        _ground = np.mean(_sensor_processes.wait_for_barometer(_ground_readings)[:, 2])
+    else:
+        _ground = np.mean(bmp.read_altitudes(_ground_readings))
+        barometer.init(bmp)
+        barometer.acquire()
+    if _sensor_threads:
+        telemetry.start()
+        if _sensor_processes is None:
+            barometer.start()
+            compass_stream.init(compass, _compass_drdy_pin)
+            compass_stream.start()
+
+    _start_time = clock.now()  # time in seconds as a floating point number
+    _vertical_filter.reset()
+    _vertical_filter.update_height(0, 0)  # The copter starts on the ground
+    _horizontal_filter.reset()
+    _last_baro_time = -np.inf
+    _last_fix_time = None
 
     refresh_sensors() # Make sure all values are read and can be obtained by the getter functions from now on
 
@@ -99,35 +180,158 @@ def refresh_sensors():
     passed since the last call and the current time.
     :return: None
     """
-    global _distance, _height, _last_height, _climb_rate, _heading, _coordinates_relative, _lat, _lon, _speed, _track, _time, _last_time
-    _last_time = _time
-    _time = time.time() - _start_time
+    refresh_time()
+    refresh_gps()
+    refresh_compass()
+    refresh_barometer()
+    print_status()
+
+
+def refresh_time():
+    """
+    Stores the current time and the time of the previous call (see get_time()). Called by refresh_sensors(), or
+    separately when the sensors are read by their own rate groups.
+    :return: None
+    """
+    time = clock.now() - _start_time
+    _state_buffer.update_time(time)
+
+
+def refresh_gps():
+    """
+    Gives a new gps fix to the horizontal filter and stores its estimate of position and velocity, extrapolated to the
+    current time.
+    :return: None
+    """
+    global _last_fix_time
+    if _gps_device is None:
+        return  # all values stay 0
+    lat, lon, speed, track = _gps_device.get_values()
+    fix_time = _gps_device.get_fix_time()
+    if fix_time is not None and fix_time - _start_time != _last_fix_time:
+        _last_fix_time = fix_time - _start_time
+        dE = 180/np.pi * _meters_per_degree * np.cos(lat) * (lon - _start_lon)  # distance from start to copter in longitude in meter
+        dN = 180/np.pi * _meters_per_degree * (lat - _start_lat)  # distance from start to copter in latitude in meter
+        _horizontal_filter.update_position(_last_fix_time, dE, dN)
+        _horizontal_filter.update_velocity(_last_fix_time, speed, track)
+    if _horizontal_filter.time is None:
+        return
+    dE, dN, speed, track = _horizontal_filter.get_values(clock.now() - _start_time)
+    lat = _start_lat + np.pi/180 * dN / _meters_per_degree
+    lon = _start_lon + np.pi/180 * dE / (_meters_per_degree * np.cos(lat))
+    _state_buffer.update(east=dE, north=dN, distance=np.sqrt(dE ** 2 + dN ** 2), latitude=lat, longitude=lon,
+                         speed=speed, track=track, gps_time=_last_fix_time)
+
+
+def read_compass():
+    """
+    The part of refresh_compass() that reads the compass, without storing the heading: takes the latest (averaged)
+    heading of the streaming compass without waiting (reading a sample itself if the streaming stalled, see
+    _compass_stall_time), or reads the compass if it doesn't stream, waiting at most _compass_time_budget. Can be called
+    in another thread than the one using the state (e.g. in the executor of main.main_run_async()).
+    :return: Tuple (time of the sample, bearing in degrees), the bearing is None if there is no heading
+    """
+    if _sensor_processes is not None:
+        sample_time, bearing = _sensor_processes.get_compass_values()
+    elif _sensor_threads:
+        sample_time, bearing = compass_stream.get_values()
+        if sample_time is None or clock.now() - sample_time > _compass_stall_time:
+            compass_stream.poll()  # reading the pending sample lets the DRDY pin go low, so the edges come again
+            sample_time, bearing = compass_stream.get_values()
+    else:
+        bearing = compass.get_bearing(timeout=_compass_time_budget)
+        sample_time = clock.now()
+    return sample_time, bearing
+
+
+def refresh_compass(reading=None):
+    """
+    Reads the compass with read_compass() and stores the heading. If there is no new heading, the last one is kept (and
+    gets stale).
+    :param reading: Result of read_compass() if it was called separately, None to call it now
+    :return: None
+    """
+    sample_time, bearing = read_compass() if reading is None else reading
+    if bearing is not None:
+        _state_buffer.update(heading=bearing * np.pi/180, heading_time=sample_time - _start_time)
+
 
-    _lat, _lon, _speed, _track = 0,0,0,0 #gps.get_values()
-    dE = np.pi/180 * 111.3 * np.cos(_lat) * (_lon - _start_lon) * 1000  # distance from start to copter in longitude in meter
-    dN = np.pi/180 * 111.3 * (_lat - _start_lat) * 1000  # distance from start to copter in latitude in meter
-    _distance = np.sqrt(dE ** 2 + dN ** 2)
-    _coordinates_relative = dE, dN
+def read_barometer():
+    """
+    The part of refresh_barometer() that reads the pressure sensor: collects a finished reading if it isn't read in its
+    own thread (without waiting for the conversion, only for the I2C transfer) and returns the latest readings. Can be
+    called in another thread than the one using the state (e.g. in the executor of main.main_run_async()).
+    :return: Array with one row (time, pressure, altitude) per reading like barometer.get_samples(), oldest first
+    :rtype: np.ndarray
+    """
+    if _sensor_processes is not None:
+        return _sensor_processes.get_barometer_samples()
+    if not _sensor_threads:
+        barometer.poll()
+    return barometer.get_samples()
 
-    _heading = compass.get_bearing() * np.pi/180
 
-    current_height = bmp.read_altitude()
-    cur_climb_rate = (current_height - _last_height) / (_time - _last_time)
+def refresh_barometer(samples=None):
+    """
+    Gives the new readings of the pressure sensor to the vertical filter and stores its estimate of height and climb
+    rate, extrapolated to the current time. Doesn't block.
+    :param samples: Result of read_barometer() if it was called separately, None to call it now
+    :return: None
+    """
+    global _last_baro_time
+    if samples is None:
+        samples = read_barometer()
+    samples = samples[samples[:, 0] - _start_time > _last_baro_time]
+    for sample_time, pressure, altitude in samples:
+        _vertical_filter.update_baro(sample_time - _start_time, altitude - _ground)
+    if len(samples) > 0:
+        _last_baro_time = samples[-1, 0] - _start_time
+    height, climb_rate, bias = _vertical_filter.get_values(clock.now() - _start_time)
+    if len(samples) > 0:
+        _state_buffer.update(height=height, climb_rate=climb_rate, height_time=_last_baro_time)
+    else:
+        _state_buffer.update(height=height, climb_rate=climb_rate)
 
-    climb_rate_avg_factor = np.exp(1 * (_last_time - _time)) # Becomes 1/e after 1 second
-    _climb_rate = (1-climb_rate_avg_factor) * cur_climb_rate + climb_rate_avg_factor * _climb_rate
 
-    height_avg_factor = np.exp(1 * (_last_time - _time)) # Becomes 1/e after 1 second
-    _height = (1-height_avg_factor) * (current_height - _ground) + height_avg_factor * _height
+def set_values(time, height, climb_rate, heading, speed, track, coordinates, coordinates_relative):
+    """
+    Stores the given values instead of reading the sensors, e.g. to replay a recorded flight (see simulation.replay).
+    All values count as just acquired (at the current time of the clock module). The units are those of the getter
+    functions.
+    :param time: The time of the sensor reading, becomes get_time() (the previous one is kept like in refresh_time())
+    :param coordinates: lat, long both in radian
+    :param coordinates_relative: east, north in meters from the starting point
+    :return: None
+    """
+    global _start_time
+    _start_time = clock.now() - time
+    _state_buffer.update_time(time, height=height, climb_rate=climb_rate, heading=heading, speed=speed, track=track,
+                              latitude=coordinates[0], longitude=coordinates[1], east=coordinates_relative[0],
+                              north=coordinates_relative[1],
+                              distance=np.sqrt(coordinates_relative[0] ** 2 + coordinates_relative[1] ** 2),
+                              height_time=time, heading_time=time, gps_time=time)
 
-    _last_height = current_height
 
+def print_status():
+    """
+    Prints the current sensor values and the status sent by the Arduino. Reads the status first if it isn't read in
+    its own thread.
+    :return: None
+    """
+    if not _sensor_threads:
+        telemetry.poll()
+    state = get_state()
     print("")
-    print("Height (m)" + str(_height))
-    print("Climbrate (m/s)" + str(_climb_rate))
-    print("Heading (rad)" + str(_heading))
-    print("Speed (m/s)" + str(_speed))
-    flight_commands.print_status()
+    print("Height (m)" + str(state.height))
+    print("Climbrate (m/s)" + str(state.climb_rate))
+    print("Heading (rad)" + str(state.heading))
+    print("Speed (m/s)" + str(state.speed))
+    stale = [sensor for sensor in _time_attributes if not is_valid(sensor)]
+    if stale:
+        print("Stale sensor values: " + str(stale))
+    if _sensor_processes is not None and _sensor_processes.get_ended():
+        print("Ended sensor processes: " + str(_sensor_processes.get_ended()))
+    telemetry.print_status()
 
 def shutdown():
     """
@@ -135,14 +339,56 @@ def shutdown():
     :return: None
     """
     flight_commands.stop_all()
-    gps.finish()
+    if _sensor_threads:
+        telemetry.finish()
+        if _sensor_processes is None:
+            barometer.finish()
+            compass_stream.finish()
+    if _gps_device is not None:
+        _gps_device.finish()
+    else:
+        gps.finish()
+    if _sensor_processes is not None:
+        _sensor_processes.finish()
 
 
 def get_time():
     """
     :return: The time of the last sensor reading (via refresh_sensors() or init()) in seconds.
     """
-    return _time
+    return _state_buffer.get().time
+
+
+def get_state():
+    """
+    The values of all getter functions (except get_start_coord()) as one consistent snapshot, taken by the control
+    loop and the missions once per iteration instead of calling the getters one by one. The snapshot is immutable,
+    later updates publish new ones (see vehicle_state.StateBuffer).
+    :return: The current state
+    :rtype: vehicle_state.VehicleState
+    """
+    return _state_buffer.get()
+
+
+def get_age(sensor):
+    """
+    :param sensor: "height" (also for the climb rate), "heading" or "gps" (coordinates, speed and track)
+    :return: Time in seconds since the current values of the sensor were acquired, infinity if they never were
+    :rtype: float
+    """
+    sample_time = getattr(_state_buffer.get(), _time_attributes[sensor])
+    if sample_time is None:
+        return float("inf")
+    return max(clock.now() - _start_time - sample_time, 0)
+
+
+def is_valid(sensor):
+    """
+    :param sensor: "height" (also for the climb rate), "heading" or "gps" (coordinates, speed and track)
+    :return: If the current values of the sensor are not stale (not older than allowed in _max_ages)
+    :rtype: bool
+    """
+    return get_age(sensor) <= _max_ages[sensor]
 
 
 def get_coordinates():
@@ -150,7 +396,8 @@ def get_coordinates():
     :return: lat, long both in radian
     :rtype: (float, float)
     """
-    return _lat, _lon
+    state = _state_buffer.get()
+    return state.latitude, state.longitude
 
 
 def get_coordinates_relative():
@@ -158,7 +405,8 @@ def get_coordinates_relative():
     :return: east, north in meters from the starting point
     :rtype: (float, float)
     """
-    return _coordinates_relative
+    state = _state_buffer.get()
+    return state.east, state.north
 
 
 def get_distance():
@@ -166,7 +414,7 @@ def get_distance():
     :return: Distance from starting point in meters
     :rtype: float
     """
-    return _distance
+    return _state_buffer.get().distance
 
 
 def get_start_coord():
@@ -182,7 +430,7 @@ def get_speed():
     :return: Ground speed in m/s
     :rtype: float
     """
-    return _speed
+    return _state_buffer.get().speed
 
 
 def get_track():
@@ -190,7 +438,7 @@ def get_track():
     :return: true track (traveling angle in radian from north)
     :rtype: float
     """
-    return _track
+    return _state_buffer.get().track
 
 
 def get_heading():
@@ -198,7 +446,7 @@ def get_heading():
     :return: Heading in radians within [0, 2pi) from north.
     :rtype: float
     """
-    return _heading
+    return _state_buffer.get().heading
 
 
 def get_height():
@@ -206,14 +454,14 @@ def get_height():
     :return: Height above the ground (after averaging) in meters
     :rtype: float
     """
-    return _height
+    return _state_buffer.get().height
 
 def get_climb_rate():
     """
     :return: Climb rate after averaging in m/s
     :rtype: float
     """
-    return _climb_rate
+    return _state_buffer.get().climb_rate
 
 def get_picture(number):
     """
@@ -224,18 +472,19 @@ def get_picture(number):
     camera.take_picture(number) #todo: should be maybe camera.capture()
 
 def run_DC_motor(up):
+    import RPi.GPIO as GPIO
 
     if up == True:
         GPIO.output(18, GPIO.HIGH)
         pwm = GPIO.PWM(15, 25)  # 25 Hz
         pwm.start(65) # 65% power
-        time.sleep(2)
+        clock.sleep(2)
         pwm.stop()
     else:
         GPIO.output(18, GPIO.LOW)
         pwm = GPIO.PWM(15, 25)  # 25 Hz
         pwm.start(65) # 65% power
-        time.sleep(2)
+        clock.sleep(2)
         pwm.stop()
 
 
@@ -250,7 +499,7 @@ def print_info():
     print("track in radian  " + str(get_track()))
     print("heading in radian  " + str(get_heading()))
     print("height in m above ground  " + str(get_height()))
-    print("Time it took to init(), print all, refresh sensors  " + str(time.time()-_start_time))
+    print("Time it took to init(), print all, refresh sensors  " + str(clock.now()-_start_time))
 
     #z0 = time.time()
     #im = Image.open('/home/pi/Pictures/firstselfie.jpg')
@@ -1,36 +1,46 @@
-from enum import Enum
-from typing import List
+import asyncio
+import concurrent.futures
 
 import Mission
+import mission_runtime
 import missions.emergency_landing_mission as emergency
 import missions.fly_waypoints as fly_way
 import missions.hop_in_place as hop_in_place
 import control.controller as controller
+import control.event_loop as event_loop
 import control.failsafe as failsafe
+import control.flight_commands as flight_commands
+import control.flight_recorder as flight_recorder
+import control.telemetry as telemetry
+from control.scheduler import Scheduler, Task
 import copter
-
-
-class MissionState(Enum):
-    NEW = 1
-    RUNNING = 2
-    CONTINUING = 3
-    CONTINUING_FROM_ERROR = 4
+import sensors.gps as gps
 
 
 _height, _heading, _course, _speed = 0,0,0,0
 _climb_rate = 0
 _connection_lost = False
+_control_failed = False  # main_run_async() started an emergency landing because the control task raised
 
-_missions: List[Mission.Mission] = []
-_mission_state = MissionState.NEW  # alternatives: "running", "continuing", "continuingFromError"
+_runtime = mission_runtime.MissionRuntime(fallback=emergency.EmergencyLandingMission)
+"""
+Runs the base mission and its sub-missions, an emergency landing if the base mission ends without ending the flight
+"""
 _flying = True
+_link = failsafe
 
+# Rates of the tasks run by main_run() in calls per second
+_control_rate = 50
+_failsafe_rate = 10
+_compass_rate = 50  # the compass streams at 200Hz, its averaged heading is taken for every control step
+_barometer_rate = 25
+_gps_rate = 5
+_mission_rate = 5
+_status_rate = 2
+_recorder_rate = 2  # only if the flight recorder isn't flushed by its own thread
+_reader_rate = 20  # main_run_async() calls the readers as soon as data arrives, but at least this often
 
-def _append_mission(mission: Mission.Mission):
-    if isinstance(mission, Mission.Mission):
-        _missions.append(mission)
-    else:
-        raise TypeError()
+_log_directory = "flight_logs"
 
 
 def set_parameters(height=_height, heading=_heading, course=_course, speed=_speed):
@@ -73,33 +83,33 @@ def start_sub_mission(mission: Mission.Mission):
     To be called to start the given mission as a sub-mission. Triggers an immediate start of that mission. When that
     mission finishes (by calling mission_finished()) continue_mission_from_submission() of the current/previous mission
     will be called, or continue_mission_from_submission_error() if an error occurres.
+    Missions written as generator (see mission_runtime) yield mission_runtime.SubMission instead.
     :param mission: The Mission instance to be started as sub-mission. Should usually be a new instance, as multiple
     calls of this method with the same object will likely cause severe problems if the mission is not designed for that.
     :return: None
     """
-    global _mission_state
-    _append_mission(mission)
-    _mission_state = MissionState.NEW
+    _runtime.start_sub_mission(mission)
 
 
 def mission_finished():
     """
     To be called by sub-missions when finished. Triggers returning to the previous (sub-)mission. After calling this
     no method of the current mission-object will be called anymore (except is has been started multiple times).
+    Missions written as generator return instead.
     :return: None
     """
-    global _mission_state
-    _missions.pop()
-    _mission_state = MissionState.CONTINUING
-    if len(_missions) == 0:
-        _append_mission(emergency.EmergencyLandingMission())
+    _runtime.mission_finished()
 
 
-def mission_error():
-    global _mission_state
+def mission_error(error=None):
+    """
+    To be called by sub-missions that failed, like raising an exception: triggers returning to the previous mission,
+    whose continue_from_submission_error() is called.
+    :param error: The exception, if any
+    :return: None
+    """
     # todo: log error
-    mission_finished()
-    _mission_state = MissionState.CONTINUING_FROM_ERROR
+    _runtime.mission_error(error if error is not None else RuntimeError("Mission failed"))
 
 
 def flight_finished():
@@ -112,79 +122,252 @@ def flight_finished():
     _flying = False
 
 
-def main_run():
-    global _height, _heading, _course, _speed
-    global _climb_rate
+def _control_tick():
+    copter.refresh_time()
+    controller.control(_height, _climb_rate, _heading, _course, _speed)
+
+
+def _failsafe_tick():
     global _connection_lost
+    if not _connection_lost:
+        if not _link.get_connection_up():
+            print("Connection lost, starting emergency landing.")
+            _runtime.preempt(emergency.EmergencyLandingMission())
+            _connection_lost = True
+    else:
+        print("Connection lost, emergency landing.")
+
+
+def _control_error(error):
+    # A failure of the control task of main_run_async(): the other tasks go on, the copter lands (stopping the motors
+    # in the air would let it fall)
+    global _control_failed
+    if not (_control_failed or _connection_lost):
+        print("Control failed, starting emergency landing.")
+        _runtime.preempt(emergency.EmergencyLandingMission())
+    _control_failed = True
+
+
+def mission_tick():
+    """
+    Resumes the current mission if what it waits for is satisfied (for missions written as Mission subclasses: starts
+    or continues it if necessary and calls its loop_run()). Called by the scheduler of main_run() (or by
+    simulation.replay).
+    :return: None
+    """
+    _runtime.tick()
+
+
+def get_parameters():
+    """
+    :return: The current targets for the controller as tuple (height, climb rate, heading, course, speed), see
+    set_parameters() and set_alternative_parameters()
+    """
+    return _height, _climb_rate, _heading, _course, _speed
+
+
+def reset(base_mission=None, link=failsafe):
+    """
+    Clears the missions, targets and state of a previous flight and appends the base mission. Called by main_run(), or
+    before flying the missions without it (like simulation.replay).
+    :param base_mission: The Mission (or mission generator, see mission_runtime) to start the flight with, a
+    HopInPlaceMission if None.
+    :param link: See main_run()
+    :return: None
+    """
+    global _height, _heading, _course, _speed, _climb_rate
+    global _connection_lost, _control_failed, _flying, _link
+    _link = link
+    _connection_lost = False
+    _control_failed = False
+    _flying = True
+    _height, _heading, _course, _speed = 0, 0, 0, 0
+    _climb_rate = 0
+    _runtime.reset(base_mission if base_mission is not None else hop_in_place.HopInPlaceMission())
+
 
-    global _missions
-    global _mission_state
+def start_base_mission():
+    """
+    Starts the base mission added by reset() and calls its loop_run() the first time. Ends the flight if that fails.
+    :return: None
+    """
     global _flying
+    try:
+        print("Starting first mission.")
+        _runtime.start()
+    except Exception as ex:
+        print(ex)
+        _flying = False
 
-    _append_mission(hop_in_place.HopInPlaceMission())
+
+def is_flying():
+    """
+    :return: If the flight has not been finished (see flight_finished())
+    :rtype: bool
+    """
+    return _flying
+
+
+def _initialize(base_mission, link, log_directory, devices, **link_arguments):
+    # Initializes everything and starts the base mission, shared by main_run() and main_run_async()
+    global _heading
+    global _flying
+
+    reset(base_mission, link)
+
+    flight_recorder.init(log_directory)
+    if devices.get("sensor_threads", True):
+        flight_recorder.start()
 
     print("Starting copter initialization.")
-    copter.init()
+    copter.init(**devices)
     _heading = copter.get_heading()
 
     print("Starting controller initialization.")
     controller.init()
 
     print("Starting failsafe initialization.")
-    failsafe.init()
+    link.init(**link_arguments)
 
     print("Finished initialization.")
 
     # Compare this to the following loop:
-    if not (failsafe.check_connection_now() and failsafe.get_connection_up()):
+    if not (link.check_connection_now() and link.get_connection_up()):
         print("No connection, not starting main loop.")
         _flying = False
     else:
         copter.refresh_sensors()
-        try:
-            print("Starting first mission.")
-            _missions[-1].start_mission()
-            _mission_state = MissionState.RUNNING
-            _missions[-1].loop_run()
-        except Exception as ex:
-            print(ex)
-            _flying = False
-
-    while _flying:
-        # I think this order is best: failsafe -> sensor refresh -> mission -> controlling (like it is now)
-        # If a mission turns _flying to False, control() should not be called anymore (that's why it's at the beginning
-        # of the loop). The stuff to do before the first call of controller.control() is done before the loop.
-        controller.control(_height, _climb_rate, _heading, _course, _speed)
-        global _connection_lost
-        if not _connection_lost:
-            if not failsafe.get_connection_up():
-                print("Connection lost, starting emergency landing.")
-                start_sub_mission(emergency.EmergencyLandingMission())
-                _connection_lost = True
-        else:
-            print("Connection lost, emergency landing.")
-
-        copter.refresh_sensors()
-        try:
-            if _mission_state == MissionState.NEW:
-                _missions[-1].start_as_submission()
-            elif _mission_state == MissionState.CONTINUING:
-                _missions[-1].continue_from_submission()
-            elif _mission_state == MissionState.CONTINUING_FROM_ERROR:
-                _missions[-1].continue_from_submission_error()
-
-            _mission_state = MissionState.RUNNING
+        start_base_mission()
 
-            _missions[-1].loop_run()
-        except Exception as ex:  # Something could go wrong in the mission, or _missions contains an element that is no mission, ...
-            print(ex)
-            mission_error()
 
+def _shutdown(link):
     print("Main loop ended, starting to shut down the copter.")
     copter.shutdown()
-    failsafe.finish()
+    link.finish()
+    flight_recorder.finish()
     print("main finished, copter has shut down. Bye!")
 
+
+def main_run(base_mission=None, link=failsafe, log_directory=_log_directory, **devices):
+    """
+    Initializes everything, flies the base mission (and its sub-missions) and shuts the copter down afterwards, also if
+    a task raises an exception (which is raised again after the shutdown).
+    :param base_mission: The Mission to start the flight with, a HopInPlaceMission if None.
+    :param link: Monitors the connection to the ground station. Module or object with init(), check_connection_now(),
+    get_connection_up() and finish() like control.failsafe (the default).
+    :param log_directory: Directory the flight recorder writes its log files to, None to not write them.
+    :param devices: Passed on to copter.init() to replace hardware (e.g. by the simulator). If sensor_threads is False,
+    the flight recorder is flushed by the scheduler instead of its own thread too.
+    :return: None
+    """
+    _initialize(base_mission, link, log_directory, devices)
+
+    # The tasks are added by priority: if several are due, the controlling goes first. If a mission turns _flying to
+    # False, no task (especially control()) is called anymore.
+    scheduler = Scheduler()
+    scheduler.add_task("control", _control_tick, _control_rate)
+    scheduler.add_task("failsafe", _failsafe_tick, _failsafe_rate)
+    scheduler.add_task("compass", copter.refresh_compass, _compass_rate)
+    scheduler.add_task("barometer", copter.refresh_barometer, _barometer_rate)
+    scheduler.add_task("gps", copter.refresh_gps, _gps_rate)
+    scheduler.add_task("mission", mission_tick, _mission_rate)
+    scheduler.add_task("status", copter.print_status, _status_rate)
+    if not devices.get("sensor_threads", True):
+        scheduler.add_task("recorder", flight_recorder.flush, _recorder_rate)
+    try:
+        scheduler.run(lambda: _flying)
+        scheduler.report()
+    finally:
+        # Also if a task raised: the motors are stopped and the flight log keeps the records before the exception
+        _shutdown(link)
+
+
+def main_run_async(base_mission=None, link=failsafe, log_directory=_log_directory, **devices):
+    """
+    Like main_run(), but all tasks run on one asyncio event loop (see control.event_loop) instead of the scheduler and
+    the threads of the sensors, the telemetry and the failsafe: the rate groups of main_run() are periodic tasks, the
+    status of the Arduino, the gps and the echoes of the heartbeats are read by reader tasks as soon as they arrive.
+    Like the threads, the tasks go on if a call raises an exception (see control.event_loop), an exception of the
+    control task starts an emergency landing.
+    Compass and pressure sensor are read in the polling mode of copter (sensor_threads=False), their blocking I2C
+    transfers (not the filter updates) and the writing of the flight log run in one executor thread.
+    :param base_mission: See main_run()
+    :param link: See main_run(). If it has poll(), get_socket() and get_interval() like control.failsafe, it is
+    initialized with start_thread=False and polled by a reader task.
+    :param log_directory: See main_run()
+    :param devices: Passed on to copter.init() (with sensor_threads=False). If the gps_device has poll() and get_port()
+    like sensors.gps, it is polled by a reader task. With use_gps and no gps_device, sensors.gps is initialized with
+    start_thread=False and passed on as gps_device (unless the gps is read by sensor_processes). If sensor_threads is
+    False (e.g. on the virtual clock of the simulator), there is no executor thread either.
+    :return: None
+    """
+    if devices.get("use_gps", False) and devices.get("gps_device") is None and \
+            not devices.get("sensor_processes", False):
+        gps.init(start_thread=False)
+        devices["gps_device"] = gps
+    executor = concurrent.futures.ThreadPoolExecutor(1, "i2c") if devices.get("sensor_threads", True) else None
+    devices["sensor_threads"] = False
+    loop = event_loop.new_event_loop()
+    try:
+        loop.run_until_complete(_main_async(base_mission, link, log_directory, devices, executor))
+    finally:
+        loop.close()
+        if executor is not None:
+            executor.shutdown()
+
+
+async def _main_async(base_mission, link, log_directory, devices, executor):
+    polled_link = all(hasattr(link, name) for name in ("poll", "get_socket", "get_interval"))
+    if polled_link:
+        _initialize(base_mission, link, log_directory, devices, start_thread=False)
+    else:
+        _initialize(base_mission, link, log_directory, devices)
+
+    def keep_running():
+        return _flying
+
+    # One executor thread for compass and pressure sensor, so they don't use the I2C bus at the same time. Only the
+    # blocking reads run in it: the filters are updated and the state is published on the loop thread, like all other
+    # tasks using them.
+    def read_in_executor(read, refresh):
+        if executor is None:
+            return refresh
+
+        async def read_and_refresh():
+            refresh(await asyncio.get_running_loop().run_in_executor(executor, read))
+        return read_and_refresh
+
+    control = Task("control", _control_tick, _control_rate)
+    periodic = [(control, None),
+                (Task("failsafe", _failsafe_tick, _failsafe_rate), None),
+                (Task("compass", read_in_executor(copter.read_compass, copter.refresh_compass), _compass_rate), None),
+                (Task("barometer", read_in_executor(copter.read_barometer, copter.refresh_barometer), _barometer_rate),
+                 None),
+                (Task("gps", copter.refresh_gps, _gps_rate), None),
+                (Task("mission", mission_tick, _mission_rate), None),
+                (Task("status", copter.print_status, _status_rate), None),
+                (Task("recorder", flight_recorder.flush, _recorder_rate), executor)]
+    readers = [(Task("telemetry", telemetry.poll, _reader_rate), flight_commands.get_port())]
+    gps_device = devices.get("gps_device")
+    if hasattr(gps_device, "poll") and hasattr(gps_device, "get_port"):
+        readers.append((Task("gps reader", gps_device.poll, _reader_rate), gps_device.get_port()))
+    if polled_link:
+        readers.append((Task("heartbeat", link.poll, 1 / link.get_interval()), link.get_socket()))
+
+    try:
+        await asyncio.gather(*[event_loop.run_periodic(task, keep_running, task_executor,
+                                                       _control_error if task is control else None)
+                               for task, task_executor in periodic] +
+                             [event_loop.run_reader(task, port, keep_running) for task, port in readers])
+        event_loop.report([task for task, task_executor in periodic] + [task for task, port in readers])
+    finally:
+        _shutdown(link)
+
+
 if __name__ == "__main__":
+    import sys
+
     import main as m
-    m.main_run()
+    # --asyncio: fly with main_run_async(), --processes: read the sensors in their own processes, --no-gps: without gps
+    run = m.main_run_async if "--asyncio" in sys.argv[1:] else m.main_run
+    run(sensor_processes="--processes" in sys.argv[1:], use_gps="--no-gps" not in sys.argv[1:])
@@ -0,0 +1,274 @@
+"""
+Runs the missions of a flight as coroutines. A mission can be written as generator that yields what it waits for,
+instead of a state machine called in every iteration:
+
+    class SurveyMission(mission_runtime.GeneratorMission):
+        def run(self, as_base):
+            main.set_alternative_parameters(climb_rate=0.5)
+            yield mission_runtime.WaitUntil(lambda: copter.get_height() >= 5)
+            main.set_parameters(height=5)
+            yield mission_runtime.Sleep(10)
+            yield mission_runtime.SubMission(EmergencyLandingMission())
+
+A generator yields:
+    None: continue in the next iteration (e.g. to update the targets continuously)
+    Sleep(seconds): continue after the time
+    WaitUntil(condition, timeout): continue when condition() is true, yield returns False if the timeout passed first
+    SubMission(mission): run the mission (a Mission or generator) until it ends, yield returns its return value. If it
+    fails, the exception is raised at the yield.
+It ends by returning (then the mission that started it continues), main.flight_finished() ends the flight.
+
+The runtime only resumes a mission when what it waits for is satisfied: a Sleep costs a comparison per iteration, a
+WaitUntil the call of the condition. Missions written as Mission subclasses are wrapped into a generator that calls
+their methods like main.py always did (loop_run() in every iteration, sub-missions and their end via
+main.start_sub_mission() and main.mission_finished()).
+"""
+import abc
+import inspect
+import math
+
+import clock
+import Mission
+
+
+class Sleep(object):
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+
+class WaitUntil(object):
+    def __init__(self, condition, timeout=None):
+        """
+        :param condition: Function without arguments, checked once per iteration. If it raises an exception, the
+        mission ends with that exception.
+        :param timeout: Time in seconds after which the mission continues anyway, None for no timeout
+        """
+        self.condition = condition
+        self.timeout = timeout
+
+
+class SubMission(object):
+    def __init__(self, mission):
+        """
+        :param mission: Mission instance or generator
+        """
+        self.mission = mission
+
+
+class GeneratorMission(Mission.Mission):
+    """
+    Mission written as generator method run(), which is started by the runtime instead of the methods of Mission.
+    """
+
+    @abc.abstractmethod
+    def run(self, as_base):
+        """
+        The mission as generator, see the module description.
+        :param as_base: If the mission is the base mission of the flight (then it should end the flight with the
+        copter on the ground, otherwise it returns to the mission that started it)
+        """
+        pass
+
+    def _not_used(self):
+        raise RuntimeError("A GeneratorMission is run by mission_runtime through run()")
+
+    start_mission = start_as_submission = loop_run = continue_from_submission = continue_from_submission_error = \
+        _not_used
+
+
+class _Frame(object):
+    """
+    A running mission and what it waits for.
+    """
+
+    def __init__(self, generator):
+        self.generator = generator
+        self.wake_time = -math.inf
+        self.condition = None
+        self.value = None  # sent to the generator when it is resumed
+        self.error = None  # raised in the generator instead, if not None
+
+
+class MissionRuntime(object):
+    """
+    Stack of the running missions, the top one is resumed by tick().
+    """
+
+    def __init__(self, fallback=None):
+        """
+        :param fallback: Function without arguments returning the mission started if the base mission ends without
+        ending the flight (e.g. an emergency landing)
+        """
+        self._fallback = fallback
+        self._stack = []
+        self._base_mission = None
+        self._legacy_request = None
+        """
+        Sub-mission (or True for the end of the mission, an exception for its failure) requested by the Mission whose
+        method is called
+        """
+
+    def reset(self, base_mission):
+        """
+        Clears the missions of a previous flight.
+        :param base_mission: Mission or generator to start the flight with (see start())
+        :return: None
+        """
+        self._check(base_mission)
+        self._stack.clear()
+        self._legacy_request = None
+        self._base_mission = base_mission
+
+    def start(self):
+        """
+        Starts the base mission and runs it until it waits the first time. Exceptions of the mission are raised.
+        :return: None
+        """
+        frame = _Frame(self._generator(self._base_mission, True))
+        self._stack.append(frame)
+        try:
+            request = frame.generator.send(None)
+        except StopIteration as stop:
+            self._end(stop.value, None)
+        else:
+            self._wait(frame, request)
+
+    def tick(self):
+        """
+        Resumes the current mission if what it waits for is satisfied. Called once per iteration.
+        :return: None
+        """
+        if not self._stack:
+            return
+        frame = self._stack[-1]
+        try:
+            if frame.condition is None:
+                if clock.now() < frame.wake_time:
+                    return
+            elif frame.condition():
+                frame.value = True
+            elif clock.now() < frame.wake_time:
+                return
+            else:
+                frame.value = False
+            if frame.error is not None:
+                error, frame.error = frame.error, None
+                request = frame.generator.throw(error)
+            else:
+                request = frame.generator.send(frame.value)
+        except StopIteration as stop:
+            self._end(stop.value, None)
+        except Exception as ex:
+            # Something could go wrong in the mission or in the condition it waits for, the mission that started it
+            # is told. The mission ends (a generator waiting for the condition is closed, running its finally blocks).
+            print(ex)
+            frame.generator.close()
+            self._end(None, ex)
+        else:
+            self._wait(frame, request)
+
+    def _end(self, value, error):
+        self._stack.pop()
+        if self._stack:
+            frame = self._stack[-1]
+            frame.value, frame.error = value, error
+            frame.wake_time, frame.condition = -math.inf, None  # continues in the next iteration
+        elif self._fallback is not None:
+            self._stack.append(_Frame(self._generator(self._fallback(), False)))
+
+    def _wait(self, frame, request):
+        frame.value, frame.condition = None, None
+        if request is None:
+            frame.wake_time = -math.inf
+        elif isinstance(request, Sleep):
+            frame.wake_time = clock.now() + request.seconds
+        elif isinstance(request, WaitUntil):
+            frame.condition = request.condition
+            frame.wake_time = math.inf if request.timeout is None else clock.now() + request.timeout
+        elif isinstance(request, SubMission):
+            self._check(request.mission)
+            frame.wake_time = math.inf  # until the sub-mission ends
+            self._stack.append(_Frame(self._generator(request.mission, False)))  # starts in the next iteration
+        else:
+            frame.wake_time = -math.inf
+            frame.error = TypeError("A mission yielded " + repr(request))
+
+    def _check(self, mission):
+        if not (isinstance(mission, Mission.Mission) or inspect.isgenerator(mission)):
+            raise TypeError("Not a mission: " + repr(mission))
+
+    def _generator(self, mission, as_base):
+        if inspect.isgenerator(mission):
+            return mission
+        if isinstance(mission, GeneratorMission):
+            return mission.run(as_base)
+        return self._run_legacy(mission, as_base)
+
+    def _run_legacy(self, mission, as_base):
+        # Calls the methods of a Mission subclass like main.py did before the runtime
+        if as_base:
+            mission.start_mission()
+        else:
+            mission.start_as_submission()
+        while True:
+            mission.loop_run()
+            request, self._legacy_request = self._legacy_request, None
+            if request is True:
+                return
+            if isinstance(request, Exception):
+                raise request
+            if request is None:
+                yield None
+                continue
+            try:
+                yield SubMission(request)
+            except Exception:
+                mission.continue_from_submission_error()
+            else:
+                mission.continue_from_submission()
+
+    def preempt(self, mission):
+        """
+        Starts the mission on top of the running ones right away, e.g. an emergency landing by the failsafe. What the
+        current mission waits for (Sleep, WaitUntil, the end of a sub-mission or the next loop_run()) is dropped, it
+        only continues when the preempting mission ends, with that mission's return value.
+        :param mission: Mission or generator
+        :return: None
+        """
+        self._check(mission)
+        if self._stack:
+            interrupted = self._stack[-1]
+            interrupted.wake_time, interrupted.condition = math.inf, None
+        self._stack.append(_Frame(self._generator(mission, False)))
+        self.tick()  # starts it now instead of in the next iteration
+
+    def start_sub_mission(self, mission):
+        """
+        Starts the mission as sub-mission of the current Mission (see main.start_sub_mission()) after its current
+        method returned. Missions written as generator yield SubMission instead.
+        :return: None
+        """
+        self._check(mission)
+        self._legacy_request = mission
+
+    def mission_finished(self):
+        """
+        Ends the current Mission after its current method returned (see main.mission_finished()). Missions written as
+        generator return instead.
+        :return: None
+        """
+        self._legacy_request = True
+
+    def mission_error(self, error):
+        """
+        Ends the current Mission like an exception raised by it, after its current method returned.
+        :param error: The exception
+        :return: None
+        """
+        self._legacy_request = error
+
+    def get_current_mission(self):
+        """
+        :return: The generator of the mission that is currently resumed by tick(), None if there is none
+        """
+        return self._stack[-1].generator if self._stack else None
@@ -1,8 +1,7 @@
 import Mission
 import main
 import copter
-
-import time
+import clock
 
 class EmergencyLandingMission(Mission.Mission):
     """
@@ -24,11 +23,11 @@ class EmergencyLandingMission(Mission.Mission):
         self.start_mission()
 
     def loop_run(self):
-        height = copter.get_height()
+        height = copter.get_state().height
         if height <= 0.5:
             if self._low_time == 0:
-                self._low_time = time.time()
-            elif time.time() - self._low_time >= 4:
+                self._low_time = clock.now()
+            elif clock.now() - self._low_time >= 4:
                 main.flight_finished()
         elif height <= 10:
             main.set_alternative_parameters(climb_rate=-0.2)  # decent with 20cm/s
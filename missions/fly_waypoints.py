@@ -1,55 +1,102 @@
+import itertools
+
 import copter
 import control.flight_commands
 import missions.emergency_landing_mission
+from missions import waypoints
+from missions.route import Route, PathFollower, corner_speed, to_local
 import main
 import numpy as np
 import Mission
 
+_reached_distance = 2.5  # m, a waypoint is reached if the copter comes closer #todo: increase to 5 ?
+_window_size = 1024  # Waypoints compiled into a route at once
+_height = 5  # m
 
-def calculate_course(start, end):
-    """
-    Calculates the course to fly in radian from north clockwise
-    :return: radian
-    :rtype: (float, float)
-    """
-    dE = 111.3 * np.cos(start[0]) * (end[1] - start[1]) * 1000  # distance from start to copter in longitude in meter
-    dN = 111.3 * (end[0] - start[0]) * 1000  # distance from start to copter in latitude in meter
-
-    if dE == 0:
-        return np.pi * (dN < 0)  # The condition evaluates to 1 if true and 0 if false
-
-    result = np.arctan(dN / np.absolute(dE))
-
-    if dE < 0:
-        return result + (3 * np.pi / 2)
-
-    return np.pi / 2 - result
-
-
-def calculate_dist_to_waypoint(waypoint):
-    start = copter.get_coordinates()
-    dE = 111.3 * np.cos(start[0]) * (
-                waypoint[1] - start[1]) * 1000  # distance from waypoint to copter in longitude in meter
-    dN = 111.3 * (waypoint[0] - start[0]) * 1000  # distance from waypoint to copter in latitude in meter
-    return np.sqrt(dE ** 2 + dN ** 2)
+# Path following
+_max_speed = 3  # m/s
+_max_acceleration = 0.5  # m/s^2 along the route
+_max_lateral_acceleration = 0.5  # m/s^2 in the corners
+_lookahead = 4  # m
 
 
 class FlyWaypointsMission(Mission.Mission):
 
-    def __init__(self, waypointfile='waypoints_test.txt'):
+    def __init__(self, waypointfile='waypoints_test.txt', follow_path=True):
         """
         While creating this object, the current waypointfile musst be given as string
+        :param waypointfile: Text or binary waypoint file (see missions.waypoints), or an iterable of tuples (latitude,
+        longitude) in degree, e.g. a survey pattern
+        :param follow_path: Follow the lines between the waypoints continuously with a speed profile (see
+        missions.route.PathFollower). Otherwise fly to one waypoint after the other with 1 m/s, each one until it is
+        reached.
         :return: None
         """
-        self._waypoints = np.loadtxt(waypointfile) * np.pi / 180  # load waypoints to array in radians
+        # The waypoints are read as stream, window by window (see _next_window())
+        self._waypoints = waypoints.stream(waypointfile) if isinstance(waypointfile, str) else iter(waypointfile)
         self._step = -1
-        self._position = [0,0]
+        """
+        Index of the point of the route the copter flies to, -1 while climbing
+        """
+        self._route = None
+        """
+        The current window of the route: the last point of the previous window (or the starting position) and the
+        next _window_size waypoints in the local frame of the copter
+        """
+        self._follow_path = follow_path
+        self._follower = None  # PathFollower of self._route
+        self._next_waypoint = []  # The first waypoint of the next window, if it has been read already
+        self._home = None
+        self._returning = False  # If the current window is the way back to self._home
         self._is_base_mission = False
 
 
     def _start(self):
-        self._position = copter.get_coordinates()
-        self._waypoints = np.vstack((self._waypoints, self._position))  # add starting position to waypoints array
+        # The route leads from the current position over the waypoints back to it
+        state = copter.get_state()
+        self._home = (state.east, state.north)
+        self._returning = False
+        self._next_waypoint = []
+        self._next_window(self._home, state.speed)
+
+
+    def _next_window(self, first_point, speed):
+        """
+        Compiles the next waypoints into self._route, starting at first_point. After the last waypoint the window is the
+        way back home.
+        :param speed: Current speed of the copter in m/s, the speed profile starts with it
+        :return: False if the way back home has been flown already
+        """
+        # One waypoint more is read to know the corner at the end of the window
+        chunk = self._next_waypoint + list(itertools.islice(self._waypoints, _window_size + 1 - len(self._next_waypoint)))
+        self._next_waypoint = chunk[_window_size:]
+        if chunk:
+            coordinates = np.radians(chunk)
+            east, north = to_local(coordinates[:, 0], coordinates[:, 1], copter.get_start_coord())
+            points = np.column_stack((east, north))
+            next_point = points[_window_size] if len(points) > _window_size else self._home
+            points = points[:_window_size]
+        elif not self._returning:
+            points = np.array([self._home])
+            next_point = None
+            self._returning = True
+        else:
+            return False
+        self._route = Route(np.vstack((first_point, points)))
+        if self._follow_path:
+            self._follower = PathFollower(self._route, _max_speed, _max_acceleration, _max_lateral_acceleration,
+                                          _lookahead, start_speed=speed, end_speed=self._end_speed(next_point))
+        return True
+
+
+    def _end_speed(self, next_point):
+        # Highest speed at the last point of the window, in the corner towards next_point (None: stop there)
+        if next_point is None:
+            return 0.0
+        last_east, last_north = self._route.points[-1]
+        bearing = np.arctan2(next_point[0] - last_east, next_point[1] - last_north)
+        turn = abs((bearing - self._route.bearings[-1] + np.pi) % (2 * np.pi) - np.pi) if len(self._route.legs) else 0
+        return corner_speed(turn, _max_speed, _max_lateral_acceleration, _lookahead)
 
 
     def start_mission(self):
@@ -80,22 +127,30 @@ class FlyWaypointsMission(Mission.Mission):
         Called by main.py in every controlling loop. Should check if anything is to do and use set_parameters() of
         main.py to specify what the controller should make the copter do.
         """
-        self._position = copter.get_coordinates()
+        state = copter.get_state()
         
         if self._step == -1:
-            main.set_parameters(height=5, heading=copter.get_heading(), speed=0)
-            if copter.get_height() >= 2.5:
-                self._step += 1
+            main.set_parameters(height=_height, heading=state.heading, speed=0)
+            if state.height >= 2.5:
+                self._step = 1  # point 0 is the starting position
             else:
                 main.set_alternative_parameters(climb_rate=0.5)
 
-        elif self._step < np.size(self._waypoints, 0):
-            course_1 = calculate_course(self._position, self._waypoints[self._step,:])
-            main.set_parameters(height=5, course=course_1, speed=1) #todo: experiment whats highest possible speed value :)
-            if calculate_dist_to_waypoint(self._waypoints[self._step,:]) < 2.5:  #todo: increase to 5 ?
+        elif self._step < len(self._route) and self._follow_path:
+            course, speed, distance = self._follower.update(state.east, state.north)
+            main.set_parameters(height=_height, course=course, speed=speed)
+            if distance < _reached_distance:
+                self._step = 1 if self._next_window(self._route.points[-1], state.speed) else len(self._route)
+
+        elif self._step < len(self._route):
+            course, distance = self._route.course_to(self._step, state.east, state.north)
+            main.set_parameters(height=_height, course=course, speed=1) #todo: experiment whats highest possible speed value :)
+            if distance < _reached_distance:
                 self._step += 1
+                if self._step == len(self._route) and self._next_window(self._route.points[-1], state.speed):
+                    self._step = 1
 
-        elif self._step >= np.size(self._waypoints, 0):
+        elif self._step >= len(self._route):
             if self._is_base_mission:
                 main.start_sub_mission(missions.emergency_landing_mission.EmergencyLandingMission())
             else:
@@ -118,7 +173,7 @@ class FlyWaypointsMission(Mission.Mission):
         object called by main.py after the call of start_submission().
         loop_run() will be called directly afterwards, before anything is done.
         """
-        pass
+        self.rejoin()
 
 
     def continue_from_submission_error(self):
@@ -128,4 +183,20 @@ class FlyWaypointsMission(Mission.Mission):
         called if this gets called.
         loop_run() will be called directly afterwards, before anything is done.
         """
-        pass
+        self.rejoin()
+
+
+    def rejoin(self):
+        """
+        Continues the route at the leg of the current window nearest to the current position (e.g. after a sub-mission
+        flew somewhere else), flying to the end of that leg. Does nothing while climbing or after the last waypoint.
+        :return: None
+        """
+        if self._route is None or not 1 <= self._step < len(self._route):
+            return
+        state = copter.get_state()
+        leg, along, distance = self._route.nearest_leg(state.east, state.north)
+        if leg is not None:
+            self._step = leg + 1
+            if self._follow_path:
+                self._follower.leg = leg
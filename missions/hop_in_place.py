@@ -55,14 +55,15 @@ class HopInPlaceMission(Mission.Mission):
         Called by main.py in every controlling loop. Should check if anything is to do and use set_parameters() of
         main.py to specify what the controller should make the copter do.
         """
-        diff = self._target_height - copter.get_height()
+        state = copter.get_state()
+        diff = self._target_height - state.height
         if diff <= self._dh:
             main.set_parameters(height=self._target_height)
         if self._reached_time == 0:
             if abs(diff) < self._epsilon:
-                self._reached_time = copter.get_time()
+                self._reached_time = state.time
                 main.set_parameters(height=self._target_height)
-        elif copter.get_time() - self._reached_time >= self._wait_time:
+        elif state.time - self._reached_time >= self._wait_time:
             main.start_sub_mission(emergency.EmergencyLandingMission())
 
     def continue_from_submission(self):
@@ -0,0 +1,346 @@
+"""
+Routes of waypoints compiled into the local frame of the copter (east, north in meters from the starting point, like
+copter.get_coordinates_relative()): the legs between the waypoints with their vectors, lengths and bearings are
+calculated once, so following the route takes only a few float operations per iteration. A grid of the legs finds the
+leg nearest to a position without looking at all of them, e.g. to re-join a long survey route.
+"""
+import math
+
+import numpy as np
+
+_meters_per_radian = 111300 * 180 / np.pi
+
+
+def to_local(latitudes, longitudes, origin):
+    """
+    Equirectangular projection around the origin, exact enough for the few kilometers of a flight.
+    :param latitudes: Latitudes in radian (scalar or array)
+    :param longitudes: Longitudes in radian (scalar or array)
+    :param origin: Tuple (latitude, longitude) of the origin in radian, e.g. copter.get_start_coord()
+    :return: Tuple (east, north) in meters from the origin
+    """
+    east = _meters_per_radian * np.cos(origin[0]) * (np.asarray(longitudes) - origin[1])
+    north = _meters_per_radian * (np.asarray(latitudes) - origin[0])
+    return east, north
+
+
+def from_local(east, north, origin):
+    """
+    Inverse of to_local().
+    :param east: Distance east of the origin in meters (scalar or array)
+    :param north: Distance north of the origin in meters (scalar or array)
+    :param origin: Tuple (latitude, longitude) of the origin in radian
+    :return: Tuple (latitude, longitude) in radian
+    """
+    latitudes = origin[0] + np.asarray(north) / _meters_per_radian
+    longitudes = origin[1] + np.asarray(east) / (_meters_per_radian * np.cos(origin[0]))
+    return latitudes, longitudes
+
+
+class Route(object):
+    """
+    Waypoints in the local frame and the legs between them: leg i goes from point i to point i + 1.
+    """
+
+    def __init__(self, points, cell_size=None):
+        """
+        :param points: Array (n x 2) of the waypoints (east, north) in meters, at least one
+        :param cell_size: Size in meters of the cells of the grid of the legs, the median leg length if None
+        """
+        self.points = np.array(points, dtype=float).reshape(-1, 2)
+        if len(self.points) == 0:
+            raise ValueError("A route needs at least one point")
+        self.legs = np.diff(self.points, axis=0)
+        """
+        Vectors (east, north) from the start to the end of each leg in meters
+        """
+        self.lengths = np.hypot(self.legs[:, 0], self.legs[:, 1])
+        self.bearings = np.arctan2(self.legs[:, 0], self.legs[:, 1]) % (2 * np.pi)
+        """
+        Bearing of each leg in radian from north clockwise
+        """
+        self.directions = np.divide(self.legs, self.lengths[:, np.newaxis], out=np.zeros_like(self.legs),
+                                    where=self.lengths[:, np.newaxis] > 0)
+        """
+        Unit vectors of the legs, 0 for legs of length 0
+        """
+        self.distances = np.concatenate(([0.0], np.cumsum(self.lengths)))
+        """
+        Distance along the route from the first point to each point in meters
+        """
+        self._east, self._north = self.points[:, 0].tolist(), self.points[:, 1].tolist()
+        self._direction_list, self._length_list = self.directions.tolist(), self.lengths.tolist()
+        if cell_size is None:
+            cell_size = float(np.median(self.lengths)) if len(self.lengths) > 0 else 1.0
+        self._grid = _LegGrid(self.points, max(cell_size, 1.0))
+
+    @classmethod
+    def from_coordinates(cls, coordinates, origin, **kwargs):
+        """
+        :param coordinates: Array (n x 2) of the waypoints (latitude, longitude) in radian
+        :param origin: Tuple (latitude, longitude) of the origin of the local frame in radian
+        :return: The route in the local frame around origin
+        """
+        coordinates = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+        east, north = to_local(coordinates[:, 0], coordinates[:, 1], origin)
+        return cls(np.column_stack((east, north)), **kwargs)
+
+    def __len__(self):
+        """
+        :return: Number of points
+        """
+        return len(self.points)
+
+    def course_to(self, index, east, north):
+        """
+        :param index: Index of the point
+        :param east: Position east in meters
+        :param north: Position north in meters
+        :return: Tuple (course from north clockwise within [0, 2pi), distance in meters) from the position to the point
+        """
+        delta_east, delta_north = self._east[index] - east, self._north[index] - north
+        return math.atan2(delta_east, delta_north) % (2 * math.pi), math.hypot(delta_east, delta_north)
+
+    def speed_profile(self, max_speed, max_acceleration, max_lateral_acceleration, lookahead, start_speed=0.0,
+                      end_speed=0.0):
+        """
+        Highest speeds at the points, so that the copter can slow down in time for every corner and stops at the end.
+        :param max_speed: Highest speed in m/s
+        :param max_acceleration: Highest acceleration and deceleration along the route in m/s^2
+        :param max_lateral_acceleration: Highest acceleration in the corners in m/s^2, see corner_speed()
+        :param lookahead: Lookahead distance of the PathFollower in meters, see corner_speed()
+        :param start_speed: Speed at the first point in m/s
+        :param end_speed: Speed at the last point in m/s
+        :return: Array of the speeds at the points in m/s
+        :rtype: np.ndarray
+        """
+        speeds = np.full(len(self.points), float(max_speed))
+        turns = np.abs((np.diff(self.bearings) + np.pi) % (2 * np.pi) - np.pi)
+        turns[(self.lengths[:-1] == 0) | (self.lengths[1:] == 0)] = 0  # legs of length 0 have no bearing
+        speeds[1:-1] = [corner_speed(turn, max_speed, max_lateral_acceleration, lookahead) for turn in turns]
+        speeds[0] = min(start_speed, max_speed)
+        speeds[-1] = min(end_speed, max_speed)
+        lengths = self.lengths.tolist()
+        for point in range(1, len(speeds)):
+            speeds[point] = min(speeds[point], math.sqrt(speeds[point - 1] ** 2 + 2 * max_acceleration * lengths[point - 1]))
+        for point in range(len(speeds) - 2, -1, -1):
+            speeds[point] = min(speeds[point], math.sqrt(speeds[point + 1] ** 2 + 2 * max_acceleration * lengths[point]))
+        return speeds
+
+    def nearest_leg(self, east, north):
+        """
+        :param east: Position east in meters
+        :param north: Position north in meters
+        :return: Tuple (index of the leg nearest to the position, distance along the leg to the nearest point on it,
+        distance from the position to the leg) in meters, the index is None if the route has only one point
+        """
+        if len(self.legs) == 0:
+            return None, 0.0, math.hypot(east - self._east[0], north - self._north[0])
+        return self._grid.nearest(east, north, self._distance_to_leg)
+
+    def _distance_to_leg(self, leg, east, north):
+        # Tuple (distance along the leg to the point on it nearest to the position, distance to that point)
+        offset_east, offset_north = east - self._east[leg], north - self._north[leg]
+        direction_east, direction_north = self._direction_list[leg]
+        along = min(max(offset_east * direction_east + offset_north * direction_north, 0.0), self._length_list[leg])
+        return along, math.hypot(offset_east - along * direction_east, offset_north - along * direction_north)
+
+    def nearest_leg_exhaustive(self, east, north):
+        """
+        Like nearest_leg(), but looking at all legs (vectorized), to check the grid.
+        """
+        if len(self.legs) == 0:
+            return self.nearest_leg(east, north)
+        offsets = np.array((east, north)) - self.points[:-1]
+        along = np.clip(np.sum(offsets * self.directions, axis=1), 0, self.lengths)
+        distances = np.hypot(*(offsets - along[:, np.newaxis] * self.directions).T)
+        leg = int(np.argmin(distances))
+        return leg, float(along[leg]), float(distances[leg])
+
+
+def corner_speed(turn, max_speed, max_lateral_acceleration, lookahead):
+    """
+    Following the route with a lookahead distance cuts a corner on an arc of about lookahead / (2 sin(turn / 2))
+    radius, the speed is limited by the centripetal acceleration on it.
+    :param turn: Change of the bearing at the corner in radian within [0, pi]
+    :return: Highest speed in the corner in m/s
+    :rtype: float
+    """
+    if turn <= 0:
+        return max_speed
+    radius = lookahead / (2 * math.sin(turn / 2))
+    return min(max_speed, math.sqrt(max_lateral_acceleration * radius))
+
+
+class PathFollower(object):
+    """
+    Pure pursuit along a Route: the course leads to the point lookahead meters further along the route than the
+    position projected onto it, the speed is the highest one allowed by the speed profile at the position (from which
+    the copter can still slow down to the speed at the end of the leg). Each update() takes a few float operations.
+    """
+
+    def __init__(self, route, max_speed, max_acceleration, max_lateral_acceleration, lookahead, start_speed=0.0,
+                 end_speed=0.0):
+        """
+        :param route: The Route to follow, with at least one leg
+        :param lookahead: Distance in meters along the route to the point the course leads to
+        The other parameters are passed on to Route.speed_profile().
+        """
+        if len(route.legs) == 0:
+            raise ValueError("A route to follow needs at least one leg")
+        self._route = route
+        self.speeds = route.speed_profile(max_speed, max_acceleration, max_lateral_acceleration, lookahead,
+                                          start_speed, end_speed)
+        """
+        Speed profile, the highest speeds at the points of the route in m/s
+        """
+        self._speeds = self.speeds.tolist()
+        self._max_speed = max_speed
+        self._max_acceleration = max_acceleration
+        self._lookahead = lookahead
+        self._east, self._north = route.points[:, 0].tolist(), route.points[:, 1].tolist()
+        self._directions, self._lengths = route.directions.tolist(), route.lengths.tolist()
+        self._total_length = float(route.distances[-1])
+        self._distances = route.distances.tolist()
+        self.leg = 0
+        """
+        Index of the leg the copter is on, only increases by update() (set it to re-join the route elsewhere)
+        """
+
+    def update(self, east, north):
+        """
+        :param east: Position east in meters
+        :param north: Position north in meters
+        :return: Tuple (course from north clockwise within [0, 2pi), speed in m/s, distance to the end of the route along
+        it in meters)
+        """
+        last = len(self._lengths) - 1
+        leg = self.leg
+        while True:  # project onto the current leg, moving on to the next one after passing its end
+            direction_east, direction_north = self._directions[leg]
+            along = (east - self._east[leg]) * direction_east + (north - self._north[leg]) * direction_north
+            if along < self._lengths[leg] or leg == last:
+                break
+            leg += 1
+        self.leg = leg
+        along = min(max(along, 0.0), self._lengths[leg])
+
+        target_leg, target_along = leg, along + self._lookahead
+        while target_along > self._lengths[target_leg] and target_leg < last:
+            target_along -= self._lengths[target_leg]
+            target_leg += 1
+        target_along = min(target_along, self._lengths[target_leg])
+        direction_east, direction_north = self._directions[target_leg]
+        course = math.atan2(self._east[target_leg] + target_along * direction_east - east,
+                            self._north[target_leg] + target_along * direction_north - north) % (2 * math.pi)
+
+        speed = min(self._max_speed, math.sqrt(self._speeds[leg + 1] ** 2 +
+                                               2 * self._max_acceleration * (self._lengths[leg] - along)))
+        return course, speed, self._total_length - self._distances[leg] - along
+
+
+class _LegGrid(object):
+    """
+    Square cells of the local frame with the legs passing through each of them. The nearest leg is searched in rings of
+    cells around the position, until no leg outside the rings can be nearer, which on a route of many short legs
+    takes a few cells only, independent of the number of legs.
+    """
+
+    def __init__(self, points, cell_size):
+        self._cell_size = cell_size
+        self._cells = {}
+        cells = points / cell_size
+        for leg in range(len(points) - 1):
+            (x0, y0), (x1, y1) = cells[leg].tolist(), cells[leg + 1].tolist()
+            if x0 > x1:
+                (x0, y0), (x1, y1) = (x1, y1), (x0, y0)
+            # The cells of a straight leg within a column are consecutive, from where it enters to where it leaves
+            for column in range(math.floor(x0), math.floor(x1) + 1):
+                if x1 == x0:
+                    y_start, y_end = y0, y1
+                else:
+                    slope = (y1 - y0) / (x1 - x0)
+                    y_start = y0 + (max(x0, column) - x0) * slope
+                    y_end = y0 + (min(x1, column + 1) - x0) * slope
+                for row in range(math.floor(min(y_start, y_end)), math.floor(max(y_start, y_end)) + 1):
+                    self._cells.setdefault((column, row), []).append(leg)
+        self._lowest = np.floor(cells.min(axis=0)).astype(int).tolist()
+        self._highest = np.floor(cells.max(axis=0)).astype(int).tolist()
+
+    def _ring(self, column, row, radius):
+        # The cells at Chebyshev distance radius around (column, row) within the bounding box of the legs
+        (lowest_x, lowest_y), (highest_x, highest_y) = self._lowest, self._highest
+        if radius == 0:
+            yield column, row
+            return
+        for y in (row - radius, row + radius):
+            if lowest_y <= y <= highest_y:
+                for x in range(max(column - radius, lowest_x), min(column + radius, highest_x) + 1):
+                    yield x, y
+        for x in (column - radius, column + radius):
+            if lowest_x <= x <= highest_x:
+                for y in range(max(row - radius + 1, lowest_y), min(row + radius - 1, highest_y) + 1):
+                    yield x, y
+
+    def nearest(self, east, north, distance_to_leg):
+        """
+        :param distance_to_leg: Function (leg, east, north) -> (distance along the leg, distance to the leg)
+        :return: Tuple (leg, distance along the leg, distance to the leg) of the nearest leg
+        """
+        column, row = math.floor(east / self._cell_size), math.floor(north / self._cell_size)
+        # All cells with legs are within max_radius, the ones nearer than min_radius are empty
+        min_radius = max(self._lowest[0] - column, column - self._highest[0], self._lowest[1] - row,
+                         row - self._highest[1], 0)
+        max_radius = max(column - self._lowest[0], self._highest[0] - column, row - self._lowest[1],
+                         self._highest[1] - row)
+        best = (None, 0.0, math.inf)
+        visited = set()
+        for radius in range(min_radius, max_radius + 1):
+            for cell in self._ring(column, row, radius):
+                for leg in self._cells.get(cell, ()):
+                    if leg not in visited:
+                        visited.add(leg)
+                        along, distance = distance_to_leg(leg, east, north)
+                        if distance < best[2]:
+                            best = (leg, along, distance)
+            # Legs not visited yet are only in cells outside this ring, at least radius cells away
+            if best[2] <= radius * self._cell_size:
+                break
+        return best
+
+
+if __name__ == "__main__":
+    # Microbenchmark (from the repository root: python -m missions.route)
+    import time
+
+    generator = np.random.default_rng(0)
+    columns, rows = np.meshgrid(np.arange(100) * 10.0, np.arange(100) * 5.0, indexing='ij')
+    rows[1::2] = rows[1::2, ::-1]  # lawnmower pattern of 10,000 points
+    survey = np.column_stack((columns.ravel(), rows.ravel()))
+    start_time = time.perf_counter()
+    route = Route(survey)
+    compile_duration = time.perf_counter() - start_time
+    positions = survey[generator.integers(0, len(survey), 1000)] + generator.normal(0, 20, (1000, 2))
+    start_time = time.perf_counter()
+    for east, north in positions:
+        route.nearest_leg(east, north)
+    grid_duration = (time.perf_counter() - start_time) / len(positions)
+    start_time = time.perf_counter()
+    for east, north in positions:
+        route.nearest_leg_exhaustive(east, north)
+    exhaustive_duration = (time.perf_counter() - start_time) / len(positions)
+    start_time = time.perf_counter()
+    for east, north in positions:
+        route.course_to(5000, east, north)
+    course_duration = (time.perf_counter() - start_time) / len(positions)
+    start_time = time.perf_counter()
+    follower = PathFollower(route, 3, 0.5, 0.5, 4)
+    profile_duration = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    for east, north in survey[:1000] + generator.normal(0, 1, (1000, 2)):
+        follower.update(east, north)
+    follow_duration = (time.perf_counter() - start_time) / 1000
+    print("Route of %d points compiled in %.1f ms" % (len(route), compile_duration * 1000))
+    print("nearest_leg(): %.1f us, exhaustive: %.1f us" % (grid_duration * 1e6, exhaustive_duration * 1e6))
+    print("course_to(): %.2f us" % (course_duration * 1e6))
+    print("Speed profile in %.1f ms, PathFollower.update(): %.2f us" % (profile_duration * 1000, follow_duration * 1e6))
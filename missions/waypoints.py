@@ -0,0 +1,206 @@
+"""
+Waypoint files and survey patterns, all consumed as streams so that routes of any length never have to be loaded at
+once.
+
+Text files have one waypoint per line, latitude and longitude in degrees separated by whitespace (lines starting with
+# are comments), like waypoints_test.txt. Binary files (extension .wpt) are a plain array of WAYPOINT_DTYPE, opened
+with np.memmap, so only the part that is read is loaded.
+
+The survey patterns lawnmower() and spiral() generate points in the local frame (east, north in meters, see
+missions.route) lazily, one after another.
+
+Usage (from the repository root):
+    python -m missions.waypoints convert waypoints.txt route.wpt
+    python -m missions.waypoints lawnmower polygon.txt spacing route.wpt [angle in degree]
+    python -m missions.waypoints spiral polygon.txt spacing route.wpt
+The polygon is given as waypoint file of its corners.
+"""
+import itertools
+import math
+import os
+
+import numpy as np
+
+from missions.route import to_local, from_local
+
+WAYPOINT_DTYPE = np.dtype([
+    ("latitude", "<f8"),  # degree
+    ("longitude", "<f8"),  # degree
+])
+BINARY_EXTENSION = ".wpt"
+_chunk_size = 4096  # Waypoints read or written at once
+
+
+def open_binary(path):
+    """
+    :param path: Binary waypoint file
+    :return: Read-only memory-mapped array of WAYPOINT_DTYPE
+    :rtype: np.ndarray
+    """
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=WAYPOINT_DTYPE)  # an empty file can't be mapped
+    return np.memmap(path, dtype=WAYPOINT_DTYPE, mode="r")
+
+
+def write_binary(path, waypoints):
+    """
+    Writes the waypoints chunk by chunk, so they can come from a generator of any length.
+    :param path: Binary waypoint file to write
+    :param waypoints: Iterable of tuples (latitude, longitude) in degree
+    :return: Number of waypoints written
+    :rtype: int
+    """
+    waypoints = iter(waypoints)
+    count = 0
+    with open(path, 'wb') as binary_file:
+        while True:
+            chunk = list(itertools.islice(waypoints, _chunk_size))
+            if not chunk:
+                return count
+            binary_file.write(np.array(chunk, dtype="<f8").tobytes())
+            count += len(chunk)
+
+
+def stream(path):
+    """
+    Opens a waypoint file (errors are raised here, not while reading).
+    :param path: Binary (extension .wpt) or text waypoint file
+    :return: Generator of tuples (latitude, longitude) in degree
+    """
+    if path.endswith(BINARY_EXTENSION):
+        return _stream_array(open_binary(path))
+    return _stream_text(open(path))
+
+
+def _stream_array(waypoints):
+    for start in range(0, len(waypoints), _chunk_size):
+        yield from waypoints[start:start + _chunk_size].tolist()
+
+
+def _stream_text(text_file):
+    with text_file:
+        for line in text_file:
+            values = line.split('#', 1)[0].split()
+            if values:
+                yield float(values[0]), float(values[1])
+
+
+def convert(text_path, binary_path):
+    """
+    Converts a text waypoint file to a binary one without loading it completely.
+    :return: Number of waypoints
+    :rtype: int
+    """
+    return write_binary(binary_path, stream(text_path))
+
+
+def to_coordinates(points, origin):
+    """
+    :param points: Iterable of tuples (east, north) in meters, e.g. from lawnmower() or spiral()
+    :param origin: Tuple (latitude, longitude) of the origin of the local frame in degree
+    :return: Generator of tuples (latitude, longitude) in degree, e.g. for write_binary()
+    """
+    origin = np.radians(origin)
+    points = iter(points)
+    while True:
+        chunk = np.array(list(itertools.islice(points, _chunk_size)), dtype=float).reshape(-1, 2)
+        if len(chunk) == 0:
+            return
+        latitudes, longitudes = from_local(chunk[:, 0], chunk[:, 1], origin)
+        yield from zip(np.degrees(latitudes).tolist(), np.degrees(longitudes).tolist())
+
+
+def polygon_to_local(corners):
+    """
+    :param corners: Iterable of tuples (latitude, longitude) in degree, e.g. from stream()
+    :return: Tuple (array (n x 2) of the corners (east, north) in meters, origin (latitude, longitude) in degree), the
+    origin is the first corner
+    """
+    corners = np.array(list(corners), dtype=float).reshape(-1, 2)
+    east, north = to_local(np.radians(corners[:, 0]), np.radians(corners[:, 1]), np.radians(corners[0]))
+    return np.column_stack((east, north)), tuple(corners[0])
+
+
+def lawnmower(polygon, spacing, angle=0.0):
+    """
+    Parallel lines over the polygon flown back and forth (boustrophedon), centered in the polygon. Concave polygons
+    give several pieces per line, the copter flies straight from one to the next.
+    :param polygon: Array (n x 2) of the corners (east, north) in meters
+    :param spacing: Distance between the lines in meters
+    :param angle: Direction of the lines in radian from north clockwise
+    :return: Generator of the points (east, north) in meters where the lines start and end
+    """
+    polygon = np.asarray(polygon, dtype=float)
+    along_direction = (math.sin(angle), math.cos(angle))
+    across_direction = (math.cos(angle), -math.sin(angle))
+    along = (polygon @ along_direction).tolist()
+    across = (polygon @ across_direction).tolist()
+    lowest, highest = min(across), max(across)
+    lines = max(math.ceil((highest - lowest) / spacing), 1)
+    first = (lowest + highest) / 2 - (lines - 1) * spacing / 2
+    edges = list(zip(range(len(polygon)), list(range(1, len(polygon))) + [0]))
+    for line in range(lines):
+        offset = first + line * spacing
+        crossings = sorted(along[i] + (offset - across[i]) * (along[j] - along[i]) / (across[j] - across[i])
+                           for i, j in edges if (across[i] <= offset < across[j]) or (across[j] <= offset < across[i]))
+        if line % 2 == 1:
+            crossings.reverse()
+        for position in crossings:
+            yield (position * along_direction[0] + offset * across_direction[0],
+                   position * along_direction[1] + offset * across_direction[1])
+
+
+def spiral(polygon, spacing):
+    """
+    Archimedean spiral from the center of the polygon outwards with the given distance between the turns, sampled
+    about every spacing meters. Only the points within the polygon are given, so for convex polygons the straight
+    lines between them stay within it.
+    :param polygon: Array (n x 2) of the corners (east, north) in meters
+    :param spacing: Distance between the turns and between the points in meters
+    :return: Generator of the points (east, north) in meters
+    """
+    polygon = np.asarray(polygon, dtype=float)
+    center_east, center_north = polygon.mean(axis=0).tolist()
+    max_radius = float(np.max(np.hypot(polygon[:, 0] - center_east, polygon[:, 1] - center_north)))
+    growth = spacing / (2 * math.pi)  # radius per radian
+    corners = polygon.tolist()
+    angle = 0.0
+    while growth * angle <= max_radius:
+        radius = growth * angle
+        point = (center_east + radius * math.sin(angle), center_north + radius * math.cos(angle))
+        if _contains(corners, point):
+            yield point
+        angle += min(spacing / math.hypot(radius, growth), math.pi / 4)
+
+
+def _contains(corners, point):
+    # Ray casting: the number of edges crossed by a ray from the point to the east is odd inside the polygon
+    east, north = point
+    inside = False
+    previous_east, previous_north = corners[-1]
+    for corner_east, corner_north in corners:
+        if (corner_north > north) != (previous_north > north) and \
+                east < corner_east + (north - corner_north) * (previous_east - corner_east) / (previous_north - corner_north):
+            inside = not inside
+        previous_east, previous_north = corner_east, corner_north
+    return inside
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    start_time = time.perf_counter()
+    if command == "convert":
+        count = convert(sys.argv[2], sys.argv[3])
+    elif command in ("lawnmower", "spiral"):
+        polygon, origin = polygon_to_local(stream(sys.argv[2]))
+        spacing = float(sys.argv[3])
+        points = lawnmower(polygon, spacing, math.radians(float(sys.argv[5])) if len(sys.argv) > 5 else 0.0) \
+            if command == "lawnmower" else spiral(polygon, spacing)
+        count = write_binary(sys.argv[4], to_coordinates(points, origin))
+    else:
+        print(__doc__)
+        sys.exit(1)
+    print("Wrote %d waypoints in %.2f s." % (count, time.perf_counter() - start_time))
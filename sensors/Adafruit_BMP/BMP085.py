@@ -20,8 +20,11 @@
 # THE SOFTWARE.
 from __future__ import division
 import logging
+import struct
 import time
 
+import numpy as np
+
 
 # BMP085 default address.
 BMP085_I2CADDR           = 0x77
@@ -53,13 +56,35 @@ BMP085_READTEMPCMD       = 0x2E
 BMP085_READPRESSURECMD   = 0x34
 
 
+# Conversion times in seconds
+BMP085_TEMP_DELAY        = 0.005
+BMP085_PRESSURE_DELAYS   = {BMP085_ULTRALOWPOWER: 0.005, BMP085_STANDARD: 0.008, BMP085_HIGHRES: 0.014,
+                            BMP085_ULTRAHIGHRES: 0.026}
+
+# Conversions of the non-blocking interface (start_conversion() and poll())
+_CONVERSION_NONE         = 0
+_CONVERSION_TEMP         = 1
+_CONVERSION_PRESSURE     = 2
+
+
 class BMP085(object):
-    def __init__(self, mode=BMP085_ULTRAHIGHRES, address=BMP085_I2CADDR, i2c=None, **kwargs):
+    def __init__(self, mode=BMP085_ULTRAHIGHRES, address=BMP085_I2CADDR, i2c=None, temperature_interval=10,
+                 temperature_max_age=1.0, **kwargs):
+        """temperature_interval and temperature_max_age set how often poll() refreshes the temperature: after that
+        many pressure samples or when the last temperature reading is older than that many seconds."""
         self._logger = logging.getLogger('Adafruit_BMP.BMP085')
         # Check that mode is valid.
         if mode not in [BMP085_ULTRALOWPOWER, BMP085_STANDARD, BMP085_HIGHRES, BMP085_ULTRAHIGHRES]:
             raise ValueError('Unexpected mode value {0}.  Set mode to one of BMP085_ULTRALOWPOWER, BMP085_STANDARD, BMP085_HIGHRES, or BMP085_ULTRAHIGHRES'.format(mode))
         self._mode = mode
+        # State of the non-blocking interface.
+        self._temperature_interval = temperature_interval
+        self._temperature_max_age = temperature_max_age
+        self._conversion = _CONVERSION_NONE
+        self._ready_time = 0
+        self._B5 = None
+        self._B5_time = 0
+        self._pressure_samples = 0
         # Create I2C device.
         if i2c is None:
             import Adafruit_GPIO.I2C as I2C
@@ -69,17 +94,11 @@ class BMP085(object):
         self._load_calibration()
 
     def _load_calibration(self):
-        self.cal_AC1 = self._device.readS16BE(BMP085_CAL_AC1)   # INT16
-        self.cal_AC2 = self._device.readS16BE(BMP085_CAL_AC2)   # INT16
-        self.cal_AC3 = self._device.readS16BE(BMP085_CAL_AC3)   # INT16
-        self.cal_AC4 = self._device.readU16BE(BMP085_CAL_AC4)   # UINT16
-        self.cal_AC5 = self._device.readU16BE(BMP085_CAL_AC5)   # UINT16
-        self.cal_AC6 = self._device.readU16BE(BMP085_CAL_AC6)   # UINT16
-        self.cal_B1 = self._device.readS16BE(BMP085_CAL_B1)     # INT16
-        self.cal_B2 = self._device.readS16BE(BMP085_CAL_B2)     # INT16
-        self.cal_MB = self._device.readS16BE(BMP085_CAL_MB)     # INT16
-        self.cal_MC = self._device.readS16BE(BMP085_CAL_MC)     # INT16
-        self.cal_MD = self._device.readS16BE(BMP085_CAL_MD)     # INT16
+        # All 11 calibration values (22 bytes from BMP085_CAL_AC1 to BMP085_CAL_MD) in one block transfer.
+        (self.cal_AC1, self.cal_AC2, self.cal_AC3,      # INT16
+         self.cal_AC4, self.cal_AC5, self.cal_AC6,      # UINT16
+         self.cal_B1, self.cal_B2, self.cal_MB, self.cal_MC, self.cal_MD  # INT16
+         ) = struct.unpack('>hhhHHHhhhhh', bytes(self._device.readList(BMP085_CAL_AC1, 22)))
         self._logger.debug('AC1 = {0:6d}'.format(self.cal_AC1))
         self._logger.debug('AC2 = {0:6d}'.format(self.cal_AC2))
         self._logger.debug('AC3 = {0:6d}'.format(self.cal_AC3))
@@ -110,7 +129,7 @@ class BMP085(object):
     def read_raw_temp(self):
         """Reads the raw (uncompensated) temperature from the sensor."""
         self._device.write8(BMP085_CONTROL, BMP085_READTEMPCMD)
-        time.sleep(0.005)  # Wait 5ms
+        time.sleep(BMP085_TEMP_DELAY)  # Wait 5ms
         raw = self._device.readU16BE(BMP085_TEMPDATA)
         self._logger.debug('Raw temp 0x{0:X} ({1})'.format(raw & 0xFFFF, raw))
         return raw
@@ -118,17 +137,12 @@ class BMP085(object):
     def read_raw_pressure(self):
         """Reads the raw (uncompensated) pressure level from the sensor."""
         self._device.write8(BMP085_CONTROL, BMP085_READPRESSURECMD + (self._mode << 6))
-        if self._mode == BMP085_ULTRALOWPOWER:
-            time.sleep(0.005)
-        elif self._mode == BMP085_HIGHRES:
-            time.sleep(0.014)
-        elif self._mode == BMP085_ULTRAHIGHRES:
-            time.sleep(0.026)
-        else:
-            time.sleep(0.008)
-        msb = self._device.readU8(BMP085_PRESSUREDATA)
-        lsb = self._device.readU8(BMP085_PRESSUREDATA+1)
-        xlsb = self._device.readU8(BMP085_PRESSUREDATA+2)
+        time.sleep(BMP085_PRESSURE_DELAYS[self._mode])
+        return self._read_raw_pressure_data()
+
+    def _read_raw_pressure_data(self):
+        """Reads the result of a finished pressure conversion (MSB, LSB and XLSB in one block transfer)."""
+        msb, lsb, xlsb = self._device.readList(BMP085_PRESSUREDATA, 3)
         raw = ((msb << 16) + (lsb << 8) + xlsb) >> (8 - self._mode)
         self._logger.debug('Raw pressure 0x{0:04X} ({1})'.format(raw & 0xFFFF, raw))
         return raw
@@ -138,10 +152,7 @@ class BMP085(object):
         UT = self.read_raw_temp()
         # Datasheet value for debugging:
         #UT = 27898
-        # Calculations below are taken straight from section 3.5 of the datasheet.
-        X1 = ((UT - self.cal_AC6) * self.cal_AC5) >> 15
-        X2 = (self.cal_MC << 11) // (X1 + self.cal_MD)
-        B5 = X1 + X2
+        B5 = self._calculate_B5(UT)
         temp = ((B5 + 8) >> 4) / 10.0
         self._logger.debug('Calibrated temperature {0} C'.format(temp))
         return temp
@@ -153,12 +164,20 @@ class BMP085(object):
         # Datasheet values for debugging:
         #UT = 27898
         #UP = 23843
+        return self._calculate_pressure(UP, self._calculate_B5(UT))
+
+    def _calculate_B5(self, UT):
+        """Calculates the true temperature coefficient B5 from the raw temperature."""
         # Calculations below are taken straight from section 3.5 of the datasheet.
-        # Calculate true temperature coefficient B5.
         X1 = ((UT - self.cal_AC6) * self.cal_AC5) >> 15
         X2 = (self.cal_MC << 11) // (X1 + self.cal_MD)
         B5 = X1 + X2
         self._logger.debug('B5 = {0}'.format(B5))
+        return B5
+
+    def _calculate_pressure(self, UP, B5):
+        """Calculates the compensated pressure in Pascals from the raw pressure and B5."""
+        # Calculations below are taken straight from section 3.5 of the datasheet.
         # Pressure Calculations
         B6 = B5 - 4000
         self._logger.debug('B6 = {0}'.format(B6))
@@ -185,6 +204,98 @@ class BMP085(object):
         self._logger.debug('Pressure {0} Pa'.format(p))
         return p
 
+    def read_raw_pressures(self, count):
+        """Reads count raw (uncompensated) pressure levels in a row. Returns a NumPy array."""
+        data = np.empty((count, 3), dtype=np.int64)
+        for i in range(count):
+            self._device.write8(BMP085_CONTROL, BMP085_READPRESSURECMD + (self._mode << 6))
+            time.sleep(BMP085_PRESSURE_DELAYS[self._mode])
+            data[i] = list(self._device.readList(BMP085_PRESSUREDATA, 3))
+        return ((data[:, 0] << 16) + (data[:, 1] << 8) + data[:, 2]) >> (8 - self._mode)
+
+    def calculate_pressures(self, UT, UP):
+        """Compensates whole arrays of raw temperatures UT and raw pressures UP at once
+        (the same calculation as read_pressure(), vectorized with NumPy; UT can also be a
+        single value used for all UP). Returns the pressures in Pascals as NumPy array."""
+        UT = np.asarray(UT, dtype=np.int64)
+        UP = np.asarray(UP, dtype=np.int64)
+        # Calculations below are taken straight from section 3.5 of the datasheet.
+        X1 = ((UT - self.cal_AC6) * self.cal_AC5) >> 15
+        X2 = (self.cal_MC << 11) // (X1 + self.cal_MD)
+        B5 = X1 + X2
+        B6 = B5 - 4000
+        X1 = (self.cal_B2 * (B6 * B6) >> 12) >> 11
+        X2 = (self.cal_AC2 * B6) >> 11
+        X3 = X1 + X2
+        B3 = (((self.cal_AC1 * 4 + X3) << self._mode) + 2) // 4
+        X1 = (self.cal_AC3 * B6) >> 13
+        X2 = (self.cal_B1 * ((B6 * B6) >> 12)) >> 16
+        X3 = ((X1 + X2) + 2) >> 2
+        B4 = (self.cal_AC4 * (X3 + 32768)) >> 15
+        B7 = (UP - B3) * (50000 >> self._mode)
+        p = np.where(B7 < 0x80000000, (B7 * 2) // B4, (B7 // B4) * 2)
+        X1 = (p >> 8) * (p >> 8)
+        X1 = (X1 * 3038) >> 16
+        X2 = (-7357 * p) >> 16
+        return p + ((X1 + X2 + 3791) >> 4)
+
+    @staticmethod
+    def calculate_altitudes(pressures, sealevel_pa=101325.0):
+        """Calculates the altitudes in meters for an array of pressures in Pascals (like
+        read_altitude(), vectorized with NumPy)."""
+        return 44330.0 * (1.0 - np.power(np.asarray(pressures, dtype=float) / sealevel_pa, 1.0/5.255))
+
+    def read_altitudes(self, count, sealevel_pa=101325.0):
+        """Reads count altitudes in meters in a row, e.g. for averaging. The temperature is
+        read once for the whole batch. Returns a NumPy array."""
+        UT = self.read_raw_temp()
+        UP = self.read_raw_pressures(count)
+        return self.calculate_altitudes(self.calculate_pressures(UT, UP), sealevel_pa)
+
+    def start_conversion(self):
+        """Starts the next conversion without waiting for it: a temperature conversion if
+        the cached temperature is due to be refreshed, otherwise a pressure conversion.
+        The result is collected by poll(). Don't mix with the blocking read functions."""
+        now = time.monotonic()
+        if (self._B5 is None or self._pressure_samples >= self._temperature_interval
+                or now - self._B5_time >= self._temperature_max_age):
+            self._device.write8(BMP085_CONTROL, BMP085_READTEMPCMD)
+            self._conversion = _CONVERSION_TEMP
+            self._ready_time = now + BMP085_TEMP_DELAY
+        else:
+            self._device.write8(BMP085_CONTROL, BMP085_READPRESSURECMD + (self._mode << 6))
+            self._conversion = _CONVERSION_PRESSURE
+            self._ready_time = now + BMP085_PRESSURE_DELAYS[self._mode]
+
+    def time_until_ready(self):
+        """Returns the time in seconds until the running conversion is finished (0 if it
+        is finished or none is running)."""
+        if self._conversion == _CONVERSION_NONE:
+            return 0
+        return max(self._ready_time - time.monotonic(), 0)
+
+    def poll(self):
+        """Never waits: collects the result of the running conversion if it is finished
+        and starts the next one (or starts one if none is running). Returns the
+        compensated pressure in Pascals if a pressure conversion was collected, otherwise
+        None. The temperature coefficient B5 is cached between temperature conversions."""
+        if self._conversion == _CONVERSION_NONE:
+            self.start_conversion()
+            return None
+        if time.monotonic() < self._ready_time:
+            return None
+        if self._conversion == _CONVERSION_TEMP:
+            UT = self._device.readU16BE(BMP085_TEMPDATA)
+            self._B5 = self._calculate_B5(UT)
+            self._B5_time = time.monotonic()
+            self._pressure_samples = 0
+            self.start_conversion()
+            return None
+        UP = self._read_raw_pressure_data()
+        self._pressure_samples += 1
+        self.start_conversion()
+        return self._calculate_pressure(UP, self._B5)
+
     def read_altitude(self, sealevel_pa=101325.0):
         """Calculates the altitude in meters."""
         # Calculation taken straight from section 3.6 of the datasheet.
@@ -0,0 +1,145 @@
+"""
+Continuous acquisition of the pressure sensor (BMP085) in a separate thread. Every reading is stored with the time it
+was taken in a fixed size ring buffer, so the readers (the vertical filter of copter, see control.estimator) never have
+to wait for the (slow) conversions of the sensor.
+"""
+import threading
+
+import numpy as np
+
+import clock
+
+_buffer_size = 64
+
+_device = None
+_samples = np.zeros((_buffer_size, 3))
+"""
+Ring buffer of the readings, one row per reading: time (of the clock module) in seconds, pressure in Pa, altitude in m
+"""
+_count = 0
+"""
+Number of readings stored since init(), the next one is stored in row _count % _buffer_size
+"""
+
+_barometer_loop_running = False
+_value_lock, _flag_lock = threading.Lock(), threading.Lock()
+_barometer_thread = None
+
+
+def init(device):
+    """
+    Sets the sensor to read from and clears the stored readings. Readings are then taken by calling acquire() or
+    continuously after calling start().
+    :param device: BMP085.BMP085 or an object with the same interface (only its non-blocking interface poll() and
+    time_until_ready() is used)
+    :return: None
+    """
+    global _device, _count
+    if _barometer_loop_running:
+        print("barometer.init() called while the barometer loop runs.")
+        return
+    _device = device
+    _count = 0
+
+
+def start():
+    """
+    Starts an infinite loop calling acquire() in a new thread.
+    :return: None
+    """
+    global _barometer_loop_running, _barometer_thread
+    if _barometer_loop_running:
+        print("barometer.start() called more than once.")
+        return
+    _barometer_loop_running = True
+    _barometer_thread = threading.Thread(target=_barometer_loop)
+    _barometer_thread.start()
+
+
+def finish():
+    """
+    Ends the loop and the thread started in start()
+    :return: None
+    """
+    global _barometer_loop_running
+    if not _barometer_loop_running:
+        print("barometer.finish() called but the barometer loop doesn't run.")
+        return
+    _flag_lock.acquire()
+    _barometer_loop_running = False
+    _flag_lock.release()
+    _barometer_thread.join()
+
+
+def is_running():
+    """
+    :return: If the loop started by start() is running
+    :rtype: bool
+    """
+    return _barometer_loop_running
+
+
+def _barometer_loop():
+    _flag_lock.acquire()
+    while _barometer_loop_running:
+        _flag_lock.release()
+        try:
+            acquire()
+        except Exception as ex:
+            print("Exception reading the pressure sensor")
+            print(ex)
+        _flag_lock.acquire()
+    _flag_lock.release()
+
+
+def acquire():
+    """
+    Takes one reading (waiting until the conversions are finished) and stores it. To be called in the thread created in start(), or directly if that is not running.
+    :return: None
+    """
+    pressure = _device.poll()
+    while pressure is None:
+        clock.sleep(_device.time_until_ready())
+        pressure = _device.poll()
+    _store(pressure)
+
+
+def poll():
+    """
+    Stores a reading if the sensor has finished one, never waits. Alternative to acquire() (if the thread started in
+    start() is not running), to be called regularly.
+    :return: If a reading was stored
+    :rtype: bool
+    """
+    pressure = _device.poll()
+    if pressure is None:
+        return False
+    _store(pressure)
+    return True
+
+
+def _store(pressure):
+    global _count
+    pressure = float(pressure)
+    now = clock.now()
+    altitude = 44330.0 * (1.0 - pow(pressure / 101325.0, (1.0/5.255)))  # see BMP085.read_altitude()
+
+    _value_lock.acquire()
+    _samples[_count % _buffer_size] = now, pressure, altitude
+    _count += 1
+    _value_lock.release()
+
+
+def get_samples(number=_buffer_size):
+    """
+    Returns the latest readings.
+    :param number: Maximal number of readings to return (at most the size of the ring buffer)
+    :return: Array with one row (time, pressure, altitude) (s, Pa, m) per reading, oldest first
+    :rtype: np.ndarray
+    """
+    _value_lock.acquire()
+    number = min(number, _count, _buffer_size)
+    indices = np.arange(_count - number, _count) % _buffer_size
+    samples = _samples[indices]
+    _value_lock.release()
+    return samples
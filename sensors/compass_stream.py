@@ -0,0 +1,158 @@
+"""
+Streaming of the compass (QMC5883L) at a high output data rate. The compass signals new data on its DRDY pin, the
+data is read in the GPIO edge callback and stored with the time it was read in a fixed size ring buffer. Readers get
+the heading averaged over the latest samples without waiting for the sensor.
+"""
+import threading
+
+import numpy as np
+
+import clock
+
+_buffer_size = 64
+_average_time = 0.04  # Samples of this many seconds are averaged (8 samples at 200Hz)
+
+_device = None
+_drdy_pin = None
+_samples = np.zeros((_buffer_size, 4))
+"""
+Ring buffer of the samples, one row per sample: time (of the clock module) in seconds, raw x, y and z
+"""
+_count = 0
+"""
+Number of samples stored since init(), the next one is stored in row _count % _buffer_size
+"""
+
+_streaming = False
+_value_lock = threading.Lock()
+_read_lock = threading.Lock()
+"""
+Held by poll() while it reads and stores a sample: the callback thread and the restart of a stalled stream (another
+thread) must not read the same sample of the device at the same time
+"""
+
+
+def init(device, drdy_pin=None):
+    """
+    Sets the sensor to read from and clears the stored samples.
+    :param device: py_qmc5883l.QMC5883L created with interrupt=True (usually with output_data_rate=ODR_200HZ)
+    :param drdy_pin: Board pin number (GPIO.BOARD) the DRDY pin of the compass is connected to, None if poll() is called
+    instead of start()
+    :return: None
+    """
+    global _device, _drdy_pin, _count
+    if _streaming:
+        print("compass_stream.init() called while streaming.")
+        return
+    _device = device
+    _drdy_pin = drdy_pin
+    _count = 0
+
+
+def start():
+    """
+    Starts reading a sample on every rising edge of the DRDY pin (in the callback thread of RPi.GPIO).
+    :return: None
+    """
+    global _streaming
+    import RPi.GPIO as GPIO
+    if _streaming:
+        print("compass_stream.start() called more than once.")
+        return
+    GPIO.setmode(GPIO.BOARD)
+    GPIO.setup(_drdy_pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+    _streaming = True
+    GPIO.add_event_detect(_drdy_pin, GPIO.RISING, callback=_on_data_ready)
+    _on_data_ready(_drdy_pin)  # Read data that was possibly ready before, so the DRDY pin goes low again
+
+
+def finish():
+    """
+    Stops the streaming started in start()
+    :return: None
+    """
+    global _streaming
+    import RPi.GPIO as GPIO
+    if not _streaming:
+        print("compass_stream.finish() called but the compass doesn't stream.")
+        return
+    GPIO.remove_event_detect(_drdy_pin)
+    GPIO.cleanup(_drdy_pin)
+    _streaming = False
+
+
+def is_streaming():
+    """
+    :return: If the streaming started by start() is running
+    :rtype: bool
+    """
+    return _streaming
+
+
+def _on_data_ready(channel):
+    poll()
+
+
+def poll():
+    """
+    Reads a sample if the compass has one ready, never waits. Alternative to start() without the DRDY pin, to be called
+    more often than the output data rate (e.g. by the compass process of sensors.sensor_processes). While streaming,
+    it restarts a stalled stream (see copter.read_compass()), so it may be called by two threads at the same time: the
+    second one waits until the first has read and stored its sample.
+    :return: If a sample was stored
+    :rtype: bool
+    """
+    global _count
+    _read_lock.acquire()
+    try:
+        sample = _device.read_sample()
+    except Exception as ex:
+        print("Exception reading the compass")
+        print(ex)
+        sample = None
+    if sample is None:
+        _read_lock.release()
+        return False
+    now = clock.now()
+    _value_lock.acquire()
+    _samples[_count % _buffer_size] = now, sample[0], sample[1], sample[2]
+    _count += 1
+    _value_lock.release()
+    _read_lock.release()
+    return True
+
+
+def get_values():
+    """
+    Returns the bearing of the horizontal magnetic vector averaged over the samples of the last _average_time seconds
+    (at least the latest sample), with calibration and declination of the device applied. Doesn't wait.
+    :return: Tuple (time of the latest sample, bearing in degrees), (None, None) if there is no sample yet
+    """
+    _value_lock.acquire()
+    if _count == 0:
+        _value_lock.release()
+        return None, None
+    number = min(_count, _buffer_size)
+    indices = np.arange(_count - number, _count) % _buffer_size
+    samples = _samples[indices]
+    _value_lock.release()
+
+    latest_time = samples[-1, 0]
+    recent = samples[samples[:, 0] > latest_time - _average_time]
+    x, y = recent[:, 1].mean(), recent[:, 2].mean()  # Averaging the vector avoids problems around north
+    return latest_time, _device.calculate_bearing(x, y)
+
+
+def get_samples(number=_buffer_size):
+    """
+    Returns the latest (not averaged) samples.
+    :param number: Maximal number of samples to return (at most the size of the ring buffer)
+    :return: Array with one row (time, x, y, z) per sample, oldest first
+    :rtype: np.ndarray
+    """
+    _value_lock.acquire()
+    number = min(number, _count, _buffer_size)
+    indices = np.arange(_count - number, _count) % _buffer_size
+    samples = _samples[indices]
+    _value_lock.release()
+    return samples
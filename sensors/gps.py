@@ -1,38 +1,70 @@
 # instructions from https://sparklers-the-makers.github.io/blog/robotics/use-neo-6m-module-with-raspberry-pi/
 # NEMA sentences: https://www.gpsinformation.org/dale/nmea.htm
 # best source: https://circuitdigest.com/microcontroller-projects/raspberry-pi-3-gps-module-interfacing/
+# UBX protocol: u-blox 6 Receiver Description Including Protocol Specification (GPS.G6-SW-10018)
 
-import sys
 import serial
 import numpy as np
-import pynmea2
 import threading
 
+import clock
+from sensors import nmea
+from sensors import ubx
+
 _ser = None
+_ubx_parser = None
+"""
+ubx.Parser of the binary messages if the receiver is configured for UBX, None if it sends NMEA sentences
+"""
 _lat, _long, _speed, _track = 0, 0, 0, 0
 """
 latitude, longitude, speed over ground as tuple, true track (traveling angle from north) (radian, radian, m/s, radian)
 """
+_fix_time = None
+"""
+Time (of the clock module) the last position was received, None if none was received yet
+"""
+_fix_quality, _satellites, _hdop = 0, 0, None
+"""
+Fix quality (0: no fix, 1: gps, 2: dgps, ...), number of satellites in use and horizontal dilution of precision of the
+last GGA sentence (or NAV-STATUS/NAV-PVT message, which have no HDOP)
+"""
+
+_received = bytearray()  # Bytes read by poll() that don't complete an NMEA sentence yet
 
 _gps_loop_running = False
 _value_lock, _flag_lock = None, None
 _gps_thread = None
 
-def init():
+def init(serial_port=None, use_ubx=True, rate=5, baudrate=115200, start_thread=True):
     """
-    Initializes the connection to the gps and starts an infinite loop calling read_line() in a new thread.
+    Initializes the connection to the gps and starts an infinite loop calling read_line() (or read_ubx()) in a new
+    thread, or poll() is called instead (e.g. by main.main_run_async() whenever the port has data).
+    :param serial_port: Already opened port (object with the interface of serial.Serial) to use instead of
+    /dev/ttyAMA0 at 9600 baud (the default of the receiver), e.g. a recorded byte stream
+    :param use_ubx: Configure the receiver to send the binary UBX navigation messages at the given rate and baud rate,
+    otherwise its NMEA sentences (1Hz by default) are read
+    :param rate: Navigation solutions per second with UBX, at most 5 for the NEO-6M (10 for the NEO-M8)
+    :param baudrate: Baud rate the receiver is switched to with UBX
+    :param start_thread: Start the thread, otherwise poll() has to be called regularly
     :return: None
     """
-    global _ser, _lat, _long, _speed, _track, _gps_loop_running, _value_lock, _flag_lock, _gps_thread
+    global _ser, _ubx_parser, _lat, _long, _speed, _track, _gps_loop_running, _value_lock, _flag_lock, _gps_thread
     if _gps_loop_running:
         print("gps.init() called more than once.")
         return
-    _ser = serial.Serial("/dev/ttyAMA0", 9600, 8, 'N', 1, timeout = 1)
+    _ser = serial_port if serial_port is not None else serial.Serial("/dev/ttyAMA0", 9600, 8, 'N', 1, timeout = 1)
+    _ubx_parser = None
+    if use_ubx:
+        _configure_ubx(rate, baudrate)
+        _ubx_parser = ubx.Parser()
+    _received.clear()
     _value_lock = threading.Lock()
     _flag_lock = threading.Lock()
-    _gps_loop_running = True
-    _gps_thread = threading.Thread(target=_gps_loop)
-    _gps_thread.start()
+    if start_thread:
+        _gps_loop_running = True
+        _gps_thread = threading.Thread(target=_gps_loop)
+        _gps_thread.start()
 
 def finish():
     """
@@ -41,48 +73,172 @@ def finish():
     """
     global _gps_loop_running, _flag_lock
     if not _gps_loop_running:
-        print("gps.finish() called but the gps loop doesn't run.")
+        if _ser is None:
+            print("gps.finish() called but the gps loop doesn't run.")
         return
     _flag_lock.acquire()
     _gps_loop_running = False
     _flag_lock.release()
     _gps_thread.join()
 
+def _configure_ubx(rate, baudrate):
+    # The receiver switches the baud rate after the CFG-PRT message, so it is sent first and the rest at the new rate.
+    # A NEO-6M answers the NAV-PVT message with a NAK and keeps sending the NAV-POSLLH/VELNED/STATUS messages, a newer
+    # receiver sends all of them.
+    _ser.write(ubx.cfg_prt_uart(baudrate))
+    _ser.flush()
+    clock.sleep(0.1)
+    _ser.baudrate = baudrate
+    _ser.write(ubx.cfg_rate(rate))
+    for msg_id in (ubx.NAV_POSLLH, ubx.NAV_VELNED, ubx.NAV_STATUS, ubx.NAV_PVT):
+        _ser.write(ubx.cfg_msg(ubx.CLASS_NAV, msg_id, 1))
+    _ser.flush()
+    _ser.reset_input_buffer()
+
+
+def read_ubx():
+    """
+    Must not be called before init() is called with use_ubx=True. Reads the available bytes of the gps output (waiting
+    for at least one) and saves the values of the completed navigation messages in the modules variables. To be called
+    in the separate gps loop thread created in init()
+    """
+    try:
+        _handle_ubx(_ubx_parser.feed(_ser.read(max(_ser.in_waiting, 1))))
+    except Exception as ex:
+        print("Exception reading or interpreting gps data")
+        print(ex)
+
 def read_line():
     """
     Must not be called before init() is called. Read a line of the gps output and if there are relevant values in it,
     saves them in the modules variables. To be called in the separate gps loop thread created in init()
     """
-    global _lat, _long, _speed, _track, _value_lock
     try:
-        data = _ser.readline()
-        if sys.version_info[0] == 3: # Check if using python3
-            data = data.decode("utf-8","ignore")
-        if data[0:6] == "$GPRMC":
-            msg = pynmea2.parse(data)
+        _handle_sentence(_ser.readline())
+    except Exception as ex:
+        print("Exception reading or interpreting gps data")
+        print(ex)
+
+def poll():
+    """
+    Must not be called before init() is called with start_thread=False. Reads the bytes the gps has sent without
+    waiting and saves the values of the completed messages (or NMEA sentences) in the modules variables, an incomplete
+    one is completed by the next call.
+    """
+    try:
+        waiting = _ser.in_waiting
+        if waiting == 0:
+            return
+        data = _ser.read(waiting)
+        if _ubx_parser is not None:
+            _handle_ubx(_ubx_parser.feed(data))
+            return
+        _received.extend(data)
+        end = _received.find(b'\n') + 1
+        while end > 0:
+            _handle_sentence(bytes(_received[:end]))
+            del _received[:end]
+            end = _received.find(b'\n') + 1
+    except Exception as ex:
+        print("Exception reading or interpreting gps data")
+        print(ex)
+
+def get_port():
+    """
+    :return: The serial connection to the gps opened in init(), e.g. to wait for data before calling poll()
+    """
+    return _ser
+
+def get_checksum_errors():
+    """
+    :return: Number of UBX messages dropped because of a wrong checksum since init(), 0 if the receiver sends NMEA
+    sentences
+    """
+    return _ubx_parser.checksum_errors if _ubx_parser is not None else 0
+
+def _handle_ubx(messages):
+    global _lat, _long, _speed, _track, _fix_time, _fix_quality, _satellites, _hdop
+    for msg_class, msg_id, payload in messages:
+        if msg_class != ubx.CLASS_NAV:
+            continue
+        if msg_id == ubx.NAV_PVT:
+            itow, fix_type, fix_ok, satellites, lat, lon, height, h_acc, speed, track, p_dop = \
+                ubx.decode_pvt(payload)
+            fix = fix_ok and 2 <= fix_type <= 4
             _value_lock.acquire()
-            _lat = msg.latitude * np.pi/180
-            _long = msg.longitude * np.pi/180
+            _fix_quality, _satellites, _hdop = int(fix), satellites, None
+            if fix:
+                _lat = lat * np.pi/180
+                _long = lon * np.pi/180
+                _speed = speed
+                _track = track * np.pi/180
+                _fix_time = clock.now()
             _value_lock.release()
-        if data[0:6] == "$GPVTG":
-            msg = pynmea2.parse(data)
+        elif msg_id == ubx.NAV_STATUS:
+            itow, fix_type, fix_ok = ubx.decode_status(payload)
             _value_lock.acquire()
-            if msg.true_track is not None:
-                _speed = msg.spd_over_grnd_kmph / 3.6
-                _track = msg.true_track * np.pi/180
-            else:
-                _speed = 0
+            _fix_quality, _hdop = int(fix_ok and 2 <= fix_type <= 4), None
             _value_lock.release()
-    except Exception as ex:
-        print("Exception reading or interpreting gps data")
-        print(ex)
+        elif msg_id == ubx.NAV_POSLLH and _fix_quality > 0:
+            itow, lat, lon, height, h_acc = ubx.decode_posllh(payload)
+            _value_lock.acquire()
+            _lat = lat * np.pi/180
+            _long = lon * np.pi/180
+            _fix_time = clock.now()
+            _value_lock.release()
+        elif msg_id == ubx.NAV_VELNED and _fix_quality > 0:
+            itow, speed, track = ubx.decode_velned(payload)[:3]
+            _value_lock.acquire()
+            _speed = speed
+            _track = track * np.pi/180
+            _value_lock.release()
+
+def _handle_sentence(line):
+    global _lat, _long, _speed, _track, _fix_time, _fix_quality, _satellites, _hdop
+    sentence = nmea.parse(line)  # None for other sentences and wrong checksums
+    if sentence is None:
+        return
+    sentence_type, values = sentence
+    if sentence_type == nmea.RMC:
+        valid, lat, lon, speed, track = values
+        if valid and lat is not None and lon is not None:
+            _value_lock.acquire()
+            _lat = lat * np.pi/180
+            _long = lon * np.pi/180
+            _fix_time = clock.now()
+            _value_lock.release()
+    elif sentence_type == nmea.VTG:
+        track, speed = values
+        _value_lock.acquire()
+        if track is not None and speed is not None:
+            _speed = speed
+            _track = track * np.pi/180
+        else:
+            _speed = 0
+        _value_lock.release()
+    elif sentence_type == nmea.GGA:
+        _value_lock.acquire()
+        _fix_quality, _satellites, _hdop = values[:3]
+        _value_lock.release()
+
+def read():
+    """
+    Reads the next data of the gps with read_ubx() or read_line(), waiting for it at most the timeout of the serial
+    connection, like the thread started in init() does. For a loop that does nothing else, if init() didn't start the
+    thread (e.g. the gps process of sensors.sensor_processes).
+    """
+    if _ubx_parser is not None:
+        read_ubx()
+    else:
+        read_line()
 
 def _gps_loop():
     _flag_lock.acquire()
     while _gps_loop_running:
         _flag_lock.release()
-        read_line()
+        read()
         _flag_lock.acquire()
+    _flag_lock.release()
 
 def get_values():
     """
@@ -92,6 +248,25 @@ def get_values():
     _value_lock.acquire()
     values = _lat, _long, _speed, _track
     _value_lock.release()
-    print("get values: " + str(values))
     return values
 
+def get_fix_time():
+    """
+    Returns when the latest position was received. To be called by the main thread.
+    :return: Time (of the clock module) in seconds, None if no position was received yet
+    """
+    _value_lock.acquire()
+    fix_time = _fix_time
+    _value_lock.release()
+    return fix_time
+
+def get_fix_quality():
+    """
+    Returns the quality of the latest fix. To be called by the main thread.
+    :return: Tuple (fix quality (0: no fix, 1: gps, 2: dgps, ...), number of satellites in use, horizontal dilution of
+    precision (None if unknown))
+    """
+    _value_lock.acquire()
+    values = _fix_quality, _satellites, _hdop
+    _value_lock.release()
+    return values
@@ -0,0 +1,142 @@
+"""
+Small parser for the NMEA sentences of the gps module that works on the bytes read from the serial port. Only RMC, VTG
+and GGA sentences are interpreted, from any talker (GP, GN for multiple constellations, GL, GA, ...). Sentences with a
+wrong or missing checksum are ignored.
+
+Benchmark against pynmea2 (from the repository root):
+    python -m sensors.nmea [nmea file]
+"""
+
+_knots = 1852 / 3600  # m/s
+_kmph = 1 / 3.6  # m/s
+
+RMC, VTG, GGA = b'RMC', b'VTG', b'GGA'
+
+
+def checksum_valid(line):
+    """
+    :param line: Sentence as bytes, e.g. b'$GPRMC,...*4F\\r\\n'
+    :return: If the line has the form $...*hh and hh is the XOR of the characters between $ and *
+    :rtype: bool
+    """
+    star = line.rfind(b'*')
+    if star < 1 or line[0] != 0x24 or len(line) < star + 3:  # 0x24: '$'
+        return False
+    checksum = 0
+    for character in line[1:star]:
+        checksum ^= character
+    try:
+        return checksum == int(line[star + 1:star + 3], 16)
+    except ValueError:
+        return False
+
+
+def _coordinate(value, hemisphere, degree_digits):
+    # (d)ddmm.mmmm to degrees, negative for south and west
+    if not value:
+        return None
+    degrees = int(value[:degree_digits]) + float(value[degree_digits:]) / 60
+    return -degrees if hemisphere in (b'S', b'W') else degrees
+
+
+def _float(value):
+    return float(value) if value else None
+
+
+def parse(line):
+    """
+    Parses an RMC, VTG or GGA sentence.
+    :param line: Sentence as bytes as read from the gps module
+    :return: Tuple (sentence type, values) or None if the line is no valid RMC, VTG or GGA sentence. The values are
+    (empty fields are None):
+    RMC: (status valid, latitude, longitude, speed over ground, true track) (bool, degree, degree, m/s, degree)
+    VTG: (true track, speed over ground) (degree, m/s)
+    GGA: (fix quality, number of satellites, horizontal dilution of precision, latitude, longitude, altitude above mean
+    sea level) (int, int, -, degree, degree, m), fix quality 0 means no fix
+    """
+    sentence_type = line[3:6]
+    if sentence_type != RMC and sentence_type != VTG and sentence_type != GGA:
+        return None
+    if not checksum_valid(line):
+        return None
+    fields = line[:line.rfind(b'*')].split(b',')
+    try:
+        if sentence_type == RMC:
+            # $GPRMC,time,status,lat,N/S,lon,E/W,speed(knots),track,date,...
+            speed = _float(fields[7])
+            return RMC, (fields[2] == b'A', _coordinate(fields[3], fields[4], 2), _coordinate(fields[5], fields[6], 3),
+                         speed * _knots if speed is not None else None, _float(fields[8]))
+        if sentence_type == VTG:
+            # $GPVTG,true track,T,magnetic track,M,speed(knots),N,speed(km/h),K,...
+            speed = _float(fields[7])
+            return VTG, (_float(fields[1]), speed * _kmph if speed is not None else None)
+        # $GPGGA,time,lat,N/S,lon,E/W,quality,satellites,hdop,altitude,M,...
+        return GGA, (int(fields[6]) if fields[6] else 0, int(fields[7]) if fields[7] else 0, _float(fields[8]),
+                     _coordinate(fields[2], fields[3], 2), _coordinate(fields[4], fields[5], 3), _float(fields[9]))
+    except (IndexError, ValueError):
+        return None
+
+
+def _sentence(body):
+    checksum = 0
+    for character in body.encode():
+        checksum ^= character
+    return ("$%s*%02X\r\n" % (body, checksum)).encode()
+
+
+def _generate_lines(number):
+    # Output of a receiver sending RMC, VTG and GGA once per second, in case no recorded file is given
+    lines = []
+    for i in range(number // 3):
+        seconds = i % 60
+        lines.append(_sentence("GNRMC,1200%02d.00,A,4758.6800%02d,N,06013.2480%02d,E,0.%03d,%d.5,181026,,,A" %
+                               (seconds, seconds, seconds, i % 1000, i % 360)))
+        lines.append(_sentence("GNVTG,%d.5,T,,M,0.%03d,N,0.%03d,K,A" % (i % 360, i % 1000, i % 1000)))
+        lines.append(_sentence("GNGGA,1200%02d.00,4758.6800%02d,N,06013.2480%02d,E,1,%02d,0.9%d,412.%d,M,-1.0,M,,"
+                               % (seconds, seconds, seconds, 5 + i % 7, i % 10, i % 10)))
+    return lines
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'rb') as nmea_file:
+            test_lines = nmea_file.readlines()
+    else:
+        test_lines = _generate_lines(30000)
+
+    start_time = time.perf_counter()
+    parsed = sum(1 for test_line in test_lines if parse(test_line) is not None)
+    duration = time.perf_counter() - start_time
+    print("nmea.parse(): %d of %d lines parsed, %.2f us per line" % (parsed, len(test_lines),
+                                                                     duration / len(test_lines) * 1e6))
+
+    try:
+        import pynmea2
+    except ImportError:
+        print("pynmea2 is not installed, no comparison.")
+        sys.exit()
+    start_time = time.perf_counter()
+    parsed = 0
+    for test_line in test_lines:  # like gps.read_line() did before, getting the same values as parse()
+        data = test_line.decode("utf-8", "ignore")
+        try:
+            if data[3:6] == "RMC":
+                msg = pynmea2.parse(data, check=True)
+                values = msg.status == 'A', msg.latitude, msg.longitude, msg.spd_over_grnd, msg.true_course
+            elif data[3:6] == "VTG":
+                msg = pynmea2.parse(data, check=True)
+                values = msg.true_track, msg.spd_over_grnd_kmph
+            elif data[3:6] == "GGA":
+                msg = pynmea2.parse(data, check=True)
+                values = msg.gps_qual, msg.num_sats, msg.horizontal_dil, msg.latitude, msg.longitude, msg.altitude
+            else:
+                continue
+            parsed += 1
+        except pynmea2.ParseError:
+            pass
+    duration_pynmea2 = time.perf_counter() - start_time
+    print("pynmea2.parse(): %d of %d lines parsed, %.2f us per line (%.1fx slower)" % (
+        parsed, len(test_lines), duration_pynmea2 / len(test_lines) * 1e6, duration_pynmea2 / duration))
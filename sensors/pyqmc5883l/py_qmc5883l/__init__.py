@@ -15,8 +15,8 @@ of the magnetic sensor on axis X, Y and Z, e.g. [-1257, 940, -4970].
 
 import logging
 import math
+import struct
 import time
-import smbus
 
 __author__ = "Niccolo Rigacci"
 __copyright__ = "Copyright 2018 Niccolo Rigacci <niccolo@rigacci.org>"
@@ -73,11 +73,14 @@ class QMC5883L(object):
                  address=DFLT_ADDRESS,
                  output_data_rate=ODR_10HZ,
                  output_range=RNG_2G,
-                 oversampling_rate=OSR_512):
+                 oversampling_rate=OSR_512,
+                 interrupt=False):
 
+        import smbus  # Imported here so that the module can be loaded without the I2C bindings.
         self.address = address
         self.bus = smbus.SMBus(i2c_bus)
         self.output_range = output_range
+        self.interrupt = interrupt
         self._declination = 0.0
         self._calibration = [[1.0, 0.0, 0.0],
                              [0.0, 1.0, 0.0],
@@ -98,7 +101,12 @@ class QMC5883L(object):
     def mode_continuous(self):
         """Set the device in continuous read mode."""
         self._write_byte(REG_CONTROL_2, SOFT_RST)  # Soft reset.
-        self._write_byte(REG_CONTROL_2, INT_ENB)  # Disable interrupt.
+        # Enable pointer roll-over (00H..06H) for _read_block(). The DRDY
+        # interrupt pin is only enabled if requested.
+        if self.interrupt:
+            self._write_byte(REG_CONTROL_2, POL_PNT)
+        else:
+            self._write_byte(REG_CONTROL_2, INT_ENB | POL_PNT)
         self._write_byte(REG_RST_PERIOD, 0x01)  # Define SET/RESET period.
         self._write_byte(REG_CONTROL_1, self.mode_cont)  # Set operation mode.
 
@@ -131,12 +139,22 @@ class QMC5883L(object):
         else:
             return val
 
-    def get_data(self):
-        """Read data from magnetic and temperature data registers."""
+    def _read_block(self):
+        """Read status and X, Y, Z in one I2C block transfer.
+
+        With pointer roll-over enabled the register pointer wraps from
+        REG_STATUS_1 (06H) to REG_XOUT_LSB (00H), so a 7 bytes read starting
+        at the status register returns the status first and then the data.
+        """
+        block = self.bus.read_i2c_block_data(self.address, REG_STATUS_1, 7)
+        return struct.unpack('<Bhhh', bytes(block))
+
+    def _read_magnet(self, timeout=0.2):
+        """Wait for DRDY and return X, Y, Z (None after timeout seconds)."""
         i = 0
-        [x, y, z, t] = [None, None, None, None]
-        while i < 20:  # Timeout after about 0.20 seconds.
-            status = self._read_byte(REG_STATUS_1)
+        tries = max(1, int(round(timeout / 0.01)))
+        while i < tries:  # Timeout after about 0.20 seconds by default.
+            status, x, y, z = self._read_block()
             if status & STAT_OVL:
                 # Some values have reached an overflow.
                 msg = ("Magnetic sensor overflow.")
@@ -145,26 +163,38 @@ class QMC5883L(object):
                 logging.warning(msg)
             if status & STAT_DOR:
                 # Previous measure was read partially, sensor in Data Lock.
-                x = self._read_word_2c(REG_XOUT_LSB)
-                y = self._read_word_2c(REG_YOUT_LSB)
-                z = self._read_word_2c(REG_ZOUT_LSB)
+                # The block read above has read all data registers.
                 continue
             if status & STAT_DRDY:
                 # Data is ready to read.
-                x = self._read_word_2c(REG_XOUT_LSB)
-                y = self._read_word_2c(REG_YOUT_LSB)
-                z = self._read_word_2c(REG_ZOUT_LSB)
-                t = self._read_word_2c(REG_TOUT_LSB)
-                break
+                return x, y, z
             else:
                 # Waiting for DRDY.
                 time.sleep(0.01)
                 i += 1
+        return None, None, None
+
+    def read_sample(self):
+        """Read X, Y, Z without waiting, e.g. when signalled by the DRDY pin.
+
+        Returns None if no new data was ready.
+        """
+        status, x, y, z = self._read_block()
+        if not status & STAT_DRDY:
+            return None
+        return x, y, z
+
+    def get_data(self):
+        """Read data from magnetic and temperature data registers."""
+        x, y, z = self._read_magnet()
+        t = None
+        if x is not None:
+            t = struct.unpack('<h', bytes(self.bus.read_i2c_block_data(self.address, REG_TOUT_LSB, 2)))[0]
         return [x, y, z, t]
 
     def get_magnet_raw(self):
         """Get the 3 axis values from magnetic sensor."""
-        [x, y, z, t] = self.get_data()
+        [x, y, z] = self._read_magnet()
         return [x, y, z]
 
     def get_magnet(self):
@@ -180,7 +210,7 @@ class QMC5883L(object):
 
     def get_bearing_raw(self):
         """Horizontal bearing (in degrees) from magnetic value X and Y."""
-        [x, y, z] = self.get_magnet_raw()
+        x, y, z = self._read_magnet()
         if x is None or y is None:
             return None
         else:
@@ -189,20 +219,26 @@ class QMC5883L(object):
                 b += 360.0
             return b
 
-    def get_bearing(self):
-        """Horizontal bearing, adjusted by calibration and declination."""
-        [x, y] = self.get_magnet()
+    def get_bearing(self, timeout=0.2):
+        """Horizontal bearing, adjusted by calibration and declination.
+
+        Returns None if no data was ready within about timeout seconds.
+        """
+        x, y, z = self._read_magnet(timeout)
         if x is None or y is None:
             return None
-        else:
-            b = math.degrees(math.atan2(y, x))
-            if b < 0:
-                b += 360.0
-            b += self._declination
-            if b < 0.0:
-                b += 360.0
-            elif b >= 360.0:
-                b -= 360.0
+        return self.calculate_bearing(x, y)
+
+    def calculate_bearing(self, x, y):
+        """Bearing (in degrees) of raw X and Y with calibration and declination applied."""
+        c = self._calibration
+        x1 = x * c[0][0] + y * c[0][1] + c[0][2]
+        y1 = x * c[1][0] + y * c[1][1] + c[1][2]
+        b = math.degrees(math.atan2(y1, x1)) + self._declination
+        if b < 0.0:
+            b += 360.0
+        elif b >= 360.0:
+            b -= 360.0
         return b
 
     def get_temp(self):
@@ -0,0 +1,324 @@
+"""
+Sensor acquisition in separate processes (see copter.init(sensor_processes=True)): the pressure sensor, the compass and
+the gps (if used, see use_gps of copter.init()) are each read by their own process, which publishes the readings into
+a fixed-layout record in shared memory (see sensors.seqlock). The main process copies the records out of the shared
+memory, without locks, pickling or system calls. So the blocking I2C transfers, the parsing of the gps messages and
+their Python overhead run on the other cores of the Pi and don't compete with the control loop for the GIL. While the
+processes run, they are pinned to _sensor_cpus and the main process (with all its threads) to _control_cpus.
+
+The processes use the same acquisition code as the sensor threads (barometer.acquire(), compass_stream.poll(),
+gps.read()), the records hold what the main process reads from those modules otherwise. The times are of the
+monotonic system clock, which is the same in all processes, so this doesn't work on a virtual clock (the simulator).
+"""
+import functools
+import multiprocessing
+import os
+import signal
+import time
+
+import numpy as np
+
+from sensors import barometer, compass_stream, gps
+from sensors.Adafruit_BMP import BMP085
+from sensors.pyqmc5883l import py_qmc5883l
+from sensors.seqlock import SeqlockRecord
+
+_buffer_size = 64
+_compass_poll_interval = 0.001  # s between two checks for a new sample of the compass (200 Hz)
+_sensor_cpus = {1, 2, 3}
+"""
+Cores the processes run on (if the CPU has them)
+"""
+_control_cpus = {0}
+"""
+Cores the main process (the control loop and the other threads) runs on while the processes run on _sensor_cpus
+"""
+_join_timeout = 2  # s to wait for a process to end (the gps waits up to the timeout of its serial connection)
+
+BAROMETER_DTYPE = np.dtype([
+    ("count", "<u8"),  # Number of readings since the start, the next one is stored in row count % _buffer_size
+    ("samples", "<f8", (_buffer_size, 3)),  # Ring buffer of readings like barometer: time (s), pressure (Pa), altitude (m)
+])
+COMPASS_DTYPE = np.dtype([
+    ("count", "<u8"),  # Number of samples since the start
+    ("time", "<f8"),  # Time of the latest sample in s
+    ("bearing", "<f8"),  # Averaged bearing in degrees like compass_stream.get_values()
+])
+GPS_DTYPE = np.dtype([
+    ("latitude", "<f8"),  # rad
+    ("longitude", "<f8"),  # rad
+    ("speed", "<f8"),  # m/s
+    ("track", "<f8"),  # rad
+    ("fix_time", "<f8"),  # s, NaN if there was no fix yet
+    ("fix_quality", "<i8"),  # 0: no fix, 1: gps, 2: dgps, ...
+    ("satellites", "<i8"),
+    ("hdop", "<f8"),  # NaN if unknown
+])
+
+
+def _set_affinity(cpus):
+    # Sets the cores of all threads of this process, sched_setaffinity() only sets the thread with the given id
+    for thread_id in os.listdir("/proc/self/task"):
+        try:
+            os.sched_setaffinity(int(thread_id), cpus)
+        except ProcessLookupError:  # the thread ended meanwhile
+            pass
+
+
+def _pin(cpus):
+    # Restricts this process to those of the cores it may run on, returns the cores it could run on before. None if
+    # the platform doesn't support that or none of the cores is available.
+    if not hasattr(os, "sched_setaffinity"):
+        return None
+    previous = os.sched_getaffinity(0)
+    cpus = cpus & previous
+    if not cpus:
+        return None
+    _set_affinity(cpus)
+    return previous
+
+
+def _start_process(cpus):
+    # The main process ends the sensor processes with finish(), a Ctrl+C (sent to all processes) must not
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _pin(cpus)
+
+
+def _run_barometer(name, stop, device_factory, cpus):
+    _start_process(cpus)
+    record = SeqlockRecord(BAROMETER_DTYPE, name)
+    barometer.init(device_factory())
+    while not stop.is_set():
+        try:
+            barometer.acquire()
+        except Exception as ex:
+            print("Exception reading the pressure sensor")
+            print(ex)
+            continue
+        values = record.begin_write()
+        count = int(values["count"])
+        values["samples"][count % _buffer_size] = barometer.get_samples(1)[0]
+        values["count"] = count + 1
+        record.end_write()
+    record.close()
+
+
+def _run_compass(name, stop, device_factory, declination, cpus):
+    _start_process(cpus)
+    record = SeqlockRecord(COMPASS_DTYPE, name)
+    device = device_factory()
+    device.declination = declination
+    compass_stream.init(device)
+    while not stop.is_set():
+        if not compass_stream.poll():
+            time.sleep(_compass_poll_interval)
+            continue
+        sample_time, bearing = compass_stream.get_values()
+        values = record.begin_write()
+        values["count"] += 1
+        values["time"], values["bearing"] = sample_time, bearing
+        record.end_write()
+    record.close()
+
+
+def _run_gps(name, stop, cpus):
+    _start_process(cpus)
+    record = SeqlockRecord(GPS_DTYPE, name)
+    gps.init(start_thread=False)
+    while not stop.is_set():
+        gps.read()
+        lat, lon, speed, track = gps.get_values()
+        fix_time = gps.get_fix_time()
+        fix_quality, satellites, hdop = gps.get_fix_quality()
+        values = record.begin_write()
+        values["latitude"], values["longitude"], values["speed"], values["track"] = lat, lon, speed, track
+        values["fix_time"] = fix_time if fix_time is not None else np.nan
+        values["fix_quality"], values["satellites"] = fix_quality, satellites
+        values["hdop"] = hdop if hdop is not None else np.nan
+        record.end_write()
+    record.close()
+
+
+def _latest_samples(record, number):
+    count = int(record["count"])
+    number = min(number, count, _buffer_size)
+    indices = np.arange(count - number, count) % _buffer_size
+    return record["samples"][indices]  # indexing with an array copies the rows
+
+
+def _latest_samples_count(record):
+    return min(int(record["count"]), _buffer_size)
+
+
+def _compass_values(record):
+    if record["count"] == 0:
+        return None, None
+    return record["time"].item(), record["bearing"].item()
+
+
+def _gps_values(record):
+    return record["latitude"].item(), record["longitude"].item(), record["speed"].item(), record["track"].item()
+
+
+def _gps_fix_time(record):
+    fix_time = record["fix_time"].item()
+    return fix_time if fix_time == fix_time else None  # NaN if there was no fix yet
+
+
+def _gps_fix_quality(record):
+    hdop = record["hdop"].item()
+    return record["fix_quality"].item(), record["satellites"].item(), hdop if hdop == hdop else None
+
+
+class SharedGps(object):
+    """
+    Stands in for the gps module in the main process (as gps_device of copter.init()), with the values published by
+    the gps process.
+    """
+
+    def __init__(self, record):
+        self._record = record
+
+    def get_values(self):
+        """
+        :return: Tuple (latitude, longitude, speed over ground, true track) (radian, radian, m/s, radian)
+        """
+        return self._record.read(_gps_values)
+
+    def get_fix_time(self):
+        """
+        :return: Time (of the clock module) in seconds the latest position was received, None if none was received yet
+        """
+        return self._record.read(_gps_fix_time)
+
+    def get_fix_quality(self):
+        """
+        :return: Tuple (fix quality (0: no fix, 1: gps, 2: dgps, ...), number of satellites in use, horizontal dilution
+        of precision (None if unknown))
+        """
+        return self._record.read(_gps_fix_quality)
+
+    def finish(self):
+        pass  # the process is ended by SensorProcesses.finish()
+
+
+class SensorProcesses(object):
+    """
+    The processes reading the sensors and the shared records they publish to.
+    """
+
+    def __init__(self, barometer_device=BMP085.BMP085,
+                 compass_device=functools.partial(py_qmc5883l.QMC5883L, output_data_rate=py_qmc5883l.ODR_200HZ),
+                 compass_declination=0.0, use_gps=True):
+        """
+        :param barometer_device: Function without arguments creating the pressure sensor (BMP085.BMP085 or an object
+        with its interface) in its process. It has to be picklable, e.g. a class or a function of a module.
+        :param compass_device: Function without arguments creating the compass (py_qmc5883l.QMC5883L or an object with
+        read_sample() and calculate_bearing()) in its process, picklable too
+        :param compass_declination: Magnetic declination in degrees set for the compass
+        :param use_gps: Start the gps process (reading sensors.gps at its default port), see gps
+        """
+        self._barometer_device = barometer_device
+        self._compass_device = compass_device
+        self._compass_declination = compass_declination
+        self._use_gps = use_gps
+        self._stop = None
+        self._processes = []
+        self._barometer, self._compass, self._gps = None, None, None
+        self._previous_cpus = None  # of the main process before start(), None if it wasn't pinned
+        self.gps = None
+        """
+        SharedGps with the values of the gps process after start(), None if the gps is not used
+        """
+
+    def start(self):
+        """
+        Creates the shared records and starts the processes. The processes are spawned (not forked from this process,
+        which may have threads), so they take a moment to start publishing. Pins this process to _control_cpus if the
+        processes can run on other cores.
+        :return: None
+        """
+        context = multiprocessing.get_context("spawn")
+        self._stop = context.Event()
+        self._barometer = SeqlockRecord(BAROMETER_DTYPE)
+        self._compass = SeqlockRecord(COMPASS_DTYPE)
+        self._processes = [
+            context.Process(target=_run_barometer, name="barometer", daemon=True,
+                            args=(self._barometer.name, self._stop, self._barometer_device, _sensor_cpus)),
+            context.Process(target=_run_compass, name="compass", daemon=True,
+                            args=(self._compass.name, self._stop, self._compass_device, self._compass_declination,
+                                  _sensor_cpus))]
+        if self._use_gps:
+            self._gps = SeqlockRecord(GPS_DTYPE)
+            self.gps = SharedGps(self._gps)
+            self._processes.append(context.Process(target=_run_gps, name="gps", daemon=True,
+                                                   args=(self._gps.name, self._stop, _sensor_cpus)))
+        for process in self._processes:
+            process.start()
+        # Only after starting them, as the processes inherit the cores of this one
+        if hasattr(os, "sched_getaffinity") and _sensor_cpus & os.sched_getaffinity(0):
+            self._previous_cpus = _pin(_control_cpus)
+
+    def get_barometer_samples(self, number=_buffer_size):
+        """
+        Like barometer.get_samples(): returns the latest readings of the pressure sensor.
+        :param number: Maximal number of readings to return (at most the size of the ring buffer)
+        :return: Array with one row (time, pressure, altitude) (s, Pa, m) per reading, oldest first
+        :rtype: np.ndarray
+        """
+        return self._barometer.read(functools.partial(_latest_samples, number=number))
+
+    def wait_for_barometer(self, number, timeout=10.0):
+        """
+        Waits until the pressure sensor has taken the given number of readings (e.g. to average the ground level).
+        :param number: Number of readings (at most the size of the ring buffer)
+        :param timeout: Maximal time to wait in seconds
+        :return: The latest readings like get_barometer_samples()
+        :rtype: np.ndarray
+        """
+        end_time = time.monotonic() + timeout
+        while self._barometer.read(_latest_samples_count) < number:
+            if time.monotonic() >= end_time:
+                raise TimeoutError("The pressure sensor process didn't take " + str(number) + " readings in " +
+                                   str(timeout) + " seconds")
+            time.sleep(0.05)
+        return self.get_barometer_samples(number)
+
+    def get_compass_values(self):
+        """
+        Like compass_stream.get_values(): returns the averaged bearing without waiting.
+        :return: Tuple (time of the latest sample, bearing in degrees), (None, None) if there is no sample yet
+        """
+        return self._compass.read(_compass_values)
+
+    def get_ended(self):
+        """
+        :return: Names of the processes that have ended (e.g. by an exception creating the device)
+        :rtype: list
+        """
+        return [process.name for process in self._processes if not process.is_alive()]
+
+    def finish(self):
+        """
+        Ends the processes started in start(), removes the shared records and unpins this process.
+        :return: None
+        """
+        if self._stop is None:
+            print("SensorProcesses.finish() called but the processes weren't started.")
+            return
+        self._stop.set()
+        for process in self._processes:
+            process.join(_join_timeout)
+            if process.is_alive():
+                print("Sensor process " + process.name + " didn't end, terminating it.")
+                process.terminate()
+                process.join()
+        for record in (self._barometer, self._compass, self._gps):
+            if record is not None:
+                record.close()
+        if self._previous_cpus is not None:
+            _set_affinity(self._previous_cpus)
+            self._previous_cpus = None
+        self._stop = None
+        self._processes = []
+        self._barometer, self._compass, self._gps = None, None, None
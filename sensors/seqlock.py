@@ -0,0 +1,148 @@
+"""
+Fixed-layout record in shared memory (multiprocessing.shared_memory) guarded by a seqlock, for one writer process and
+any number of reader processes. The writer increments the sequence number before and after changing the record, so it
+is odd while a write is in progress. A reader copies the record from the shared memory (one memcpy, no pickling, no
+lock) and retries if the sequence number was odd or changed meanwhile. So the writer never waits for the readers, and a
+reader only waits while a write is in progress (microseconds).
+
+The stores are plain NumPy stores without memory barriers. On a weakly ordered CPU like the ARM cores of the Pi, another
+core can see them in a different order, so an unchanged even sequence number doesn't prove that the copy is consistent.
+The writer therefore also stores a CRC-32 of the record, and a copy is only accepted if its CRC-32 matches: a torn copy
+is detected however the stores were reordered (except with a probability of 2^-32), and is read again.
+
+Benchmark and consistency check (from the repository root):
+    python -m sensors.seqlock
+"""
+import time
+import zlib
+from multiprocessing import shared_memory
+
+import numpy as np
+
+_spins_before_yield = 100  # Retries of a read before the reader yields its time slice to the writer
+_header_size = 16  # Sequence number (8 bytes), CRC-32 of the record (4 bytes), padding
+
+
+class SeqlockRecord(object):
+    """
+    A record of a NumPy dtype in shared memory, created by one process and attached to by name by the others.
+    """
+
+    def __init__(self, dtype, name=None):
+        """
+        :param dtype: Structured NumPy dtype of the record (fixed size, no objects)
+        :param name: Name of the shared memory of an existing record to attach to (see name), None to create a new one
+        (initialized with zeros)
+        """
+        self.dtype = np.dtype(dtype)
+        self._memory = shared_memory.SharedMemory(name=name, create=name is None,
+                                                  size=_header_size + self.dtype.itemsize)
+        self._created = name is None
+        self.name = self._memory.name
+        self._sequence = np.ndarray(1, dtype="<u8", buffer=self._memory.buf)
+        self._checksum = np.ndarray(1, dtype="<u4", buffer=self._memory.buf, offset=8)
+        self._data = self._memory.buf[_header_size:_header_size + self.dtype.itemsize]
+        self._record = np.ndarray((), dtype=self.dtype, buffer=self._memory.buf, offset=_header_size)
+        if self._created:
+            self._sequence[0] = 0
+            self._record[()] = np.zeros((), dtype=self.dtype)
+            self._checksum[0] = zlib.crc32(self._data)
+
+    def begin_write(self):
+        """
+        Starts a write, must be followed by end_write(). Only to be called by the one writer process.
+        :return: The record (0-dimensional structured array in the shared memory), to be changed
+        :rtype: np.ndarray
+        """
+        self._sequence[0] += 1
+        return self._record
+
+    def end_write(self):
+        """
+        Publishes the changes since begin_write().
+        :return: None
+        """
+        self._checksum[0] = zlib.crc32(self._data)
+        self._sequence[0] += 1
+
+    def read(self, function):
+        """
+        Copies the record until the copy is consistent (see the module description) and calls function with it.
+        :param function: Function taking the record (read-only 0-dimensional structured array, a copy of the shared
+        one) and returning values computed from it
+        :return: What function returned
+        """
+        spins = 0
+        while True:
+            start = self._sequence[0]
+            if not start & 1:
+                data = bytes(self._data)
+                if self._sequence[0] == start and zlib.crc32(data) == self._checksum[0]:
+                    return function(np.ndarray((), dtype=self.dtype, buffer=data))
+            spins += 1
+            if spins >= _spins_before_yield:
+                time.sleep(0)
+                spins = 0
+
+    def get_sequence(self):
+        """
+        :return: The sequence number, twice the number of writes (if no write is in progress)
+        :rtype: int
+        """
+        return int(self._sequence[0])
+
+    def close(self):
+        """
+        Detaches from the shared memory, which is removed if this object created it. The record must not be used
+        afterwards.
+        :return: None
+        """
+        self._sequence, self._checksum, self._record = None, None, None
+        self._data.release()
+        self._data = None
+        self._memory.close()
+        if self._created:
+            self._memory.unlink()
+
+
+_test_dtype = np.dtype([("count", "<u8"), ("values", "<f8", (64,))])
+
+
+def _write_test_records(name, writes):
+    record = SeqlockRecord(_test_dtype, name)
+    for i in range(1, writes + 1):
+        values = record.begin_write()
+        values["count"] = i
+        values["values"][:] = i
+        record.end_write()
+    record.close()
+
+
+def _check_test_record(record):
+    values = record["values"]
+    return int(record["count"]), bool(values.min() == values.max() == record["count"])
+
+
+if __name__ == "__main__":
+    import multiprocessing
+
+    test_writes = 200000
+    test_record = SeqlockRecord(_test_dtype)
+    writer = multiprocessing.get_context("spawn").Process(target=_write_test_records,
+                                                          args=(test_record.name, test_writes))
+    writer.start()
+    reads, inconsistent, count = 0, 0, 0
+    start_time = time.perf_counter()
+    while count < test_writes:
+        count, consistent = test_record.read(_check_test_record)
+        reads += 1
+        inconsistent += not consistent
+    duration = time.perf_counter() - start_time
+    writer.join()
+    print("%d reads during %d writes of another process, %d inconsistent, %.2f us per read" % (
+        reads, test_writes, inconsistent, duration / reads * 1e6))
+    start_time = time.perf_counter()
+    for i in range(100000):
+        test_record.read(_check_test_record)
+    print("%.2f us per read without writer" % ((time.perf_counter() - start_time) / 100000 * 1e6))
+    test_record.close()
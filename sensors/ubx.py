@@ -0,0 +1,169 @@
+"""
+The binary UBX protocol of the u-blox gps receivers: building of configuration messages, a stream parser and decoding
+of the navigation messages with struct.
+
+The NEO-6M (protocol version 6/7) sends NAV-POSLLH, NAV-VELNED and NAV-STATUS at up to 5Hz. NAV-PVT, which contains
+all of them, is only supported from protocol version 14 (e.g. NEO-M8) and then allows 10Hz. Both are decoded.
+Description of the messages: u-blox 6 Receiver Description Including Protocol Specification (GPS.G6-SW-10018).
+"""
+import struct
+
+SYNC = b'\xB5\x62'
+
+CLASS_NAV = 0x01
+CLASS_ACK = 0x05
+CLASS_CFG = 0x06
+
+NAV_POSLLH = 0x02
+NAV_STATUS = 0x03
+NAV_PVT = 0x07
+NAV_VELNED = 0x12
+
+ACK_NAK = 0x00
+ACK_ACK = 0x01
+
+CFG_PRT = 0x00
+CFG_MSG = 0x01
+CFG_RATE = 0x08
+
+_POSLLH = struct.Struct('<IiiiiII')  # iTOW, lon, lat, height, hMSL, hAcc, vAcc
+_VELNED = struct.Struct('<IiiiIIiII')  # iTOW, velN, velE, velD, speed, gSpeed, heading, sAcc, cAcc
+_STATUS = struct.Struct('<IBBBBII')  # iTOW, gpsFix, flags, fixStat, flags2, ttff, msss
+_PVT = struct.Struct('<IHBBBBBBIiBBBBiiiiIIiiiiiIIH')  # up to pDOP, see decode_pvt()
+
+_max_length = 1024  # Longer messages are considered corrupt
+
+
+def checksum(data):
+    """
+    :param data: Class, id, length and payload of a message
+    :return: The 8-bit Fletcher checksum (CK_A, CK_B) of the UBX protocol
+    :rtype: bytes
+    """
+    ck_a, ck_b = 0, 0
+    for byte in data:
+        ck_a = (ck_a + byte) & 0xFF
+        ck_b = (ck_b + ck_a) & 0xFF
+    return bytes((ck_a, ck_b))
+
+
+def message(msg_class, msg_id, payload=b''):
+    """
+    :return: The complete UBX message (sync chars, class, id, length, payload, checksum)
+    :rtype: bytes
+    """
+    data = struct.pack('<BBH', msg_class, msg_id, len(payload)) + payload
+    return SYNC + data + checksum(data)
+
+
+def cfg_prt_uart(baudrate, ubx_only=True):
+    """
+    :param baudrate: New baud rate of UART 1 (the receiver switches after sending the acknowledgement)
+    :param ubx_only: Send only UBX messages (otherwise UBX and NMEA), UBX and NMEA are accepted as input
+    :return: CFG-PRT message configuring UART 1 for 8N1 with the given baud rate
+    :rtype: bytes
+    """
+    out_protocols = 0x0001 if ubx_only else 0x0003
+    payload = struct.pack('<BBHIIHHHH', 1, 0, 0, 0x000008D0, baudrate, 0x0003, out_protocols, 0, 0)
+    return message(CLASS_CFG, CFG_PRT, payload)
+
+
+def cfg_rate(rate):
+    """
+    :param rate: Measurement (and navigation solution) rate in Hz, at most 5 for the NEO-6M
+    :return: CFG-RATE message
+    :rtype: bytes
+    """
+    return message(CLASS_CFG, CFG_RATE, struct.pack('<HHH', int(round(1000 / rate)), 1, 1))
+
+
+def cfg_msg(msg_class, msg_id, rate=1):
+    """
+    :param rate: Send the message every rate-th navigation solution on the current port, 0 to disable it
+    :return: CFG-MSG message
+    :rtype: bytes
+    """
+    return message(CLASS_CFG, CFG_MSG, struct.pack('<BBB', msg_class, msg_id, rate))
+
+
+class Parser(object):
+    """
+    Splits a stream of bytes into UBX messages. Data between messages (e.g. NMEA sentences) and messages with a wrong
+    checksum are skipped.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.checksum_errors = 0
+
+    def feed(self, data):
+        """
+        :param data: Bytes read from the receiver
+        :return: The messages completed by data as tuples (class, id, payload)
+        :rtype: list
+        """
+        buffer = self._buffer
+        buffer += data
+        messages = []
+        while True:
+            start = buffer.find(SYNC)
+            if start < 0:
+                del buffer[:max(len(buffer) - 1, 0)]  # keep a possible first sync char
+                break
+            if len(buffer) < start + 6:
+                del buffer[:start]
+                break
+            msg_class, msg_id, length = struct.unpack_from('<BBH', buffer, start + 2)
+            if length > _max_length:
+                del buffer[:start + 2]
+                continue
+            end = start + 6 + length + 2
+            if len(buffer) < end:
+                del buffer[:start]
+                break
+            if checksum(buffer[start + 2:end - 2]) == buffer[end - 2:end]:
+                messages.append((msg_class, msg_id, bytes(buffer[start + 6:end - 2])))
+                del buffer[:end]
+            else:
+                self.checksum_errors += 1
+                del buffer[:start + 2]
+        return messages
+
+
+def decode_posllh(payload):
+    """
+    :return: Tuple (GPS time of week, latitude, longitude, height above mean sea level, horizontal accuracy)
+    (ms, degree, degree, m, m)
+    """
+    itow, lon, lat, height, h_msl, h_acc, v_acc = _POSLLH.unpack_from(payload)
+    return itow, lat * 1e-7, lon * 1e-7, h_msl * 1e-3, h_acc * 1e-3
+
+
+def decode_velned(payload):
+    """
+    :return: Tuple (GPS time of week, ground speed, heading of motion, velocity north, east, down)
+    (ms, m/s, degree, m/s, m/s, m/s)
+    """
+    itow, vel_n, vel_e, vel_d, speed, ground_speed, heading, s_acc, c_acc = _VELNED.unpack_from(payload)
+    return itow, ground_speed * 1e-2, heading * 1e-5, vel_n * 1e-2, vel_e * 1e-2, vel_d * 1e-2
+
+
+def decode_status(payload):
+    """
+    :return: Tuple (GPS time of week, fix type, fix ok) (ms, 0: no fix, 2: 2D, 3: 3D, ..., bool)
+    """
+    itow, fix_type, flags = _STATUS.unpack_from(payload)[:3]
+    return itow, fix_type, bool(flags & 0x01)
+
+
+def decode_pvt(payload):
+    """
+    :return: Tuple (GPS time of week, fix type, fix ok, number of satellites, latitude, longitude, height above mean
+    sea level, horizontal accuracy, ground speed, heading of motion, position dilution of precision)
+    (ms, 0: no fix, 2: 2D, 3: 3D, ..., bool, -, degree, degree, m, m, m/s, degree, -)
+    """
+    (itow, year, month, day, hour, minute, second, valid, t_acc, nano, fix_type, flags, flags2, satellites, lon, lat,
+     height, h_msl, h_acc, v_acc, vel_n, vel_e, vel_d, ground_speed, heading, s_acc, heading_acc,
+     p_dop) = _PVT.unpack_from(payload)
+    return (itow, fix_type, bool(flags & 0x01), satellites, lat * 1e-7, lon * 1e-7, h_msl * 1e-3, h_acc * 1e-3,
+            ground_speed * 1e-3, heading * 1e-5, p_dop * 0.01)
@@ -0,0 +1,277 @@
+"""
+Simulated replacements for the hardware, with the interfaces copter and main use: the serial connection to the
+Arduino, the BMP085, the QMC5883L, the gps module and the failsafe connection check. They all read from (and wait on)
+the Simulator they belong to.
+"""
+import math
+
+from simulation.quadcopter import channel_to_pulse
+
+# Conversion times of the BMP085 for the modes 0..3, see BMP085.BMP085_PRESSURE_DELAYS
+_bmp_temperature_time = 0.005
+_bmp_pressure_times = (0.005, 0.008, 0.014, 0.026)
+_meters_per_degree = 111300
+_status_interval = 0.1  # The Arduino sends its status every 25 loops of 4ms
+_loop_time = 4000  # Loop time of the Arduino in us
+
+
+class SimulatedSerial(object):
+    """
+    Stands in for the serial.Serial connection to the Arduino. Interprets the bytes written by flight_commands like
+    readSerial() of the Arduino code, answers the handshake of flight_commands.init() and then sends a status record
+    every _status_interval seconds like the Arduino's loop.
+    """
+
+    def __init__(self, simulator, battery_voltage=12.0):
+        """
+        :param battery_voltage: Battery voltage in V sent in the status records
+        """
+        self._simulator = simulator
+        self._battery_voltage = battery_voltage
+        self._buffer = bytearray(b'Ready!\r\n')
+        self._next_status_time = None
+        self._channel = 0
+        self._frame = []
+        self._sequence = None  # of the last valid frame
+        self.frame_errors = 0
+        self.lost_frames, self.repeated_frames = 0, 0
+        self._reported = (0, 0, 0)  # lost_frames, repeated_frames and frame_errors sent with the status records
+
+    def _send_status(self):
+        if self._next_status_time is None:
+            return
+        while self._next_status_time <= self._simulator.now():
+            vehicle = self._simulator.vehicle
+            esc = (channel_to_pulse(vehicle.channels[2]) - 1000) // 4 if vehicle.motors_on else 0
+            battery = int(self._battery_voltage / 0.06)
+            frames = (self.lost_frames, self.repeated_frames, self.frame_errors)
+            new_frames = [min(count - reported, 255) for count, reported in zip(frames, self._reported)]
+            self._reported = frames
+            self._buffer += b'Arduino: status\r\n' + bytes([esc, esc, esc, esc, battery, _loop_time // 16] + new_frames)
+            self._next_status_time += _status_interval
+
+    @property
+    def in_waiting(self):
+        self._send_status()
+        return len(self._buffer)
+
+    def readline(self):
+        self._send_status()
+        end = self._buffer.find(b'\n') + 1
+        if end == 0:
+            end = len(self._buffer)
+        line = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return line
+
+    def read(self, size=1):
+        self._send_status()
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def write(self, data):
+        vehicle = self._simulator.vehicle
+        for number in data:
+            if self._frame and number <= 200:
+                self._frame.append(number)
+                if len(self._frame) == 7:
+                    payload = self._frame[1:6]
+                    if sum(payload) % 200 == self._frame[6]:
+                        if self._sequence is not None:
+                            skipped = (payload[0] + 199 - self._sequence) % 200
+                            if skipped < 100:
+                                self.lost_frames += skipped
+                            else:
+                                self.repeated_frames += 1
+                        self._sequence = payload[0]
+                        vehicle.channels[:] = payload[1:]
+                    else:
+                        self.frame_errors += 1
+                    self._frame = []
+                continue
+            self._frame = []
+            if number == 0xF8:
+                self._frame = [number]
+                self._channel = 0
+            elif 0xFC <= number <= 0xFF:
+                self._channel = number - 0xFB
+            elif number <= 200 and self._channel > 0:
+                vehicle.channels[self._channel - 1] = number
+                self._channel = 0
+            else:
+                if number == 0xF9:
+                    self._buffer += b'Starting\r\n'
+                    self._next_status_time = self._simulator.now() + _status_interval
+                elif number == 0xFA:
+                    vehicle.motors_on = True
+                elif number == 0xFB:
+                    vehicle.motors_on = False
+                self._channel = 0
+        return len(data)
+
+
+class SimulatedBarometer(object):
+    """
+    Stands in for BMP085.BMP085. Every reading takes as long as the conversions of the real sensor, the non-blocking
+    interface refreshes the temperature like the real driver.
+    """
+
+    def __init__(self, simulator, ground_altitude=300.0, noise=0.15, mode=3, temperature_interval=10):
+        """
+        :param ground_altitude: Altitude of the starting point in meters
+        :param noise: Standard deviation of the altitude readings in meters
+        :param mode: Operating mode (BMP085_ULTRALOWPOWER..BMP085_ULTRAHIGHRES), sets the conversion time
+        :param temperature_interval: Number of pressure conversions between two temperature conversions
+        """
+        self._simulator = simulator
+        self._ground_altitude = ground_altitude
+        self._noise = noise
+        self._pressure_time = _bmp_pressure_times[mode]
+        self._temperature_interval = temperature_interval
+        self._pressure_samples = temperature_interval
+        self._ready_time = None
+        self._pressure_conversion = False
+
+    def _altitude(self):
+        return self._ground_altitude + self._simulator.vehicle.up + self._simulator.random.gauss(0, self._noise)
+
+    def read_temperature(self):
+        self._simulator.sleep(_bmp_temperature_time)
+        return 20.0
+
+    def read_altitude(self, sealevel_pa=101325.0):
+        self._simulator.sleep(_bmp_temperature_time + self._pressure_time)
+        return self._altitude()
+
+    def read_pressure(self):
+        self._simulator.sleep(_bmp_temperature_time + self._pressure_time)
+        return int(101325.0 * pow(1.0 - self._altitude() / 44330.0, 5.255))
+
+    def read_altitudes(self, count, sealevel_pa=101325.0):
+        self._simulator.sleep(_bmp_temperature_time + count * self._pressure_time)
+        return [self._altitude() for i in range(count)]
+
+    def read_sealevel_pressure(self, altitude_m=0.0):
+        return 101325.0
+
+    def start_conversion(self):
+        self._pressure_conversion = self._pressure_samples < self._temperature_interval
+        conversion_time = self._pressure_time if self._pressure_conversion else _bmp_temperature_time
+        self._ready_time = self._simulator.now() + conversion_time
+
+    def time_until_ready(self):
+        if self._ready_time is None:
+            return 0
+        return max(self._ready_time - self._simulator.now(), 0)
+
+    def poll(self):
+        if self._ready_time is None:
+            self.start_conversion()
+            return None
+        if self._simulator.now() < self._ready_time:
+            return None
+        if not self._pressure_conversion:
+            self._pressure_samples = 0
+            self.start_conversion()
+            return None
+        self._pressure_samples += 1
+        self.start_conversion()
+        return int(101325.0 * pow(1.0 - self._altitude() / 44330.0, 5.255))
+
+
+class SimulatedCompass(object):
+    """
+    Stands in for py_qmc5883l.QMC5883L and returns the heading of the simulated copter.
+    """
+
+    def __init__(self, simulator, noise=1.0, read_time=0.001):
+        """
+        :param noise: Standard deviation of the bearing in degrees
+        :param read_time: Time one reading takes in seconds
+        """
+        self._simulator = simulator
+        self._noise = noise
+        self._read_time = read_time
+        self.declination = 0.0
+
+    def get_bearing(self, timeout=0.2):
+        self._simulator.sleep(self._read_time)
+        bearing = math.degrees(self._simulator.vehicle.heading) + self._simulator.random.gauss(0, self._noise)
+        return bearing % 360.0
+
+
+class SimulatedGps(object):
+    """
+    Stands in for the gps module. Holds each fix until the next one, like the receiver sending at a fixed rate. Has
+    poll() and get_port() too, so main.main_run_async() reads it with a reader task like the receiver.
+    """
+
+    def __init__(self, simulator, start_lat=47.978, start_lon=60.2208, rate=1.0, noise=1.0):
+        """
+        :param start_lat: Latitude of the starting point in degrees
+        :param start_lon: Longitude of the starting point in degrees
+        :param rate: Fixes per second
+        :param noise: Standard deviation of the position in meters
+        """
+        self._simulator = simulator
+        self._start_lat = start_lat
+        self._start_lon = start_lon
+        self._interval = 1 / rate
+        self._noise = noise
+        self._fix_time = None
+        self._values = 0, 0, 0, 0
+
+    def get_values(self):
+        """
+        :return: Tuple (latitude, longitude, speed over ground, true track) (radian, radian, m/s, radian)
+        """
+        now = self._simulator.now()
+        if self._fix_time is None or now - self._fix_time >= self._interval:
+            self._fix_time = now
+            vehicle = self._simulator.vehicle
+            random = self._simulator.random
+            north = vehicle.north + random.gauss(0, self._noise)
+            east = vehicle.east + random.gauss(0, self._noise)
+            lat = self._start_lat + north / _meters_per_degree
+            lon = self._start_lon + east / (_meters_per_degree * math.cos(math.radians(lat)))
+            speed, track = vehicle.ground_speed()
+            self._values = math.radians(lat), math.radians(lon), speed, track
+        return self._values
+
+    def get_fix_time(self):
+        return self._fix_time
+
+    def poll(self):
+        pass  # the fix is computed in get_values()
+
+    def get_port(self):
+        return None  # no file descriptor, main.main_run_async() polls it once per period of its reader task
+
+    def finish(self):
+        pass
+
+
+class SimulatedLink(object):
+    """
+    Stands in for control.failsafe. The connection is up until lost_time (if given).
+    """
+
+    def __init__(self, simulator, lost_time=None):
+        """
+        :param lost_time: Simulated time in seconds at which the connection to the ground station is lost
+        """
+        self._simulator = simulator
+        self._lost_time = lost_time
+
+    def init(self):
+        pass
+
+    def check_connection_now(self):
+        return self.get_connection_up()
+
+    def get_connection_up(self):
+        return self._lost_time is None or self._simulator.now() < self._lost_time
+
+    def finish(self):
+        pass
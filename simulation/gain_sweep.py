@@ -0,0 +1,176 @@
+"""
+Sweep of the controller gains in the simulation: every gain set (from a grid or sampled randomly) flies a hop in place
+with the simulator, the runs are spread over all CPU cores. Each run is scored by overshoot, settling time,
+steady-state error and saturation of the commands, the results are written to a CSV table, best first.
+The gains are the module variables at the top of control/controller.py, e.g. _proportional_factor_height.
+
+Usage (from the repository root):
+    python -m simulation.gain_sweep [number of random gain sets] [output file]
+Without a number the default grid (_default_grid) is flown, the default output file is gain_sweep.csv.
+"""
+import csv
+import functools
+import itertools
+import multiprocessing
+import random
+import sys
+import time
+
+import numpy as np
+
+from control import controller
+import missions.hop_in_place as hop_in_place
+from simulation.simulator import Simulator
+
+_default_grid = {
+    "_proportional_factor_height": [0.5, 1, 2],
+    "_integral_factor_height": [0, 2, 4, 8],
+    "_differential_factor_height": [0.4, 0.8, 1.6],
+}
+_default_ranges = {
+    "_proportional_factor_height": (0.2, 3),
+    "_integral_factor_height": (0, 10),
+    "_differential_factor_height": (0.1, 2),
+    "_proportional_factor_climb_rate": (0.2, 3),
+    "_integral_factor_climb_rate": (0, 10),
+    "_differential_factor_climb_rate": (0, 0.5),
+}
+_trace_interval = 0.05  # s between the samples of the copter state that are scored
+_takeoff_height = 0.05  # m, the flight is scored from the first sample above
+_settling_band = 0.2  # m, maximal height error after the settling time
+_steady_state_time = 3  # s at the end of the flight the steady-state error is averaged over
+_weights = {"overshoot": 1, "settling_time": 0.1, "steady_state_error": 2, "saturation": 1}
+"""
+Weights of the scores in the cost the runs are sorted by
+"""
+SCORES = ("overshoot", "settling_time", "steady_state_error", "saturation", "drift", "cost")
+"""
+Columns of the results besides the gains: overshoot above the target height (m), time from the takeoff until the
+height stays within _settling_band (s, the time from the takeoff to the end of the flight if it doesn't), mean height
+error at the end (m), part of the samples with a command at its limit, maximal horizontal distance from the start (m),
+weighted sum of the first four
+"""
+
+
+def grid(values):
+    """
+    :param values: Dictionary of gain name to the list of its values
+    :return: All combinations as list of dictionaries gain name to value
+    :rtype: list
+    """
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*(values[name] for name in names))]
+
+
+def random_sample(ranges, number, seed=0):
+    """
+    :param ranges: Dictionary of gain name to a tuple (lowest, highest value)
+    :param number: Number of gain sets
+    :param seed: Seed of the random numbers, so that a sample is repeatable
+    :return: Gain sets with values uniformly distributed in the ranges as list of dictionaries gain name to value
+    :rtype: list
+    """
+    generator = random.Random(seed)
+    return [{name: generator.uniform(low, high) for name, (low, high) in ranges.items()} for i in range(number)]
+
+
+def score(trace, target_height):
+    """
+    :param trace: Simulator.trace of a hop to the target height
+    :param target_height: Target height of the hop in m
+    :return: Dictionary of the scores (see SCORES)
+    :rtype: dict
+    """
+    times = np.array([sample[0] for sample in trace])
+    east, north, up = (np.array([sample[index] for sample in trace]) for index in (1, 2, 3))
+    channels = np.array([sample[5] for sample in trace])
+    airborne = np.flatnonzero(up > _takeoff_height)
+    if len(airborne) == 0:
+        return dict(overshoot=np.nan, settling_time=np.inf, steady_state_error=np.nan, saturation=np.nan,
+                    drift=np.nan, cost=np.inf)
+    takeoff = airborne[0]
+    error = up[takeoff:] - target_height
+    outside = np.flatnonzero(np.abs(error) > _settling_band)
+    if len(outside) == 0:
+        settling_time = 0.0
+    elif outside[-1] == len(error) - 1:
+        settling_time = times[-1] - times[takeoff]  # never settled: a finite penalty, so that the cost still orders
+    else:
+        settling_time = times[takeoff + outside[-1] + 1] - times[takeoff]
+    scores = dict(overshoot=max(np.max(error), 0.0), settling_time=settling_time,
+                  steady_state_error=abs(np.mean(error[times[takeoff:] >= times[-1] - _steady_state_time])),
+                  saturation=np.mean(np.any((channels[takeoff:] == 0) | (channels[takeoff:] == 200), axis=1)),
+                  drift=np.max(np.hypot(east, north)))
+    scores["cost"] = sum(weight * scores[name] for name, weight in _weights.items())
+    return scores
+
+
+def evaluate(gains, target_height=2.0, duration=30.0, seed=0):
+    """
+    Flies a hop in place with the given gains in the simulation, without landing.
+    :param gains: Dictionary of gain name (module variable of control.controller) to value, the other gains keep their
+    values
+    :param target_height: Target height of the hop in m
+    :param duration: Simulated time in seconds
+    :param seed: Seed of the sensor noise
+    :return: Dictionary of the scores (see SCORES)
+    :rtype: dict
+    """
+    for name, value in gains.items():
+        if not hasattr(controller, name):
+            raise ValueError("control.controller has no gain " + name)
+        setattr(controller, name, value)
+    simulator = Simulator(seed=seed, max_time=duration, trace_interval=_trace_interval)
+    simulator.run(hop_in_place.HopInPlaceMission(target_height=target_height, wait_time=duration))
+    return score(simulator.trace, target_height)
+
+
+def sweep(gain_sets, processes=None, **kwargs):
+    """
+    Evaluates the gain sets in a pool of processes.
+    :param gain_sets: List of dictionaries gain name to value, all with the same names
+    :param processes: Number of processes, the number of CPU cores if None
+    :param kwargs: Passed on to evaluate()
+    :return: Structured array with a column per gain and per score (see SCORES), sorted by the cost
+    :rtype: np.ndarray
+    """
+    names = list(gain_sets[0])
+    results = np.zeros(len(gain_sets), dtype=[(name, "<f8") for name in names + list(SCORES)])
+    with multiprocessing.Pool(processes) as pool:
+        for index, scores in enumerate(pool.imap(functools.partial(evaluate, **kwargs), gain_sets)):
+            results[index] = tuple(gain_sets[index][name] for name in names) + tuple(scores[name] for name in SCORES)
+    return np.sort(results, order="cost")
+
+
+def write_table(results, path):
+    """
+    Writes the results of sweep() to a CSV file with a header line.
+    :return: None
+    """
+    with open(path, 'w', newline='') as table_file:
+        writer = csv.writer(table_file)
+        writer.writerow(results.dtype.names)
+        writer.writerows(results.tolist())
+
+
+def print_table(results, number=10):
+    """
+    Prints the first rows of the results of sweep().
+    :return: None
+    """
+    names = [name.strip("_").replace("proportional_factor", "P").replace("integral_factor", "I")
+             .replace("differential_factor", "D") for name in results.dtype.names]
+    print(" ".join("%12s" % name[:12] for name in names))
+    for row in results[:number]:
+        print(" ".join("%12.3f" % value for value in row))
+
+
+if __name__ == "__main__":
+    gain_sets = random_sample(_default_ranges, int(sys.argv[1])) if len(sys.argv) > 1 else grid(_default_grid)
+    output = sys.argv[2] if len(sys.argv) > 2 else "gain_sweep.csv"
+    wall_start = time.perf_counter()
+    results = sweep(gain_sets)
+    print("Flew %d gain sets in %.1f s on %d cores." % (len(results), time.perf_counter() - wall_start,
+                                                       multiprocessing.cpu_count()))
+    print_table(results)
+    write_table(results, output)
@@ -0,0 +1,70 @@
+"""
+Check of the gps reader task of main.main_run_async(): in a simulated flight the gps is read by a task named "gps
+reader" of the event loop, and on the hardware (use_gps, no gps_device given, like python main.py --asyncio)
+main_run_async() initializes sensors.gps for polling and passes it on as gps_device, so the same task reads the
+receiver.
+
+Usage (from the repository root):
+    python -m simulation.gps_reader
+Exits with status 1 if a check fails.
+"""
+import sys
+
+import copter
+import main
+import sensors.gps as gps
+from control import event_loop
+from simulation.simulator import Simulator
+
+
+def fly_tasks(max_time=20.0):
+    """
+    Flies the default mission with main.main_run_async() in the simulation.
+    :param max_time: Simulated time in seconds after which the flight is ended anyway
+    :return: The tasks of the event loop (scheduler.Task) by name, and the time of the last gps fix given to the copter
+    :rtype: tuple
+    """
+    reported = []
+    report = event_loop.report
+    event_loop.report = reported.extend
+    try:
+        Simulator(max_time=max_time).run(asynchronous=True)
+    finally:
+        event_loop.report = report
+    return {task.name: task for task in reported}, copter.get_state().gps_time
+
+
+def hardware_devices():
+    """
+    Calls main.main_run_async() like on the hardware (use_gps, no gps_device given) with gps.init() and
+    main._main_async() replaced, so no hardware is used and nothing flies.
+    :return: The keyword arguments of gps.init() and the devices main_run_async() passed to _main_async()
+    :rtype: tuple
+    """
+    calls = {}
+
+    def init(**kwargs):
+        calls["init"] = kwargs
+
+    async def main_async(base_mission, link, log_directory, devices, executor):
+        calls["devices"] = devices
+
+    init_gps, run_async = gps.init, main._main_async
+    gps.init, main._main_async = init, main_async
+    try:
+        main.main_run_async(sensor_threads=False, use_gps=True)
+    finally:
+        gps.init, main._main_async = init_gps, run_async
+    return calls.get("init"), calls.get("devices")
+
+
+if __name__ == "__main__":
+    tasks, gps_time = fly_tasks()
+    reader = tasks.get("gps reader")
+    print("Simulated flight: " + (reader.report() if reader is not None else "no gps reader task") +
+          (", last gps fix at %.1f s" % gps_time if gps_time is not None else ", no gps fix"))
+    init_arguments, devices = hardware_devices()
+    passed = devices is not None and devices.get("gps_device") is gps
+    print("Hardware: gps.init(%s), gps_device %s" % (init_arguments, "sensors.gps" if passed else "missing"))
+    sys.exit(0 if reader is not None and reader.runs > 0 and gps_time is not None and passed and
+             init_arguments == {"start_thread": False} else 1)
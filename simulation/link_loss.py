@@ -0,0 +1,65 @@
+"""
+Check of the failsafe in the simulation: a mission written as generator (see mission_runtime) climbs and hovers, the
+connection to the ground station is lost while it sleeps. The failsafe must preempt the mission with an emergency
+landing, so the copter lands long before the hover would have ended.
+
+Usage (from the repository root):
+    python -m simulation.link_loss
+Exits with status 1 if the copter didn't land in time.
+"""
+import sys
+
+import copter
+import main
+import mission_runtime
+import missions.emergency_landing_mission as emergency
+from control import flight_commands
+from simulation.simulator import Simulator
+
+_landed_height = 0.5  # m, the copter counts as landed below (EmergencyLandingMission ends the flight there)
+
+
+class HoverMission(mission_runtime.GeneratorMission):
+    """
+    Climbs to the height, hovers for the given time and lands.
+    """
+
+    def __init__(self, height=3.0, hover_time=60.0):
+        super().__init__()
+        self._height = height
+        self._hover_time = hover_time
+
+    def run(self, as_base):
+        main.set_parameters(speed=0)
+        main.set_alternative_parameters(climb_rate=0.5)
+        if as_base:
+            flight_commands.start()
+        yield mission_runtime.WaitUntil(lambda: copter.get_state().height >= self._height - 0.2)
+        main.set_parameters(height=self._height, speed=0)
+        yield mission_runtime.Sleep(self._hover_time)
+        yield mission_runtime.SubMission(emergency.EmergencyLandingMission())
+
+
+def fly(link_lost_time=10.0, hover_time=60.0, max_time=150.0):
+    """
+    Flies a HoverMission in the simulation and loses the connection at the given time.
+    :param link_lost_time: Simulated time in seconds at which the connection is lost, None to keep it
+    :param hover_time: Time in seconds the mission hovers
+    :param max_time: Simulated time in seconds after which the flight is ended anyway
+    :return: The simulator after the flight
+    :rtype: Simulator
+    """
+    simulator = Simulator(max_time=max_time, link_lost_time=link_lost_time)
+    simulator.run(HoverMission(hover_time=hover_time))
+    return simulator
+
+
+if __name__ == "__main__":
+    lost_time, hover = 10.0, 60.0
+    simulator = fly(lost_time, hover)
+    vehicle = simulator.vehicle
+    hovering = [up for t, east, north, up, heading, channels in simulator.trace if lost_time - 1 <= t <= lost_time]
+    landed = vehicle.up < _landed_height and simulator.time < lost_time + hover
+    print("Connection lost at %.1f s at %.2f m height, flight ended at %.1f s at %.2f m height: %s" % (
+        lost_time, max(hovering), simulator.time, vehicle.up, "landed" if landed else "NOT LANDED"))
+    sys.exit(0 if landed and max(hovering) > 1.0 else 1)
@@ -0,0 +1,105 @@
+import math
+
+_g = 9.81
+
+
+def channel_to_pulse(value):
+    """
+    Converts a channel value as sent by flight_commands (0..200) to the pulse width the Arduino uses, like readSerial()
+    in the Arduino code.
+    :param value: Channel value between 0 and 200
+    :return: Pulse width in microseconds between 1000 and 2000
+    :rtype: int
+    """
+    return 1000 + 5 * value
+
+
+class Quadcopter(object):
+    """
+    Rigid-body model of the copter together with the Arduino flight controller in auto-level mode. The Arduino
+    stabilizes the attitude, so the roll and pitch channels set a tilt angle (reached with a first order lag), the yaw
+    channel sets a yaw rate and the throttle channel sets the thrust. Positions are in meters east, north and up of the
+    starting point, angles in radian (heading clockwise from north).
+    """
+
+    def __init__(self, mass=1.2, hover_throttle=0.5, tilt_per_us=math.radians(1 / 15), tilt_time_constant=0.15,
+                 yaw_rate_per_us=math.radians(1 / 3), drag=0.4, wind=(0, 0), heading=0):
+        """
+        :param mass: Mass of the copter in kg
+        :param hover_throttle: Throttle (0..1 of the pulse range) at which the thrust equals the weight
+        :param tilt_per_us: Tilt angle (radian) per microsecond the roll/pitch pulse differs from 1500us
+        :param tilt_time_constant: Time constant (seconds) of the attitude reaching its set point
+        :param yaw_rate_per_us: Yaw rate (radian per second) per microsecond the yaw pulse differs from 1500us
+        :param drag: Linear drag coefficient (1/s), acceleration per m/s of speed relative to the air
+        :param wind: Wind speed (east, north) in m/s
+        :param heading: Initial heading in radian
+        """
+        self.mass = mass
+        self.hover_throttle = hover_throttle
+        self.tilt_per_us = tilt_per_us
+        self.tilt_time_constant = tilt_time_constant
+        self.yaw_rate_per_us = yaw_rate_per_us
+        self.drag = drag
+        self.wind = wind
+
+        self.east, self.north, self.up = 0.0, 0.0, 0.0
+        self.v_east, self.v_north, self.v_up = 0.0, 0.0, 0.0
+        self.heading = heading
+        self.tilt_forward, self.tilt_right = 0.0, 0.0
+        self.channels = [100, 100, 0, 100]
+        """
+        Last received channel values (0..200) for roll, pitch, throttle and yaw
+        """
+        self.motors_on = False
+
+    def step(self, dt):
+        """
+        Integrates the model by dt seconds (explicit Euler, keep dt small, e.g. 5ms).
+        :param dt: Time step in seconds
+        :return: None
+        """
+        roll_us, pitch_us, throttle_us, yaw_us = [channel_to_pulse(value) for value in self.channels]
+
+        # A pulse above 1500us on the pitch/roll channel makes the copter accelerate backwards/to the left, matching
+        # the signs used by controller.control().
+        target_forward = -(pitch_us - 1500) * self.tilt_per_us
+        target_right = -(roll_us - 1500) * self.tilt_per_us
+        tilt_factor = min(dt / self.tilt_time_constant, 1)
+        self.tilt_forward += (target_forward - self.tilt_forward) * tilt_factor
+        self.tilt_right += (target_right - self.tilt_right) * tilt_factor
+
+        if self.motors_on:
+            thrust = (throttle_us - 1000) / 1000 / self.hover_throttle * self.mass * _g
+            if throttle_us > 1050:  # The Arduino doesn't yaw when the motors are (nearly) turned off
+                self.heading = (self.heading + (yaw_us - 1500) * self.yaw_rate_per_us * dt) % (2 * math.pi)
+        else:
+            thrust = 0
+
+        acc = thrust / self.mass
+        acc_forward = acc * math.sin(self.tilt_forward)
+        acc_right = acc * math.sin(self.tilt_right)
+        acc_up = acc * math.cos(self.tilt_forward) * math.cos(self.tilt_right) - _g
+        sin_h, cos_h = math.sin(self.heading), math.cos(self.heading)
+        acc_north = acc_forward * cos_h - acc_right * sin_h - self.drag * (self.v_north - self.wind[1])
+        acc_east = acc_forward * sin_h + acc_right * cos_h - self.drag * (self.v_east - self.wind[0])
+        acc_up -= self.drag * self.v_up
+
+        self.v_east += acc_east * dt
+        self.v_north += acc_north * dt
+        self.v_up += acc_up * dt
+        self.east += self.v_east * dt
+        self.north += self.v_north * dt
+        self.up += self.v_up * dt
+
+        if self.up <= 0 and self.v_up <= 0:  # standing on the ground
+            self.up = 0.0
+            self.v_east, self.v_north, self.v_up = 0.0, 0.0, 0.0
+
+    def ground_speed(self):
+        """
+        :return: Speed over ground in m/s and true track in radian from north
+        :rtype: (float, float)
+        """
+        speed = math.hypot(self.v_east, self.v_north)
+        track = math.atan2(self.v_east, self.v_north) % (2 * math.pi)
+        return speed, track
@@ -0,0 +1,182 @@
+"""
+Deterministic replay of flights recorded by control.flight_recorder: the recorded sensor values are fed to
+controller.control() (and the missions, if a base mission is given) record by record, without hardware and without
+waiting, so hours of flight data are replayed in seconds. The channel commands that would have been sent are compared
+to the recorded ones, e.g. to check the effect of a change of the gains or of a mission. Without changes, only the
+yaw command of the first record can differ, as it depends on the heading before the recording started.
+
+Usage (from the repository root):
+    python -m simulation.replay logfile [logfile ...]
+"""
+import contextlib
+import os
+import sys
+import time
+
+import numpy as np
+
+import clock
+import copter
+import main
+from control import controller
+from control import flight_commands
+from control import flight_recorder
+
+
+class CapturingSerial(object):
+    """
+    Stands in for the serial.Serial connection to the Arduino. Answers the handshake of flight_commands.init() and keeps
+    the channel values of the last setpoint frame written by flight_commands.send_setpoints().
+    """
+
+    def __init__(self):
+        self._lines = [b'Ready!\r\n', b'Starting\r\n']
+        self.channels = None
+        """
+        Channel values (roll, pitch, throttle, yaw) of the last frame, 0..200, None if no frame was written yet
+        """
+
+    @property
+    def in_waiting(self):
+        return 0
+
+    def readline(self):
+        if self._lines:
+            return self._lines.pop(0)
+        return b''
+
+    def read(self, size=1):
+        return b''
+
+    def write(self, data):
+        if len(data) == 7 and data[0] == 0xF8:
+            self.channels = tuple(data[2:6])
+        return len(data)
+
+
+class Replay(object):
+    """
+    Replays recorded flights, see the module description.
+    """
+
+    def __init__(self, records, mission_rate=main._mission_rate):
+        """
+        :param records: Array of flight_recorder.RECORD_DTYPE of one flight, e.g. from flight_recorder.read_log()
+        :param mission_rate: Calls of the mission per second (like the scheduler of main.main_run())
+        """
+        if len(records) == 0:
+            raise ValueError("No records to replay")
+        self.records = records
+        self._mission_period = 1 / mission_rate
+        self.time = records["time"][0]
+
+    @classmethod
+    def from_files(cls, paths, **kwargs):
+        """
+        :param paths: Log files of one flight in the order they were written (e.g. from flight_recorder.get_log_files())
+        :return: A Replay of the records of all files
+        """
+        return cls(np.concatenate([flight_recorder.read_log(path) for path in paths]), **kwargs)
+
+    def now(self):
+        """
+        :return: The time of the record currently replayed in seconds (copter.get_time() of the recorded flight)
+        """
+        return self.time
+
+    def sleep(self, seconds):
+        """
+        Doesn't wait, time only passes from record to record.
+        """
+        pass
+
+    def _set_values(self, record, record_time=None):
+        self.time = record["time"] if record_time is None else record_time
+        copter.set_values(self.time, record["height"], record["climb_rate"], record["heading"], record["speed"],
+                          record["track"], (record["latitude"], record["longitude"]),
+                          (record["east"], record["north"]))
+
+    def run(self, base_mission=None, quiet=True):
+        """
+        Calls controller.control() with the values of every record. If base_mission is None, the controller gets the
+        recorded targets, otherwise the targets set by the base mission (and its sub-missions), which is started with
+        the first record and called after the control calls at mission_rate like in main.main_run().
+        :param base_mission: Mission to fly instead of the recorded targets
+        :param quiet: Discard what the flight software prints
+        :return: Array (records x 4) of the channel values (roll, pitch, throttle, yaw, 0..200) that would have been
+        sent, one row per record. The replay ends early if the mission finishes the flight, the remaining rows are -1.
+        :rtype: np.ndarray
+        """
+        commands = np.full((len(self.records), 4), -1, dtype=np.int16)
+        port = CapturingSerial()
+        clock.set_source(self.now, self.sleep)
+        try:
+            with open(os.devnull, 'w') as devnull, \
+                    contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+                flight_commands.init(port)
+                first = self.records[0]
+                self._set_values(first, first["time"] - first["period"])  # the time of the previous control call
+                controller.init()
+                if base_mission is not None:
+                    main.reset(base_mission)
+                    main.start_base_mission()
+                next_mission_time = self.records["time"][0]
+
+                for i, record in enumerate(self.records):
+                    self._set_values(record)
+                    if base_mission is None:
+                        targets = (None if np.isnan(record["target_height"]) else record["target_height"],
+                                   None if np.isnan(record["target_climb_rate"]) else record["target_climb_rate"],
+                                   record["target_heading"], record["target_course"], record["target_speed"])
+                    else:
+                        if not main.is_flying():
+                            break
+                        targets = main.get_parameters()
+                    port.channels = None
+                    controller.control(*targets)
+                    if port.channels is not None:
+                        commands[i] = port.channels
+                    if base_mission is not None and record["time"] >= next_mission_time:
+                        main.mission_tick()
+                        while next_mission_time <= record["time"]:
+                            next_mission_time += self._mission_period
+        finally:
+            clock.reset()
+        return commands
+
+    def get_recorded_commands(self):
+        """
+        :return: Array (records x 4) of the channel values (roll, pitch, throttle, yaw, 0..200) sent in the recorded
+        flight
+        :rtype: np.ndarray
+        """
+        percents = np.stack([self.records[channel] for channel in ("roll", "pitch", "throttle", "yaw")], axis=1)
+        return np.clip((percents * 2).astype(np.int16), 0, 200)  # like flight_commands.send_setpoints()
+
+    def compare(self, commands):
+        """
+        Prints how much the given channel values (from run()) differ from the recorded ones.
+        :param commands: Array (records x 4) returned by run()
+        :return: Number of records with at least one different channel value
+        :rtype: int
+        """
+        recorded = self.get_recorded_commands()
+        replayed = commands >= 0
+        differences = np.abs(commands - recorded) * replayed
+        different = int(np.count_nonzero(differences.max(axis=1)))
+        print("Replayed %d of %d records, %d differ." % (np.count_nonzero(replayed.all(axis=1)), len(commands),
+                                                         different))
+        for index, channel in enumerate(("roll", "pitch", "throttle", "yaw")):
+            print("%s: %d differences, max %d" % (channel, np.count_nonzero(differences[:, index]),
+                                                  differences[:, index].max()))
+        return different
+
+
+if __name__ == "__main__":
+    replay = Replay.from_files(sys.argv[1:])
+    wall_start = time.perf_counter()
+    replayed_commands = replay.run()
+    wall_time = time.perf_counter() - wall_start
+    flight_time = replay.records["time"][-1] - replay.records["time"][0]
+    print("Replayed %.1f s of flight in %.2f s (%.0fx real time)." % (flight_time, wall_time, flight_time / wall_time))
+    replay.compare(replayed_commands)
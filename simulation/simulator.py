@@ -0,0 +1,118 @@
+"""
+Software-in-the-loop simulation: runs main.main_run() against a simulated copter on a virtual clock. Time only passes
+when the flight software waits (e.g. for the pressure sensor conversion), so a flight runs as fast as the CPU allows.
+
+Usage (from the repository root):
+    python -m simulation.simulator [waypointfile]
+"""
+import contextlib
+import os
+import random
+import sys
+import time
+
+import clock
+import main
+from simulation.devices import SimulatedSerial, SimulatedBarometer, SimulatedCompass, SimulatedGps, SimulatedLink
+from simulation.quadcopter import Quadcopter
+
+
+class Simulator(object):
+    """
+    Holds the virtual clock, the copter model and the simulated devices.
+    """
+
+    def __init__(self, vehicle=None, step=0.005, seed=0, max_time=None, link_lost_time=None, trace_interval=0.1,
+                 gps_rate=5.0, start_lat=47.978, start_lon=60.2208, log_directory=None):
+        """
+        :param vehicle: The Quadcopter model to fly, a default one if None
+        :param step: Maximal integration time step of the model in seconds
+        :param seed: Seed of the sensor noise, so that runs are repeatable
+        :param max_time: Simulated time in seconds after which main.flight_finished() is called, None for no limit
+        :param link_lost_time: Simulated time in seconds at which the connection to the ground station is lost
+        :param trace_interval: Interval in seconds in which the copter state is appended to trace
+        :param gps_rate: Fixes per second of the simulated gps
+        :param start_lat: Latitude of the starting point in degrees
+        :param start_lon: Longitude of the starting point in degrees
+        :param log_directory: Directory for the log files of the flight recorder, None to not write them
+        """
+        self.vehicle = vehicle if vehicle is not None else Quadcopter()
+        self.random = random.Random(seed)
+        self.time = 0.0
+        self.trace = []
+        """
+        List of tuples (time, east, north, up, heading, channels) sampled every trace_interval seconds
+        """
+        self._step = step
+        self._max_time = max_time
+        self._trace_interval = trace_interval
+        self._log_directory = log_directory
+        self._next_trace_time = 0.0
+
+        self.serial_port = SimulatedSerial(self)
+        self.barometer = SimulatedBarometer(self)
+        self.compass = SimulatedCompass(self)
+        self.gps = SimulatedGps(self, start_lat, start_lon, rate=gps_rate)
+        self.link = SimulatedLink(self, link_lost_time)
+
+    def now(self):
+        """
+        :return: The simulated time in seconds
+        """
+        return self.time
+
+    def sleep(self, seconds):
+        """
+        Advances the simulated time, integrating the copter model meanwhile.
+        :param seconds: Time to advance in seconds
+        :return: None
+        """
+        end = self.time + seconds
+        while self.time < end:
+            dt = min(self._step, end - self.time)
+            self.vehicle.step(dt)
+            self.time += dt
+            if self.time >= self._next_trace_time:
+                vehicle = self.vehicle
+                self.trace.append((self.time, vehicle.east, vehicle.north, vehicle.up, vehicle.heading,
+                                   tuple(vehicle.channels)))
+                self._next_trace_time += self._trace_interval
+        if self._max_time is not None and self.time >= self._max_time:
+            main.flight_finished()
+
+    def devices(self):
+        """
+        :return: The simulated devices as keyword arguments for copter.init()
+        :rtype: dict
+        """
+        return dict(serial_port=self.serial_port, compass_device=self.compass, bmp_device=self.barometer,
+                    gps_device=self.gps, sensor_threads=False)
+
+    def run(self, base_mission=None, quiet=True, asynchronous=False):
+        """
+        Flies the given mission with main.main_run() on the simulated time.
+        :param base_mission: Passed on to main.main_run()
+        :param quiet: Discard what the flight software prints
+        :param asynchronous: Fly with main.main_run_async() instead
+        :return: None
+        """
+        run = main.main_run_async if asynchronous else main.main_run
+        clock.set_source(self.now, self.sleep)
+        try:
+            with open(os.devnull, 'w') as devnull, \
+                    contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+                run(base_mission, link=self.link, log_directory=self._log_directory, **self.devices())
+        finally:
+            clock.reset()
+
+
+if __name__ == "__main__":
+    import missions.fly_waypoints as fly_way
+
+    simulator = Simulator(max_time=600)
+    wall_start = time.perf_counter()
+    simulator.run(fly_way.FlyWaypointsMission(sys.argv[1] if len(sys.argv) > 1 else 'waypoints_test.txt'))
+    wall_time = time.perf_counter() - wall_start
+    vehicle = simulator.vehicle
+    print("Simulated %.1f s in %.2f s (%.0fx real time)." % (simulator.time, wall_time, simulator.time / wall_time))
+    print("Final position (m): east %.2f, north %.2f, up %.2f" % (vehicle.east, vehicle.north, vehicle.up))
@@ -0,0 +1,180 @@
+"""
+Replayable byte stream of a u-blox receiver, to run the gps module (with UBX) without the receiver: ByteStreamSerial
+stands in for the serial port and serves a recorded stream (e.g. saved with "cat /dev/ttyAMA0 > stream.ubx" after
+configuring the receiver) or one generated by generate_stream().
+
+Usage (from the repository root):
+    python -m simulation.ubx_fixture [stream file]
+"""
+import math
+import struct
+import time
+
+from sensors import ubx
+
+_meters_per_degree = 111300
+
+
+class ByteStreamSerial(object):
+    """
+    Stands in for the serial.Serial connection to the gps. read() returns the stream in chunks like the UART driver,
+    written bytes (the configuration messages) are collected in written.
+    """
+
+    def __init__(self, data, chunk_size=64):
+        """
+        :param data: The bytes to serve
+        :param chunk_size: Maximal number of bytes returned by one read()
+        """
+        self._data = data
+        self._position = 0
+        self._chunk_size = chunk_size
+        self.baudrate = 9600
+        self.written = bytearray()
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path, 'rb') as stream_file:
+            return cls(stream_file.read(), **kwargs)
+
+    @property
+    def in_waiting(self):
+        return min(len(self._data) - self._position, self._chunk_size)
+
+    def read(self, size=1):
+        data = self._data[self._position:self._position + min(size, self._chunk_size)]
+        self._position += len(data)
+        return data
+
+    def readline(self):
+        end = self._data.find(b'\n', self._position) + 1
+        if end == 0:
+            end = len(self._data)
+        data = self._data[self._position:end]
+        self._position = end
+        return data
+
+    def write(self, data):
+        self.written += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        pass
+
+    def get_size(self):
+        """
+        :return: Length of the whole stream in bytes
+        :rtype: int
+        """
+        return len(self._data)
+
+    def at_end(self):
+        """
+        :return: If the whole stream has been read
+        :rtype: bool
+        """
+        return self._position >= len(self._data)
+
+
+def nav_posllh(itow, lat, lon, height, h_acc=2.5):
+    """
+    :return: NAV-POSLLH message for the position (degree, degree, m above mean sea level, m)
+    :rtype: bytes
+    """
+    payload = struct.pack('<IiiiiII', itow, int(round(lon * 1e7)), int(round(lat * 1e7)), int(height * 1000),
+                          int(height * 1000), int(h_acc * 1000), int(h_acc * 2000))
+    return ubx.message(ubx.CLASS_NAV, ubx.NAV_POSLLH, payload)
+
+
+def nav_velned(itow, vel_n, vel_e, vel_d=0.0):
+    """
+    :return: NAV-VELNED message for the velocity (m/s north, east, down)
+    :rtype: bytes
+    """
+    ground_speed = math.hypot(vel_n, vel_e)
+    heading = math.degrees(math.atan2(vel_e, vel_n)) % 360
+    payload = struct.pack('<IiiiIIiII', itow, int(round(vel_n * 100)), int(round(vel_e * 100)),
+                          int(round(vel_d * 100)), int(round(math.hypot(ground_speed, vel_d) * 100)),
+                          int(round(ground_speed * 100)), int(round(heading * 1e5)), 50, 100000)
+    return ubx.message(ubx.CLASS_NAV, ubx.NAV_VELNED, payload)
+
+
+def nav_status(itow, fix_type=3):
+    """
+    :return: NAV-STATUS message, the fix is ok if fix_type is 2..4
+    :rtype: bytes
+    """
+    flags = 0x01 if 2 <= fix_type <= 4 else 0x00
+    return ubx.message(ubx.CLASS_NAV, ubx.NAV_STATUS, struct.pack('<IBBBBII', itow, fix_type, flags, 0, 0, 30000,
+                                                                   itow))
+
+
+def nav_pvt(itow, lat, lon, height, vel_n, vel_e, satellites=9, fix_type=3):
+    """
+    :return: NAV-PVT message (92 bytes payload) for the position and velocity like nav_posllh() and nav_velned()
+    :rtype: bytes
+    """
+    ground_speed = math.hypot(vel_n, vel_e)
+    heading = math.degrees(math.atan2(vel_e, vel_n)) % 360
+    flags = 0x01 if 2 <= fix_type <= 4 else 0x00
+    payload = struct.pack('<IHBBBBBBIiBBBBiiiiIIiiiiiIIH', itow, 2026, 10, 18, 12, 0, (itow // 1000) % 60, 0x07, 50,
+                          0, fix_type, flags, 0, satellites, int(round(lon * 1e7)), int(round(lat * 1e7)),
+                          int(height * 1000), int(height * 1000), 2500, 5000, int(round(vel_n * 1000)),
+                          int(round(vel_e * 1000)), 0, int(round(ground_speed * 1000)), int(round(heading * 1e5)),
+                          500, 100000, 150)
+    return ubx.message(ubx.CLASS_NAV, ubx.NAV_PVT, payload + bytes(92 - len(payload)))
+
+
+def generate_stream(duration=10.0, rate=5, start_lat=47.978, start_lon=60.2208, height=412.0, velocity=(1.0, 0.5),
+                    pvt=False, no_fix_time=1.0):
+    """
+    Generates the output of a receiver moving with constant velocity.
+    :param duration: Length of the stream in seconds
+    :param rate: Navigation solutions per second
+    :param velocity: Tuple (north, east) in m/s
+    :param pvt: Send NAV-PVT (like a NEO-M8) instead of NAV-POSLLH, NAV-VELNED and NAV-STATUS (like a NEO-6M)
+    :param no_fix_time: Time in seconds without fix at the beginning
+    :return: The byte stream
+    :rtype: bytes
+    """
+    stream = bytearray()
+    for i in range(int(duration * rate)):
+        t = i / rate
+        itow = 300000000 + int(round(t * 1000))
+        north, east = velocity[0] * t, velocity[1] * t
+        lat = start_lat + north / _meters_per_degree
+        lon = start_lon + east / (_meters_per_degree * math.cos(math.radians(lat)))
+        fix_type = 3 if t >= no_fix_time else 0
+        if pvt:
+            stream += nav_pvt(itow, lat, lon, height, velocity[0], velocity[1], fix_type=fix_type)
+        else:
+            # Ordered by message id like the receiver sends them
+            stream += nav_posllh(itow, lat, lon, height) + nav_status(itow, fix_type) + \
+                nav_velned(itow, velocity[0], velocity[1])
+    return bytes(stream)
+
+
+if __name__ == "__main__":
+    import sys
+
+    import numpy as np
+
+    from sensors import gps
+
+    streams = [ByteStreamSerial.from_file(sys.argv[1])] if len(sys.argv) > 1 else \
+        [ByteStreamSerial(generate_stream()), ByteStreamSerial(generate_stream(pvt=True, rate=10))]
+    for port in streams:
+        gps.init(serial_port=port)
+        wall_start = time.perf_counter()
+        while not port.at_end():
+            time.sleep(0.01)
+        wall_time = time.perf_counter() - wall_start
+        gps.finish()
+        lat, lon, speed, track = gps.get_values()
+        print("Stream of %d bytes read in %.2f s, %d checksum errors" % (port.get_size(), wall_time,
+                                                                         gps.get_checksum_errors()))
+        print("Last fix: lat %.7f, lon %.7f, speed %.2f m/s, track %.1f degree, fix quality %s" % (
+            np.degrees(lat), np.degrees(lon), speed, np.degrees(track), gps.get_fix_quality()))
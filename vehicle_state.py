@@ -0,0 +1,64 @@
+import threading
+from collections import namedtuple
+
+
+class VehicleState(namedtuple("VehicleState", ("time", "last_time", "height", "climb_rate", "heading", "speed",
+                                               "track", "latitude", "longitude", "east", "north", "distance",
+                                               "height_time", "heading_time", "gps_time"),
+                              defaults=(0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, None, None, None))):
+    """
+    Immutable snapshot of the estimated state of the copter, see the getter functions of copter for the units. The
+    times are relative to the start (copter.init()), the *_time attributes are None if the sensor values were never
+    acquired.
+    """
+    __slots__ = ()
+
+
+class StateBuffer(object):
+    """
+    Holds the published VehicleState. An update builds a new state from the published one and publishes it with a
+    single reference assignment, so readers always get a consistent snapshot without locking, and a snapshot never
+    changes, however long it is kept. Writers (e.g. the refresh functions on different threads) are serialized by a
+    lock.
+    """
+
+    def __init__(self):
+        self._state = VehicleState()
+        self._write_lock = threading.Lock()
+
+    def get(self):
+        """
+        :return: The latest published state
+        :rtype: VehicleState
+        """
+        return self._state
+
+    def update(self, **values):
+        """
+        Publishes a new state with the given values and the other values of the published state.
+        :param values: Attributes of VehicleState and their new values
+        :return: None
+        """
+        self._write_lock.acquire()
+        self._state = self._state._replace(**values)
+        self._write_lock.release()
+
+    def update_time(self, time, **values):
+        """
+        Like update(), and the time of the published state becomes last_time of the new one.
+        :param time: The new time
+        :param values: Further attributes of VehicleState and their new values
+        :return: None
+        """
+        self._write_lock.acquire()
+        self._state = self._state._replace(time=time, last_time=self._state.time, **values)
+        self._write_lock.release()
+
+    def reset(self):
+        """
+        Publishes a state with the initial values.
+        :return: None
+        """
+        self._write_lock.acquire()
+        self._state = VehicleState()
+        self._write_lock.release()